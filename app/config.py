@@ -20,6 +20,13 @@ class AppConfig:
     HOST: str = os.getenv("HOST", "0.0.0.0")
     PORT: int = int(os.getenv("PORT", "8000"))
     RELOAD: bool = os.getenv("RELOAD", "True").lower() == "true"
+    # 启动后在后台预热嵌入模型与LLM客户端（完成前 /api/ready 返回503）；关闭时在首次查询时加载
+    WARMUP_ON_STARTUP: bool = os.getenv("WARMUP_ON_STARTUP", "True").lower() == "true"
+    
+    # 日志配置：JSON格式化与写出在后台线程中进行
+    LOG_SAMPLE_RATE: float = float(os.getenv("LOG_SAMPLE_RATE", "1.0"))  # 按请求采样比例，WARNING及以上始终保留
+    LOG_QUEUE_SIZE: int = int(os.getenv("LOG_QUEUE_SIZE", "10000"))  # 日志队列容量，满时丢弃新记录
+    LOG_BATCH_SIZE: int = int(os.getenv("LOG_BATCH_SIZE", "64"))  # 单次写入合并的最大日志条数
     
     # API配置
     API_PREFIX: str = "/api"
@@ -32,14 +39,130 @@ class AppConfig:
     DEEPSEEK_API_KEY: Optional[str] = os.getenv("DEEPSEEK_API_KEY")
     DEEPSEEK_API_BASE: str = os.getenv("DEEPSEEK_API_BASE", "https://api.deepseek.com")
     DEEPSEEK_MODEL: str = os.getenv("DEEPSEEK_MODEL", "deepseek-chat")
+    LLM_MAX_CONNECTIONS: int = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))  # HTTP连接池大小
+    LLM_TIMEOUT: float = float(os.getenv("LLM_TIMEOUT", "60"))  # 单次请求超时（秒）
+    LLM_CONNECT_TIMEOUT: float = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))  # 建立连接超时（秒）
+    LLM_KEEPALIVE_EXPIRY: float = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "30"))  # 空闲长连接保持时间（秒）
+    LLM_DEADLINE: float = float(os.getenv("LLM_DEADLINE", "90"))  # 单次调用截止时间（秒，含重试与限流等待）
+    LLM_MAX_RETRIES: int = int(os.getenv("LLM_MAX_RETRIES", "3"))  # 429/5xx/超时/连接错误的重试次数
+    LLM_RETRY_BASE_DELAY: float = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))  # 指数退避基数（秒，带随机抖动）
+    LLM_RETRY_MAX_DELAY: float = float(os.getenv("LLM_RETRY_MAX_DELAY", "8"))
+    LLM_CIRCUIT_FAILURES: int = int(os.getenv("LLM_CIRCUIT_FAILURES", "5"))  # 连续失败多少次后熔断
+    LLM_CIRCUIT_RESET: float = float(os.getenv("LLM_CIRCUIT_RESET", "30"))  # 熔断后多少秒放行探测请求
+    LLM_HEDGE_AFTER: float = float(os.getenv("LLM_HEDGE_AFTER", "0"))  # 非流式请求超过该秒数未返回时发出对冲请求，0关闭
+    LLM_TOKENS_PER_MINUTE: int = int(os.getenv("LLM_TOKENS_PER_MINUTE", "0"))  # 客户端每分钟token数上限，0不限流
+    
+    # 查询并发配置
+    QUERY_THREADS: int = int(os.getenv("QUERY_THREADS", "4"))  # 查询嵌入与向量检索的线程池大小
+    MAX_CONCURRENT_QUERIES: int = int(os.getenv("MAX_CONCURRENT_QUERIES", "32"))  # 同时处理的查询数上限
+    # 请求合并：问题（归一化后）、查询参数与索引版本相同的并发请求共享一次检索与LLM调用
+    QUERY_COALESCING: bool = os.getenv("QUERY_COALESCING", "True").lower() == "true"
+    QUERY_NEIGHBOR_WINDOW: int = int(os.getenv("QUERY_NEIGHBOR_WINDOW", "1"))  # 命中分块前后各补充的相邻分块数
+    # 交叉编码器重排序（可按请求开关）：先检索 RERANK_CANDIDATES 个候选，打分后保留 top_k 个
+    RERANK_ENABLED: bool = os.getenv("RERANK_ENABLED", "False").lower() == "true"
+    RERANK_MODEL: str = os.getenv("RERANK_MODEL", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")
+    RERANK_BACKEND: str = os.getenv("RERANK_BACKEND", "torch").lower()  # torch / onnx（需安装 optimum[onnxruntime]）
+    RERANK_QUANTIZE: bool = os.getenv("RERANK_QUANTIZE", "True").lower() == "true"  # int8动态量化
+    RERANK_CANDIDATES: int = int(os.getenv("RERANK_CANDIDATES", "50"))
+    RERANK_MAX_LENGTH: int = int(os.getenv("RERANK_MAX_LENGTH", "384"))
+    RERANK_BATCH_SIZE: int = int(os.getenv("RERANK_BATCH_SIZE", "64"))
+    RERANK_THREADS: int = int(os.getenv("RERANK_THREADS", str(min(os.cpu_count() or 1, 4))))
+    ONNX_CACHE_DIR: str = os.path.join(BASE_DIR, "data", "onnx")  # ONNX模型导出缓存
+    
+    # 上下文打包：检索结果按token预算装入提示词，近似重复分块丢弃，超出预算的分块在句子边界截断
+    CONTEXT_TOKEN_BUDGET: int = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+    # 本地分词器目录（默认 data/tokenizers/deepseek-v3，DeepSeek自己的分词器，由 python -m app.fetch_tokenizer 下载）、
+    # HuggingFace分词器名称（含 "/"，如 deepseek-ai/DeepSeek-V3，首次使用需要下载）、tiktoken 编码名
+    # 或 approx（离线可用的近似计量，中文每字计1个token）；预热时加载，加载失败时使用 approx
+    CONTEXT_TOKENIZER: str = os.getenv(
+        "CONTEXT_TOKENIZER", os.path.join(BASE_DIR, "data", "tokenizers", "deepseek-v3")
+    )
+    # python -m app.fetch_tokenizer 下载分词器文件的HuggingFace仓库
+    CONTEXT_TOKENIZER_REPO: str = os.getenv("CONTEXT_TOKENIZER_REPO", "deepseek-ai/DeepSeek-V3")
+    CONTEXT_DEDUP_DISTANCE: int = int(os.getenv("CONTEXT_DEDUP_DISTANCE", "3"))  # SimHash汉明距离，-1关闭
+    CONTEXT_MIN_CHUNK_TOKENS: int = int(os.getenv("CONTEXT_MIN_CHUNK_TOKENS", "32"))  # 截断后过短的分块不放入
+    # 响应合成模式（LlamaIndex ResponseMode）：compact（默认）/ refine / tree_summarize / simple_summarize 等
+    QUERY_RESPONSE_MODE: str = os.getenv("QUERY_RESPONSE_MODE", "compact").lower()
+    
+    # 混合检索配置：BM25稀疏检索与向量检索的结果用RRF融合
+    HYBRID_SEARCH: bool = os.getenv("HYBRID_SEARCH", "True").lower() == "true"
+    BM25_TOKENIZER: str = os.getenv("BM25_TOKENIZER", "bigram").lower()  # bigram / jieba（需安装jieba）
+    BM25_K1: float = float(os.getenv("BM25_K1", "1.2"))
+    BM25_B: float = float(os.getenv("BM25_B", "0.75"))
+    HYBRID_CANDIDATES: int = int(os.getenv("HYBRID_CANDIDATES", "20"))  # 每一路参与融合的候选数
+    RRF_K: int = int(os.getenv("RRF_K", "60"))
+    
+    # 问答缓存配置：精确缓存 + 语义缓存（查询嵌入余弦相似度不低于阈值时复用回答），上传文档后自动失效
+    ANSWER_CACHE_ENABLED: bool = os.getenv("ANSWER_CACHE_ENABLED", "True").lower() == "true"
+    ANSWER_CACHE_MAX_ENTRIES: int = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+    ANSWER_CACHE_TTL: float = float(os.getenv("ANSWER_CACHE_TTL", "3600"))  # 条目有效期（秒）
+    ANSWER_CACHE_SEMANTIC: bool = os.getenv("ANSWER_CACHE_SEMANTIC", "True").lower() == "true"
+    ANSWER_CACHE_SIMILARITY: float = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
     
     # 向量数据库配置
     VECTOR_STORE_PATH: str = os.path.join(BASE_DIR, "data", "vector_db")
     
+    # FAISS索引配置
+    # FAISS_INDEX_TYPE: auto（默认，Flat -> IVF）/ flat / ivf / hnsw
+    FAISS_INDEX_TYPE: str = os.getenv("FAISS_INDEX_TYPE", "auto").lower()
+    FAISS_ANN_THRESHOLD: int = int(os.getenv("FAISS_ANN_THRESHOLD", "50000"))  # 超过该向量数切换到近似索引
+    FAISS_IVF_NPROBE: int = int(os.getenv("FAISS_IVF_NPROBE", "16"))
+    FAISS_HNSW_M: int = int(os.getenv("FAISS_HNSW_M", "32"))
+    FAISS_HNSW_EF_SEARCH: int = int(os.getenv("FAISS_HNSW_EF_SEARCH", "64"))
+    FAISS_MMAP: bool = os.getenv("FAISS_MMAP", "True").lower() == "true"
+    # 追加式向量段的后台压缩阈值：段数量、已删除向量占比
+    VECTOR_COMPACT_SEGMENTS: int = int(os.getenv("VECTOR_COMPACT_SEGMENTS", "8"))
+    VECTOR_COMPACT_TOMBSTONE_RATIO: float = float(os.getenv("VECTOR_COMPACT_TOMBSTONE_RATIO", "0.2"))
+    
+    # 嵌入模型配置
+    EMBED_MODEL_NAME: str = os.getenv("EMBED_MODEL_NAME", "sentence-transformers/all-MiniLM-L6-v2")
+    EMBED_DIM: int = int(os.getenv("EMBED_DIM", "384"))
+    EMBED_BATCH_SIZE: int = int(os.getenv("EMBED_BATCH_SIZE", "100"))
+    # 嵌入后端：torch（默认，HuggingFaceEmbedding）/ onnx（ONNX Runtime，需安装 optimum[onnxruntime]）
+    EMBED_BACKEND: str = os.getenv("EMBED_BACKEND", "torch").lower()
+    EMBED_QUANTIZE: bool = os.getenv("EMBED_QUANTIZE", "True").lower() == "true"  # onnx 后端int8动态量化
+    EMBED_THREADS: int = int(os.getenv("EMBED_THREADS", str(os.cpu_count() or 1)))  # onnx 后端算子内线程数
+    EMBED_MAX_LENGTH: int = int(os.getenv("EMBED_MAX_LENGTH", "256"))  # 与 sentence-transformers 的 max_seq_length 一致
+    
+    # 嵌入缓存配置：按（模型, 分块文本哈希）缓存float16向量，超出容量后LRU淘汰
+    EMBED_CACHE_ENABLED: bool = os.getenv("EMBED_CACHE_ENABLED", "True").lower() == "true"
+    EMBED_CACHE_DIR: str = os.path.join(BASE_DIR, "data", "embed_cache")
+    EMBED_CACHE_MAX_ENTRIES: int = int(os.getenv("EMBED_CACHE_MAX_ENTRIES", "200000"))
+    
     # PDF 分块参数
+    # CHUNKER: cjk（默认，按嵌入模型token计量、在中文标点处切分）/ sentence（LlamaIndex SentenceSplitter）
+    CHUNKER: str = os.getenv("CHUNKER", "cjk").lower()
+    CHUNK_MAX_TOKENS: int = int(os.getenv("CHUNK_MAX_TOKENS", "256"))  # 嵌入模型最大输入长度（含特殊token）
+    CHUNK_OVERLAP_TOKENS: int = int(os.getenv("CHUNK_OVERLAP_TOKENS", "32"))
+    # sentence 分块器的参数
     CHUNK_SIZE: int = 1000
     CHUNK_OVERLAP: int = 100
     
+    # PDF 文本提取配置
+    # PDF_BACKEND: pypdf2（默认）/ pypdfium2 / pdfminer，后两者需要额外安装
+    PDF_BACKEND: str = os.getenv("PDF_BACKEND", "pypdf2").lower()
+    PDF_WORKERS: int = int(os.getenv("PDF_WORKERS", str(min(os.cpu_count() or 1, 4))))  # 并行提取的进程数
+    PDF_PARALLEL_MIN_PAGES: int = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "64"))  # 页数达到该值才使用进程池
+    PDF_PAGES_PER_TASK: int = int(os.getenv("PDF_PAGES_PER_TASK", "16"))
+    PDF_CHUNK_WINDOW_PAGES: int = int(os.getenv("PDF_CHUNK_WINDOW_PAGES", "8"))  # 分块器每次处理的页数
+    INGEST_BATCH_CHUNKS: int = int(os.getenv("INGEST_BATCH_CHUNKS", "256"))  # 导入时每批嵌入并暂存的分块数
+    
+    # 后台导入任务配置：SQLite持久化队列，工作线程数即同时执行的导入任务数
+    JOB_WORKERS: int = int(os.getenv("JOB_WORKERS", "2"))
+    JOB_DB_PATH: str = os.path.join(BASE_DIR, "data", "jobs.sqlite3")
+    JOB_UPLOAD_DIR: str = os.path.join(BASE_DIR, "data", "uploads")
+    JOB_MAX_ATTEMPTS: int = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))  # 任务被中断（如进程崩溃）的重试上限
+
+    # 批量重建索引配置（python -m app.reindex）：多进程嵌入工作池
+    REINDEX_WORKERS: int = int(os.getenv("REINDEX_WORKERS", str(max((os.cpu_count() or 1) // 4, 1))))
+    REINDEX_THREADS_PER_WORKER: int = int(os.getenv("REINDEX_THREADS_PER_WORKER", "0"))  # 0 表示 CPU核数 / 进程数
+    REINDEX_BATCH_SIZE: int = int(os.getenv("REINDEX_BATCH_SIZE", "64"))  # 每个进程池任务嵌入的分块数
+    REINDEX_INFLIGHT_BATCHES: int = int(os.getenv("REINDEX_INFLIGHT_BATCHES", "8"))  # 同时在嵌入的分块批数（每批 INGEST_BATCH_CHUNKS 个）
+
+    # 去重配置：写入时折叠SimHash汉明距离不超过阈值的近似重复分块（阈值不超过3）
+    DEDUP_NEAR_DUPLICATES: bool = os.getenv("DEDUP_NEAR_DUPLICATES", "False").lower() == "true"
+    DEDUP_SIMHASH_DISTANCE: int = min(int(os.getenv("DEDUP_SIMHASH_DISTANCE", "3")), 3)
+    
     @classmethod
     def validate(cls) -> None:
         """验证配置的有效性"""
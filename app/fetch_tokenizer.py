@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+"""
+下载上下文计量使用的分词器文件
+
+从 HuggingFace Hub 下载 CONTEXT_TOKENIZER_REPO（默认 deepseek-ai/DeepSeek-V3）的分词器文件
+（tokenizer.json / tokenizer_config.json，不含模型权重）到 CONTEXT_TOKENIZER 目录，
+之后服务启动时从本地加载，不再访问网络；目录不存在时上下文长度使用近似计量（见 app/services/context_builder.py）。
+
+用法:
+    python -m app.fetch_tokenizer [--repo deepseek-ai/DeepSeek-V3] [--dest data/tokenizers/deepseek-v3]
+"""
+import argparse
+
+from app.config import config
+
+TOKENIZER_FILES = ["tokenizer.json", "tokenizer_config.json"]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repo", default=config.CONTEXT_TOKENIZER_REPO, help="HuggingFace仓库")
+    parser.add_argument("--dest", default=config.CONTEXT_TOKENIZER, help="保存分词器文件的本地目录")
+    args = parser.parse_args()
+
+    from huggingface_hub import snapshot_download
+
+    path = snapshot_download(repo_id=args.repo, allow_patterns=TOKENIZER_FILES, local_dir=args.dest)
+    print(f"已下载 {args.repo} 的分词器文件到 {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,24 +4,48 @@
 # =========================
 
 import logging
-from typing import Any
-from openai import OpenAI
+from typing import Any, Dict, List, Optional
+
+from llama_index.core.base.llms.types import CompletionResponseAsyncGen, CompletionResponseGen
 from llama_index.core.llms import CustomLLM, CompletionResponse, LLMMetadata
 from llama_index.core.llms.callbacks import llm_completion_callback
 
+from app.llm.resilient_client import ResilientLLMClient
+
 logger = logging.getLogger(__name__)
 
+SYSTEM_PROMPT = "你是一个专业、可靠的 AI 助手。"
+
+
 class DeepSeekLLM(CustomLLM):
-    """DeepSeek Chat LLM (LlamaIndex CustomLLM 适配)"""
+    """
+    DeepSeek Chat LLM (LlamaIndex CustomLLM 适配)
+
+    请求经过 ResilientLLMClient（连接池、截止时间、重试、熔断、对冲与token限流）；
+    调用失败时抛出 app.llm.errors.LLMError，由调用方决定回退方式
+    """
 
-    def __init__(self, api_key: str, base_url: str, model: str):
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str,
+        model: str,
+        max_connections: int = 20,
+        timeout: float = 60.0,
+        client: Optional[ResilientLLMClient] = None,
+    ):
         # ⚠️ 必须最先调用
         super().__init__()
 
         self._api_key = api_key
         self._base_url = base_url
         self._model = model
-        self._client = OpenAI(api_key=api_key, base_url=base_url)
+        self._client = client or ResilientLLMClient(
+            api_key=api_key,
+            base_url=base_url,
+            max_connections=max_connections,
+            timeout=timeout,
+        )
 
     @property
     def metadata(self) -> LLMMetadata:
@@ -31,32 +55,63 @@ class DeepSeekLLM(CustomLLM):
             num_output=4096,
         )
 
+    def _request_kwargs(self, prompt: str) -> Dict[str, Any]:
+        messages: List[Dict[str, str]] = [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt},
+        ]
+        return {"model": self._model, "messages": messages, "temperature": 0.3}
+
     @llm_completion_callback()
     def complete(self, prompt: str, **kwargs: Any) -> CompletionResponse:
         """非流式生成（QueryEngine 实际调用的方法）"""
-        try:
-            logger.info("DeepSeek API调用 - 提示词长度: %d", len(prompt))
-            logger.debug("DeepSeek API调用 - 提示词前200字符: %s", prompt[:200] + "...")
-            
-            resp = self._client.chat.completions.create(
-                model=self._model,
-                messages=[
-                    {"role": "system", "content": "你是一个专业、可靠的 AI 助手。"},
-                    {"role": "user", "content": prompt},
-                ],
-                temperature=0.3,
-            )
-
-            text = resp.choices[0].message.content
-            logger.info("DeepSeek API响应成功 - 响应长度: %d", len(text))
-            logger.debug("DeepSeek API响应成功 - 响应前200字符: %s", text[:200] + "...")
-            return CompletionResponse(text=text)
-        except Exception as e:
-            logger.error("DeepSeek API调用失败: %s", str(e))
-            return CompletionResponse(text=f"DeepSeek API调用失败: {str(e)}")
+        logger.info("DeepSeek API调用 - 提示词长度: %d", len(prompt))
+        logger.debug("DeepSeek API调用 - 提示词前200字符: %s", prompt[:200] + "...")
+
+        resp = self._client.complete(self._request_kwargs(prompt))
+
+        text = resp.choices[0].message.content or ""
+        logger.info("DeepSeek API响应成功 - 响应长度: %d", len(text))
+        logger.debug("DeepSeek API响应成功 - 响应前200字符: %s", text[:200] + "...")
+        return CompletionResponse(text=text)
 
     @llm_completion_callback()
-    def stream_complete(self, prompt: str, **kwargs: Any):
-        """简化处理：先不真正做流式"""
-        response = self.complete(prompt, **kwargs)
-        yield response
+    async def acomplete(self, prompt: str, **kwargs: Any) -> CompletionResponse:
+        """异步非流式生成：基于AsyncOpenAI，等待响应期间不阻塞事件循环"""
+        logger.info("DeepSeek API异步调用 - 提示词长度: %d", len(prompt))
+        logger.debug("DeepSeek API异步调用 - 提示词前200字符: %s", prompt[:200] + "...")
+
+        resp = await self._client.acomplete(self._request_kwargs(prompt))
+
+        text = resp.choices[0].message.content or ""
+        logger.info("DeepSeek API响应成功 - 响应长度: %d", len(text))
+        logger.debug("DeepSeek API响应成功 - 响应前200字符: %s", text[:200] + "...")
+        return CompletionResponse(text=text)
+
+    @llm_completion_callback()
+    def stream_complete(self, prompt: str, **kwargs: Any) -> CompletionResponseGen:
+        """流式生成：stream=True 调用DeepSeek，逐个增量返回"""
+        logger.info("DeepSeek API流式调用 - 提示词长度: %d", len(prompt))
+
+        def gen() -> CompletionResponseGen:
+            text = ""
+            for delta in self._client.stream(self._request_kwargs(prompt)):
+                text += delta
+                yield CompletionResponse(text=text, delta=delta)
+            logger.info("DeepSeek API流式响应完成 - 响应长度: %d", len(text))
+
+        return gen()
+
+    @llm_completion_callback()
+    async def astream_complete(self, prompt: str, **kwargs: Any) -> CompletionResponseAsyncGen:
+        """异步流式生成：基于AsyncOpenAI，逐个增量返回"""
+        logger.info("DeepSeek API异步流式调用 - 提示词长度: %d", len(prompt))
+
+        async def gen() -> CompletionResponseAsyncGen:
+            text = ""
+            async for delta in self._client.astream(self._request_kwargs(prompt)):
+                text += delta
+                yield CompletionResponse(text=text, delta=delta)
+            logger.info("DeepSeek API流式响应完成 - 响应长度: %d", len(text))
+
+        return gen()
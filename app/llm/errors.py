@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+"""
+LLM调用错误类型
+
+LLM客户端（见 resilient_client.py）在重试耗尽、超过截止时间或熔断时抛出以下异常，
+调用方按类型回退（如返回检索到的文档摘要），不再匹配错误字符串。
+本模块不导入 openai，可在应用导入阶段直接使用。
+"""
+
+
+class LLMError(Exception):
+    """LLM调用失败（不可重试的错误，或重试耗尽）"""
+
+
+class LLMTimeoutError(LLMError):
+    """超过单次调用的截止时间（含重试）"""
+
+
+class LLMRateLimitError(LLMError):
+    """上游返回429，或客户端token限流的等待超过截止时间"""
+
+
+class LLMUnavailableError(LLMError):
+    """上游返回5xx或连接失败，重试耗尽"""
+
+
+class CircuitOpenError(LLMError):
+    """熔断器打开，请求未发出"""
@@ -0,0 +1,493 @@
+# -*- coding: utf-8 -*-
+"""
+LLM客户端容错层
+
+包装 OpenAI 兼容的 Chat Completions 接口（DeepSeek），DeepSeekLLM 的全部请求都经过这里：
+- 连接池与长连接：同步与异步各一个 httpx 客户端，空闲连接保持 keepalive_expiry 秒
+- 截止时间：每次调用（含重试与等待）不超过 deadline 秒，每次尝试的超时取 timeout 与剩余时间的较小值
+- 重试：429、5xx、超时与连接错误按带抖动的指数退避重试（full jitter），429 优先使用 Retry-After
+- 熔断器：连续失败达到阈值后打开，冷却期内直接失败，冷却结束后放行一个探测请求
+- 对冲请求（仅异步非流式）：首个请求超过 hedge_after 秒未返回时再发一个相同请求，先成功的生效
+- 客户端token限流（每分钟token数）：按提示词估算预占额度，响应后按实际用量校正
+
+失败时抛出 app.llm.errors 中的异常类型，不再把错误信息当作回答返回。
+流式请求只在收到第一个响应块之前重试，之后的错误直接抛出。
+"""
+import asyncio
+import logging
+import random
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Tuple, Type
+
+import httpx
+import openai
+from openai import AsyncOpenAI, OpenAI
+
+from app.llm.errors import CircuitOpenError, LLMError, LLMRateLimitError, LLMTimeoutError, LLMUnavailableError
+from app.services import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_tokens(text: str) -> int:
+    """按DeepSeek的经验值估算token数：英文字符约0.3个token，中文字符约0.6个token"""
+    chars = len(text)
+    # 中文字符的UTF-8编码为3字节，比ASCII字符多2字节
+    non_ascii = (len(text.encode("utf-8")) - chars) // 2
+    return int((chars - non_ascii) * 0.3 + non_ascii * 0.6) + 1
+
+
+def estimate_request_tokens(request: Dict[str, Any]) -> int:
+    return sum(estimate_tokens(message.get("content") or "") for message in request.get("messages", []))
+
+
+def _classify(exc: BaseException) -> Tuple[Optional[str], Type[LLMError]]:
+    """返回 (可重试的原因, 重试耗尽时抛出的错误类型)，原因为None表示不可重试"""
+    if isinstance(exc, (openai.APITimeoutError, httpx.TimeoutException)):
+        return "timeout", LLMTimeoutError
+    if isinstance(exc, (openai.APIConnectionError, httpx.TransportError)):
+        return "connection", LLMUnavailableError
+    if isinstance(exc, openai.RateLimitError):
+        return "rate_limit", LLMRateLimitError
+    if isinstance(exc, openai.APIStatusError) and exc.status_code >= 500:
+        return "server_error", LLMUnavailableError
+    return None, LLMError
+
+
+def _retry_after(exc: BaseException) -> Optional[float]:
+    """429/503 响应的 Retry-After（秒），没有或不是数字时返回None"""
+    response = getattr(exc, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return max(float(value), 0.0) if value is not None else None
+    except ValueError:
+        return None
+
+
+class CircuitBreaker:
+    """
+    熔断器
+
+    关闭：请求正常发出，连续失败 failure_threshold 次后打开；
+    打开：reset_timeout 秒内请求直接失败；冷却结束后进入半开，只放行一个探测请求，
+    探测成功则关闭，失败则重新打开。同步与异步调用共用，线程安全。
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "open" if time.monotonic() - self.opened_at < self.reset_timeout else "half_open"
+
+    def allow(self) -> Optional[str]:
+        """
+        是否放行请求：关闭状态返回 "closed"，半开状态下只放行一个探测请求并返回 "probe"，拒绝时返回None
+
+        返回值在请求被取消时传给 release，只有取得探测名额的请求才会释放探测名额
+        """
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            if time.monotonic() - self.opened_at < self.reset_timeout or self._probing:
+                return None
+            self._probing = True
+            return "probe"
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.opened_at is not None:
+                logger.info("LLM熔断器关闭")
+                metrics.LLM_CIRCUIT_OPEN.set(0)
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            reopen = self._probing
+            self._probing = False
+            if reopen or (self.opened_at is None and self.failures >= self.failure_threshold):
+                self.opened_at = time.monotonic()
+                metrics.LLM_CIRCUIT_OPEN.set(1)
+                logger.warning(
+                    "LLM熔断器打开：连续失败 %d 次，%.0f秒后放行探测请求", self.failures, self.reset_timeout
+                )
+
+    def release(self, admission: Optional[str]) -> None:
+        """请求被取消（没有结果）时调用：admission 为该请求 allow() 的返回值，是探测请求时释放探测名额"""
+        if admission != "probe":
+            return
+        with self._lock:
+            self._probing = False
+
+
+class TokenRateLimiter:
+    """
+    每分钟token数限流（令牌桶，容量为一分钟的额度）
+
+    reserve 立即扣减额度并返回需要等待的秒数（额度可以为负），按预占顺序排队，
+    同步与异步调用共用同一个桶；响应后用 refund 按实际用量校正。
+    """
+
+    def __init__(self, tokens_per_minute: int):
+        self.capacity = float(tokens_per_minute)
+        self.rate = tokens_per_minute / 60.0
+        self.available = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, tokens: int) -> float:
+        with self._lock:
+            self._refill()
+            # 单个请求超过一分钟额度时按一分钟额度计，避免永远等待
+            self.available -= min(tokens, self.capacity)
+            return max(-self.available, 0.0) / self.rate
+
+    def try_reserve(self, tokens: int) -> bool:
+        """额度足够时扣减并返回True，不等待"""
+        with self._lock:
+            self._refill()
+            if self.available < tokens:
+                return False
+            self.available -= tokens
+            return True
+
+    def refund(self, tokens: float) -> None:
+        """退回额度（负数表示补扣实际多用的token）"""
+        with self._lock:
+            self._refill()
+            self.available = min(self.capacity, self.available + tokens)
+
+
+class ResilientLLMClient:
+    """OpenAI 兼容接口的容错客户端，见模块说明"""
+
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str,
+        max_connections: int = 20,
+        timeout: float = 60.0,
+        connect_timeout: float = 5.0,
+        keepalive_expiry: float = 30.0,
+        deadline: float = 90.0,
+        max_retries: int = 3,
+        retry_base_delay: float = 0.5,
+        retry_max_delay: float = 8.0,
+        circuit_failures: int = 5,
+        circuit_reset: float = 30.0,
+        hedge_after: float = 0.0,
+        tokens_per_minute: int = 0,
+    ):
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.hedge_after = hedge_after
+        self.breaker = CircuitBreaker(circuit_failures, circuit_reset)
+        self.limiter = TokenRateLimiter(tokens_per_minute) if tokens_per_minute > 0 else None
+
+        # 同步与异步客户端各自维护一个长连接池，复用TCP/TLS连接；重试由本层控制，关闭SDK自带的重试
+        limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        http_timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self._client = OpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            max_retries=0,
+            http_client=httpx.Client(limits=limits, timeout=http_timeout),
+        )
+        self._async_client = AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            max_retries=0,
+            http_client=httpx.AsyncClient(limits=limits, timeout=http_timeout),
+        )
+
+    # ---------- 公共逻辑 ----------
+
+    def _attempt_timeout(self, deadline_at: float) -> httpx.Timeout:
+        remaining = max(deadline_at - time.monotonic(), 0.001)
+        timeout = min(self.timeout, remaining)
+        return httpx.Timeout(timeout, connect=min(self.connect_timeout, timeout))
+
+    def _reserve_tokens(self, tokens: int, deadline_at: float) -> float:
+        """预占token额度，返回需要等待的秒数；等待会超过截止时间时直接失败"""
+        if self.limiter is None:
+            return 0.0
+        wait = self.limiter.reserve(tokens)
+        if wait > deadline_at - time.monotonic():
+            self.limiter.refund(tokens)
+            metrics.LLM_ERRORS.labels(error=LLMRateLimitError.__name__).inc()
+            raise LLMRateLimitError(f"客户端token限流需等待 {wait:.1f} 秒，超过截止时间")
+        metrics.LLM_RATE_LIMIT_WAIT_SECONDS.observe(wait)
+        return wait
+
+    def _settle_tokens(self, tokens: int, usage: Any) -> None:
+        """按实际用量校正预占的额度"""
+        if self.limiter is not None and usage is not None:
+            self.limiter.refund(tokens - usage.total_tokens)
+
+    def _fail(self, error: LLMError, tokens: int) -> LLMError:
+        """最终失败：退回预占的额度并计数，返回要抛出的异常"""
+        if self.limiter is not None:
+            self.limiter.refund(tokens)
+        metrics.LLM_ERRORS.labels(error=type(error).__name__).inc()
+        logger.error("LLM调用失败: %s", error)
+        return error
+
+    def _before_attempt(self, deadline_at: float, tokens: int) -> str:
+        """检查截止时间与熔断器，返回熔断器的放行结果（见 CircuitBreaker.allow）"""
+        if time.monotonic() >= deadline_at:
+            raise self._fail(LLMTimeoutError(f"LLM调用超过截止时间 {self.deadline:.0f} 秒"), tokens)
+        admission = self.breaker.allow()
+        if admission is None:
+            raise self._fail(CircuitOpenError("LLM熔断器打开，请求未发出"), tokens)
+        return admission
+
+    def _cancelled(self, admission: Optional[str], tokens: int) -> None:
+        """异步调用在得到结果之前被取消：释放本次尝试占用的探测名额，退回预占的额度"""
+        self.breaker.release(admission)
+        if self.limiter is not None:
+            self.limiter.refund(tokens)
+
+    def _retry_delay(self, exc: BaseException, attempt: int) -> float:
+        retry_after = _retry_after(exc)
+        if retry_after is not None:
+            return retry_after
+        return random.uniform(0, min(self.retry_max_delay, self.retry_base_delay * 2 ** attempt))
+
+    def _after_failure(self, exc: BaseException, attempt: int, deadline_at: float, tokens: int) -> float:
+        """记录失败的尝试，返回重试前的等待秒数；不再重试时抛出对应的错误类型（须在 except 块中调用）"""
+        reason, error_type = _classify(exc)
+        if reason is None:
+            # 上游已正常响应（如400），不计入熔断
+            self.breaker.record_success()
+            raise self._fail(LLMError(f"LLM请求失败: {exc}"), tokens) from exc
+
+        self.breaker.record_failure()
+        delay = self._retry_delay(exc, attempt)
+        if attempt >= self.max_retries or time.monotonic() + delay >= deadline_at:
+            raise self._fail(error_type(f"LLM请求失败（共 {attempt + 1} 次尝试）: {exc}"), tokens) from exc
+        metrics.LLM_RETRIES.labels(reason=reason).inc()
+        logger.warning("LLM请求失败，%.2f秒后重试（第 %d 次）: %s", delay, attempt + 1, exc)
+        return delay
+
+    def _stream_error(self, exc: BaseException, tokens: int) -> LLMError:
+        """流式响应开始之后的错误：不重试"""
+        reason, error_type = _classify(exc)
+        if reason is not None:
+            self.breaker.record_failure()
+        return self._fail(error_type(f"LLM流式响应中断: {exc}"), tokens)
+
+    @staticmethod
+    def _stream_request(request: Dict[str, Any]) -> Dict[str, Any]:
+        # 最后一个响应块携带token用量，用于校正限流额度
+        return dict(request, stream=True, stream_options={"include_usage": True})
+
+    # ---------- 同步接口 ----------
+
+    def complete(self, request: Dict[str, Any]):
+        """非流式调用 chat.completions.create，返回 ChatCompletion"""
+        deadline_at = time.monotonic() + self.deadline
+        tokens = estimate_request_tokens(request)
+        wait = self._reserve_tokens(tokens, deadline_at)
+        if wait:
+            time.sleep(wait)
+
+        attempt = 0
+        while True:
+            self._before_attempt(deadline_at, tokens)
+            try:
+                resp = self._client.chat.completions.create(**request, timeout=self._attempt_timeout(deadline_at))
+            except Exception as e:
+                time.sleep(self._after_failure(e, attempt, deadline_at, tokens))
+                attempt += 1
+                continue
+            self.breaker.record_success()
+            self._settle_tokens(tokens, resp.usage)
+            return resp
+
+    def stream(self, request: Dict[str, Any]) -> Iterator[str]:
+        """流式调用，逐个返回文本增量"""
+        deadline_at = time.monotonic() + self.deadline
+        tokens = estimate_request_tokens(request)
+        wait = self._reserve_tokens(tokens, deadline_at)
+        if wait:
+            time.sleep(wait)
+
+        attempt = 0
+        while True:
+            self._before_attempt(deadline_at, tokens)
+            stream = None
+            try:
+                stream = self._client.chat.completions.create(
+                    **self._stream_request(request), timeout=self._attempt_timeout(deadline_at)
+                )
+                chunks = iter(stream)
+                first = next(chunks, None)
+            except Exception as e:
+                if stream is not None:
+                    stream.close()
+                time.sleep(self._after_failure(e, attempt, deadline_at, tokens))
+                attempt += 1
+                continue
+            break
+        self.breaker.record_success()
+
+        usage = None
+        try:
+            chunk = first
+            while chunk is not None:
+                usage = chunk.usage or usage
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    yield delta
+                chunk = next(chunks, None)
+        except Exception as e:
+            raise self._stream_error(e, tokens) from e
+        finally:
+            stream.close()
+        self._settle_tokens(tokens, usage)
+
+    def close(self) -> None:
+        self._client.close()
+
+    # ---------- 异步接口 ----------
+
+    async def _acreate(self, request: Dict[str, Any], deadline_at: float):
+        return await self._async_client.chat.completions.create(**request, timeout=self._attempt_timeout(deadline_at))
+
+    async def _acreate_hedged(self, request: Dict[str, Any], deadline_at: float, tokens: int):
+        """首个请求超过 hedge_after 秒未返回时再发一个相同请求，返回先成功的结果，取消另一个"""
+        first = asyncio.ensure_future(self._acreate(request, deadline_at))
+        pending = {first}
+        hedge_reserved = False
+        try:
+            done, _ = await asyncio.wait(pending, timeout=self.hedge_after)
+            # 熔断器不处于关闭状态（半开时的探测名额只属于首个请求）或限流额度不足时不对冲
+            if done or self.breaker.state != "closed" or (self.limiter is not None and not self.limiter.try_reserve(tokens)):
+                return await first
+            hedge_reserved = self.limiter is not None
+
+            metrics.LLM_HEDGED.inc()
+            logger.info("LLM请求超过 %.2f 秒未返回，发出对冲请求", self.hedge_after)
+            pending.add(asyncio.ensure_future(self._acreate(request, deadline_at)))
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+            # 两个请求只有一个的结果被使用，按实际用量校正的是首个请求预占的额度，对冲请求预占的额度退回
+            if hedge_reserved:
+                self.limiter.refund(tokens)
+
+    async def acomplete(self, request: Dict[str, Any]):
+        """异步非流式调用，返回 ChatCompletion；hedge_after > 0 时启用对冲请求"""
+        deadline_at = time.monotonic() + self.deadline
+        tokens = estimate_request_tokens(request)
+        wait = self._reserve_tokens(tokens, deadline_at)
+
+        attempt = 0
+        admission = None
+        try:
+            if wait:
+                await asyncio.sleep(wait)
+            while True:
+                admission = self._before_attempt(deadline_at, tokens)
+                try:
+                    if self.hedge_after > 0:
+                        resp = await self._acreate_hedged(request, deadline_at, tokens)
+                    else:
+                        resp = await self._acreate(request, deadline_at)
+                except Exception as e:
+                    # 失败已由 _after_failure 记入熔断器，重试等待期间不再占用探测名额
+                    admission = None
+                    await asyncio.sleep(self._after_failure(e, attempt, deadline_at, tokens))
+                    attempt += 1
+                    continue
+                break
+        except asyncio.CancelledError:
+            self._cancelled(admission, tokens)
+            raise
+        self.breaker.record_success()
+        self._settle_tokens(tokens, resp.usage)
+        return resp
+
+    async def astream(self, request: Dict[str, Any]) -> AsyncIterator[str]:
+        """异步流式调用，逐个返回文本增量"""
+        deadline_at = time.monotonic() + self.deadline
+        tokens = estimate_request_tokens(request)
+        wait = self._reserve_tokens(tokens, deadline_at)
+
+        attempt = 0
+        admission = None
+        stream = None
+        try:
+            if wait:
+                await asyncio.sleep(wait)
+            while True:
+                admission = self._before_attempt(deadline_at, tokens)
+                stream = None
+                try:
+                    stream = await self._acreate(self._stream_request(request), deadline_at)
+                    chunks = stream.__aiter__()
+                    first = await anext(chunks, None)
+                except Exception as e:
+                    if stream is not None:
+                        await stream.close()
+                    admission = None
+                    await asyncio.sleep(self._after_failure(e, attempt, deadline_at, tokens))
+                    attempt += 1
+                    continue
+                break
+        except asyncio.CancelledError:
+            if stream is not None:
+                await stream.close()
+            self._cancelled(admission, tokens)
+            raise
+        self.breaker.record_success()
+
+        usage = None
+        try:
+            chunk = first
+            while chunk is not None:
+                usage = chunk.usage or usage
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    yield delta
+                chunk = await anext(chunks, None)
+        except Exception as e:
+            raise self._stream_error(e, tokens) from e
+        finally:
+            await stream.close()
+        self._settle_tokens(tokens, usage)
+
+    async def aclose(self) -> None:
+        await self._async_client.close()
@@ -5,25 +5,53 @@
 该模块提供了一个自定义的JSON格式日志配置，用于FastAPI后端应用。
 主要功能包括：
 - JSON格式日志输出，便于日志收集和分析
-- 自定义日志字段和格式
+- 自定义日志字段和格式，固定字段（service、env）在创建格式化器时计算一次
 - 屏蔽默认UVicorn访问日志，推荐使用中间件自定义
 - 支持环境变量配置
+- 每条日志带有当前请求的 request_id（见 request_context），可按请求汇总各阶段耗时
+
+日志管道（setup_logging 是唯一的配置入口）：
+- 记录日志的线程只做过滤、采样与消息插值，然后把记录放入有界队列（QueueHandler），队列满时丢弃并计数，不阻塞请求
+- 后台 QueueListener 线程做JSON格式化，把队列中积压的记录合并成一次写入（BatchingStreamHandler）
+- 按请求采样（LOG_SAMPLE_RATE）：同一请求的日志整体保留或整体丢弃，WARNING及以上与无请求ID的日志始终保留
 """
+import atexit
+import copy
 import logging
+import logging.handlers
 import os
+import queue
+import sys
+import threading
+import zlib
+from typing import Optional, TextIO
+
 from pythonjsonlogger import jsonlogger
 
+from app.logger.request_context import RequestIdFilter
+
+LOG_FORMAT = "%(asctime)s %(name)s %(levelname)s %(message)s %(pathname)s %(funcName)s %(lineno)d"
+LOG_DATEFMT = "%Y-%m-%dT%H:%M:%SZ"  # ISO 8601时间格式
+
+# 由 setup_logging 配置的日志器；uvicorn.access 单独屏蔽
+APP_LOGGERS = ("uvicorn", "uvicorn.error", "app", "myapp")
+
 
 class CustomJsonFormatter(jsonlogger.JsonFormatter):
     """
     自定义JSON日志格式化器
-    
+
     扩展了pythonjsonlogger.JsonFormatter，添加了自定义字段和时间标准化
     """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # 全局固定字段只计算一次；环境信息从环境变量获取，默认使用"prod"
+        self.static_fields = {"service": "fastapi-backend", "env": os.getenv("ENVIRONMENT", "prod")}
+
     def add_fields(self, log_record, record, message_dict):
         """
         添加自定义字段到日志记录
-        
+
         参数:
             log_record: dict - 要输出的日志记录字典
             record: logging.LogRecord - 原始日志记录对象
@@ -31,85 +59,199 @@ class CustomJsonFormatter(jsonlogger.JsonFormatter):
         """
         # 调用父类方法，处理默认字段
         super().add_fields(log_record, record, message_dict)
-        
+
         # 添加全局固定字段
-        log_record["service"] = "fastapi-backend"
-        # 从环境变量获取环境信息，默认使用"prod"
-        log_record["env"] = os.getenv("ENVIRONMENT", "prod")
-        
+        log_record.update(self.static_fields)
+
         # 时间标准化（ISO 8601格式）
         if "asctime" in log_record:
             # 将默认的asctime字段重命名为timestamp
             log_record["timestamp"] = log_record.pop("asctime")
 
 
-def get_logging_config(debug: bool = False):
+class SamplingFilter(logging.Filter):
+    """
+    按请求采样日志
+
+    用请求ID的哈希决定是否保留，同一请求的日志整体保留或整体丢弃，采样后的日志仍能还原完整请求。
+    WARNING及以上级别与没有请求ID的日志（启动、后台维护等）始终保留。
+    需放在 RequestIdFilter 之后。
+    """
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.threshold = int(min(max(rate, 0.0), 1.0) * 0xFFFFFFFF)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        request_id = getattr(record, "request_id", None)
+        if request_id is None:
+            return True
+        return zlib.crc32(request_id.encode("utf-8")) <= self.threshold
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    非阻塞的队列日志处理器
+
+    在记录日志的线程中完成消息插值与异常格式化（参数与异常对象不跨线程保留），
+    JSON格式化交给 QueueListener 线程；队列满时丢弃记录并计数。
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _EXC_FORMATTER.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class BatchingStreamHandler(logging.StreamHandler):
+    """
+    批量写入的流处理器
+
+    emit 只格式化并缓存，缓存达到 batch_size 或日志队列已空时合并成一次写入，
+    日志突发时减少 write 系统调用。只在 QueueListener 线程中使用。
+    """
+
+    def __init__(self, stream: Optional[TextIO] = None, batch_size: int = 64):
+        super().__init__(stream)
+        self.batch_size = batch_size
+        self.buffer = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            self.buffer.append(self.format(record))
+        except Exception:
+            self.handleError(record)
+            return
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        with self.lock:
+            if self.buffer:
+                lines, self.buffer = self.buffer, []
+                self.stream.write(self.terminator.join(lines) + self.terminator)
+            if self.stream and hasattr(self.stream, "flush"):
+                self.stream.flush()
+
+
+class BatchingQueueListener(logging.handlers.QueueListener):
+    """处理完当前积压的记录（队列已空）后刷新批量写入的处理器"""
+
+    def handle(self, record: logging.LogRecord) -> None:
+        super().handle(record)
+        if self.queue.empty():
+            for handler in self.handlers:
+                handler.flush()
+
+
+_EXC_FORMATTER = logging.Formatter()
+_setup_lock = threading.Lock()
+_listener: Optional[BatchingQueueListener] = None
+_queue_handler: Optional[DroppingQueueHandler] = None
+
+
+def create_formatter() -> CustomJsonFormatter:
+    return CustomJsonFormatter(LOG_FORMAT, datefmt=LOG_DATEFMT)
+
+
+def build_pipeline(
+    stream: Optional[TextIO] = None,
+    sample_rate: float = 1.0,
+    queue_size: int = 10000,
+    batch_size: int = 64,
+):
     """
-    获取日志配置字典
-    
+    创建日志管道（不挂到日志器上）
+
+    返回 (queue_handler, listener)：queue_handler 挂到日志器上，listener 启动后在后台线程中格式化并写出
+    """
+    log_queue = queue.Queue(maxsize=queue_size)
+    queue_handler = DroppingQueueHandler(log_queue)
+    queue_handler.addFilter(RequestIdFilter())  # 请求ID在记录日志的线程中读取
+    if sample_rate < 1.0:
+        queue_handler.addFilter(SamplingFilter(sample_rate))
+
+    output = BatchingStreamHandler(stream or sys.stdout, batch_size=batch_size)
+    output.setFormatter(create_formatter())
+    listener = BatchingQueueListener(log_queue, output, respect_handler_level=True)
+    return queue_handler, listener
+
+
+def setup_logging(
+    debug: bool = False,
+    sample_rate: float = 1.0,
+    queue_size: int = 10000,
+    batch_size: int = 64,
+) -> None:
+    """
+    配置应用日志（进程内只生效一次，重复调用直接返回）
+
     参数:
         debug: bool - 是否启用DEBUG模式
-        
-    返回符合logging.config.dictConfig格式的配置字典
+        sample_rate: float - 按请求采样比例（0~1），1 表示保留全部
+        queue_size: int - 日志队列容量，队列满时丢弃新记录
+        batch_size: int - 单次写入合并的最大日志条数
     """
-    # 根据DEBUG模式设置日志级别
-    log_level = "DEBUG" if debug else "INFO"
-    
-    return {
-        "version": 1,  # 日志配置版本号
-        "disable_existing_loggers": False,  # 保持False，否则会禁用已存在的日志器
-        
-        "formatters": {
-            "json": {
-                "()": CustomJsonFormatter,  # 使用自定义格式化器
-                "fmt": "%(asctime)s %(name)s %(levelname)s %(message)s %(pathname)s %(funcName)s %(lineno)d",
-                "datefmt": "%Y-%m-%dT%H:%M:%SZ",  # ISO 8601时间格式
-            }
-        },
-        
-        "handlers": {
-            "console": {
-                "class": "logging.StreamHandler",  # 控制台输出
-                "formatter": "json",  # 使用json格式化器
-                "stream": "ext://sys.stdout",  # 输出到标准输出
-            }
-        },
-        
-        "loggers": {
-            # Uvicorn主日志器
-            "uvicorn": {
-                "handlers": ["console"],
-                "level": log_level,
-                "propagate": False,  # 不向上传播日志
-            },
-            # Uvicorn错误日志器
-            "uvicorn.error": {
-                "handlers": ["console"],
-                "level": log_level,
-                "propagate": False,
-            },
-            # 屏蔽默认的访问日志，推荐使用中间件自定义
-            "uvicorn.access": {
-                "handlers": [],
-                "level": "CRITICAL",  # 设置为最高级别，实际上禁用了默认访问日志
-            },
-            # 应用程序自定义日志器
-            "app": {
-                "handlers": ["console"],
-                "level": log_level,
-                "propagate": False,
-            },
-            # 支持myapp日志器（保持向后兼容）
-            "myapp": {
-                "handlers": ["console"],
-                "level": log_level,
-                "propagate": False,
-            }
-        },
-        
+    global _listener, _queue_handler
+
+    with _setup_lock:
+        if _listener is not None:
+            return
+
+        # 根据DEBUG模式设置日志级别
+        log_level = logging.DEBUG if debug else logging.INFO
+        queue_handler, listener = build_pipeline(sys.stdout, sample_rate, queue_size, batch_size)
+
+        for name in APP_LOGGERS:
+            named = logging.getLogger(name)
+            named.handlers = [queue_handler]
+            named.setLevel(log_level)
+            named.propagate = False  # 不向上传播日志
+
+        # 屏蔽默认的访问日志，推荐使用中间件自定义
+        access = logging.getLogger("uvicorn.access")
+        access.handlers = []
+        access.setLevel(logging.CRITICAL)
+
         # 根日志器配置
-        "root": {
-            "handlers": ["console"],
-            "level": log_level
-        }
-    }
+        root = logging.getLogger()
+        root.handlers = [queue_handler]
+        root.setLevel(log_level)
+
+        listener.start()
+        atexit.register(shutdown_logging)
+        _listener, _queue_handler = listener, queue_handler
+
+
+def shutdown_logging() -> None:
+    """停止后台线程，写出队列中剩余的日志"""
+    global _listener
+
+    with _setup_lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.flush()
+        _listener = None
+
+
+def dropped_records() -> int:
+    """因队列满而丢弃的日志条数"""
+    return _queue_handler.dropped if _queue_handler is not None else 0
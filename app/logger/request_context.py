@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+"""
+请求上下文模块
+
+每个HTTP请求分配一个请求ID（优先使用客户端传入的 X-Request-ID），保存在上下文变量中：
+- 查询线程池通过 contextvars.copy_context 继承请求ID，检索、重排序、LLM调用等各阶段的日志都带有同一个ID
+- 导入任务在工作线程中以任务ID作为请求ID
+- RequestIdFilter 在记录日志的线程中把请求ID写入日志记录，JSON日志输出 request_id 字段
+"""
+import logging
+import uuid
+from contextvars import ContextVar
+from typing import Optional
+
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def get_request_id() -> Optional[str]:
+    return request_id_var.get()
+
+
+class RequestIdFilter(logging.Filter):
+    """把当前上下文的请求ID写入日志记录（没有请求ID时不添加字段）"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        request_id = request_id_var.get()
+        if request_id is not None and not hasattr(record, "request_id"):
+            record.request_id = request_id
+        return True
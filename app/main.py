@@ -5,15 +5,18 @@ from fastapi.middleware.cors import CORSMiddleware
 import logging
 import time
 import os
+import threading
 from contextlib import asynccontextmanager
 
 # 导入配置和路由
 from app.config import config
-from app.routes import upload, query
-from app.logger.logging_config import get_logging_config
+from app.routes import upload, query, health, jobs, metrics as metrics_route
+from app.services import vector_service, rag_service, job_service, metrics
+from app.logger.logging_config import setup_logging
+from app.logger.request_context import new_request_id, request_id_var
 
-# 配置日志
-logging.config.dictConfig(get_logging_config(config.DEBUG))
+# 配置日志（唯一的配置入口；uvicorn 不再单独配置日志）
+setup_logging(config.DEBUG, config.LOG_SAMPLE_RATE, config.LOG_QUEUE_SIZE, config.LOG_BATCH_SIZE)
 logger = logging.getLogger("app")
 logger.info("应用日志配置完成")
 logger.info(f"应用版本: {config.APP_VERSION}")
@@ -40,6 +43,16 @@ async def lifespan(app: FastAPI):
         os.makedirs(config.VECTOR_STORE_PATH, exist_ok=True)
         logger.info(f"向量数据库目录: {config.VECTOR_STORE_PATH}")
         
+        # 加载持久化的向量索引（校验索引清单，记录加载耗时与向量数量）
+        vector_service.load_index()
+        
+        # 嵌入模型与LLM客户端在后台预热，不阻塞启动；就绪状态见 /api/ready
+        if config.WARMUP_ON_STARTUP:
+            threading.Thread(target=vector_service.warmup, name="warmup", daemon=True).start()
+        
+        # 启动后台导入任务工作线程（恢复上次未完成的任务）
+        job_service.start()
+        
         logger.info("DeepSeek API密钥验证通过")
     except Exception as e:
         logger.error(f"应用启动失败: {str(e)}", exc_info=True)
@@ -51,6 +64,10 @@ async def lifespan(app: FastAPI):
     # 关闭时清理逻辑
     logger.info("应用正在关闭...")
     # 在这里添加关闭时的清理代码，如关闭数据库连接等
+    job_service.stop()
+    rag_service.shutdown()
+    await vector_service.close_llm()
+    vector_service.close_index()
     logger.info("应用关闭完成")
 
 
@@ -79,10 +96,12 @@ def create_app() -> FastAPI:
     )
     logger.info("CORS中间件配置完成")
     
-    # 添加请求日志中间件
+    # 添加请求日志中间件：分配请求ID（同一请求各阶段的日志带有相同的 request_id），记录耗时指标
     @app.middleware("http")
     async def log_requests(request: Request, call_next):
         start_time = time.time()
+        request_id = request.headers.get("X-Request-ID") or new_request_id()
+        token = request_id_var.set(request_id)
         
         # 记录请求信息
         logger.info(
@@ -94,22 +113,32 @@ def create_app() -> FastAPI:
             }
         )
         
-        # 处理请求
-        response = await call_next(request)
-        
-        # 记录响应信息
-        process_time = time.time() - start_time
-        logger.info(
-            f"请求完成",
-            extra={
-                "method": request.method,
-                "url": str(request.url),
-                "status_code": response.status_code,
-                "process_time": round(process_time * 1000, 2)  # 毫秒
-            }
-        )
-        
-        return response
+        try:
+            # 处理请求
+            response = await call_next(request)
+            
+            # 记录响应信息
+            process_time = time.time() - start_time
+            # 按路由模板统计，避免路径参数造成标签基数膨胀
+            route = request.scope.get("route")
+            metrics.HTTP_REQUEST_SECONDS.labels(
+                method=request.method,
+                route=getattr(route, "path", "<unmatched>"),
+                status=str(response.status_code),
+            ).observe(process_time)
+            logger.info(
+                f"请求完成",
+                extra={
+                    "method": request.method,
+                    "url": str(request.url),
+                    "status_code": response.status_code,
+                    "process_time": round(process_time * 1000, 2)  # 毫秒
+                }
+            )
+            response.headers["X-Request-ID"] = request_id
+            return response
+        finally:
+            request_id_var.reset(token)
     
     # 挂载静态文件
     app.mount(
@@ -122,6 +151,10 @@ def create_app() -> FastAPI:
     # 注册API路由
     app.include_router(upload.router, prefix=config.API_PREFIX)
     app.include_router(query.router, prefix=config.API_PREFIX)
+    app.include_router(health.router, prefix=config.API_PREFIX)
+    app.include_router(jobs.router, prefix=config.API_PREFIX)
+    # Prometheus 抓取地址不带API前缀
+    app.include_router(metrics_route.router)
     logger.info(f"API路由注册完成，前缀: {config.API_PREFIX}")
     
     # 主页面路由
@@ -162,5 +195,5 @@ if __name__ == "__main__":
         host=config.HOST,
         port=config.PORT,
         reload=config.RELOAD,
-        log_config=get_logging_config(config.DEBUG)
+        log_config=None
     )
@@ -1,9 +1,13 @@
 from llama_index.core import Document
 
 class PDFDocument:
-    def __init__(self, text, metadata=None):
+    def __init__(self, text, metadata=None, doc_id=None):
         self.text = text
         self.metadata = metadata or {}
+        # 同一PDF的全部分块共享doc_id，作为节点的ref_doc_id，用于按文档替换/删除
+        self.doc_id = doc_id
 
     def to_node(self):
+        if self.doc_id is not None:
+            return Document(text=self.text, metadata=self.metadata, id_=self.doc_id)
         return Document(text=self.text, metadata=self.metadata)
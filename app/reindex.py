@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+批量重建索引命令
+
+读取PDF存储目录中的全部文件，用多进程嵌入工作池重新嵌入并写入向量索引（见 app/services/reindex_service.py），
+完成后输出每个文件的结果与整体吞吐（chunks/sec）。
+
+运行前请先停止Web服务：向量索引只允许一个进程写入。
+更换嵌入模型后重建索引时，先清空向量存储目录（VECTOR_STORE_PATH）。
+
+用法:
+    python -m app.reindex [--workers 8] [--threads-per-worker 4] [--batch-size 64] [--only-changed] [--no-cache]
+"""
+import argparse
+
+from app.config import config
+from app.logger.logging_config import setup_logging
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf-dir", default=None, help="PDF目录，默认 data/pdfs")
+    parser.add_argument("--workers", type=int, default=config.REINDEX_WORKERS, help="嵌入工作进程数")
+    parser.add_argument(
+        "--threads-per-worker", type=int, default=config.REINDEX_THREADS_PER_WORKER,
+        help="每个工作进程的推理线程数，0 表示 CPU核数 / 进程数",
+    )
+    parser.add_argument("--batch-size", type=int, default=config.REINDEX_BATCH_SIZE, help="每个进程池任务嵌入的分块数")
+    parser.add_argument("--only-changed", action="store_true", help="只处理未导入或内容已变化的文件")
+    parser.add_argument("--no-cache", action="store_true", help="不使用嵌入缓存，全部分块重新嵌入")
+    args = parser.parse_args()
+    setup_logging(config.DEBUG, config.LOG_SAMPLE_RATE, config.LOG_QUEUE_SIZE, config.LOG_BATCH_SIZE)
+
+    from app.services import vector_service
+    from app.services.reindex_service import reindex_library
+
+    def report(result) -> None:
+        print(f"{result['status']:<10} {result['filename']}  分块数: {result['chunks']}  嵌入: {result['embedded']}")
+
+    try:
+        summary = reindex_library(
+            pdf_dir=args.pdf_dir,
+            workers=args.workers,
+            threads_per_worker=args.threads_per_worker,
+            batch_size=args.batch_size,
+            only_changed=args.only_changed,
+            use_cache=not args.no_cache,
+            progress=report,
+        )
+    finally:
+        vector_service.close_index()
+
+    skipped = [r for r in summary["files"] if r["status"] in ("unchanged", "duplicate")]
+    for result in skipped:
+        print(f"{result['status']:<10} {result['filename']}")
+    print(
+        f"文件数: {len(summary['files'])}, 分块数: {summary['chunks']}, 嵌入: {summary['embedded']}, "
+        f"进程数: {summary['workers']} × {summary['threads_per_worker']} 线程, "
+        f"耗时: {summary['seconds']}s, chunks/sec: {summary['chunks_per_sec']}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from app.config import config
+from app.services import vector_service
+from app.services.vector_service import get_index_stats
+from app.services.rag_service import get_answer_cache_stats
+
+router = APIRouter()
+
+
+@router.get("/health")
+async def health():
+    """健康检查：返回应用版本、向量索引加载状态与问答缓存命中率"""
+    index_stats = get_index_stats()
+    return {
+        "status": "ok" if index_stats["loaded"] else "starting",
+        "version": config.APP_VERSION,
+        "ready": vector_service.is_ready(),
+        "index": index_stats,
+        "answer_cache": get_answer_cache_stats(),
+    }
+
+
+@router.get("/ready")
+async def ready():
+    """就绪探针：索引、嵌入模型与LLM客户端都已加载时返回200，否则返回503"""
+    body = {
+        "ready": vector_service.is_ready(),
+        "warmup_time_ms": (
+            round(vector_service.warmup_seconds * 1000, 2) if vector_service.warmup_seconds is not None else None
+        ),
+        "error": vector_service.warmup_error,
+    }
+    return JSONResponse(body, status_code=200 if body["ready"] else 503)
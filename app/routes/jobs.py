@@ -0,0 +1,19 @@
+from fastapi import APIRouter, HTTPException
+from app.services import job_service
+
+router = APIRouter()
+
+
+@router.get("/jobs")
+async def list_jobs(limit: int = 50):
+    """最近的导入任务"""
+    return {"jobs": job_service.get_queue().list(limit)}
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """导入任务进度：阶段、已提取页数、已嵌入分块数与吞吐"""
+    job = job_service.get_queue().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job
@@ -0,0 +1,23 @@
+from fastapi import APIRouter, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+from app.logger.logging_config import dropped_records
+from app.services import job_service, metrics, vector_service
+
+router = APIRouter()
+
+
+@router.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Prometheus指标：各阶段耗时直方图，以及抓取时更新的索引与队列仪表"""
+    index_stats = vector_service.get_index_stats()
+    if index_stats["loaded"]:
+        metrics.INDEX_VECTORS.set(index_stats["vector_count"])
+        metrics.INDEX_NODES.set(index_stats["node_count"])
+        metrics.INDEX_SIZE_BYTES.set(index_stats["size_bytes"])
+    if job_service.job_queue is not None:
+        counts = job_service.job_queue.counts()
+        metrics.JOB_QUEUE_DEPTH.set(counts.get(job_service.QUEUED, 0))
+        metrics.JOBS_RUNNING.set(counts.get(job_service.RUNNING, 0))
+    metrics.LOG_RECORDS_DROPPED.set(dropped_records())
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
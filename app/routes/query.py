@@ -1,15 +1,49 @@
+import json
+from typing import Optional
+
 from fastapi import APIRouter
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from app.services.rag_service import answer_question
+from app.services.rag_service import answer_question, stream_answer
 
 router = APIRouter()
 
 
 class QueryRequest(BaseModel):
     text: str
+    # 是否使用交叉编码器重排序，不传时使用 RERANK_ENABLED 配置
+    rerank: Optional[bool] = None
 
 
 @router.post("/query/")
 async def query(req: QueryRequest):
-    answer = answer_question(req.text)
-    return {"answer": answer}
+    """问答：返回回答与引用（文件、页码、字符偏移）"""
+    return await answer_question(req.text, rerank=req.rerank)
+
+
+async def _sse_events(text: str, rerank: Optional[bool]):
+    """把流式问答事件编码为Server-Sent Events"""
+    async for event in stream_answer(text, rerank=rerank):
+        data = json.dumps(event["data"], ensure_ascii=False)
+        yield f"event: {event['event']}\ndata: {data}\n\n"
+
+
+def _sse_response(text: str, rerank: Optional[bool] = None) -> StreamingResponse:
+    return StreamingResponse(
+        _sse_events(text, rerank),
+        media_type="text/event-stream",
+        # 禁止代理缓冲，保证增量立即送达客户端
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post("/query/stream")
+async def query_stream(req: QueryRequest):
+    """流式问答（SSE）：先返回 sources 事件，再逐个返回 token 事件，最后 done 事件"""
+    return _sse_response(req.text, req.rerank)
+
+
+@router.get("/query/stream")
+async def query_stream_get(text: str, rerank: Optional[bool] = None):
+    """流式问答（SSE），供浏览器 EventSource 使用"""
+    return _sse_response(text, rerank)
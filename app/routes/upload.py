@@ -1,26 +1,24 @@
 from fastapi import APIRouter, UploadFile, File, HTTPException
-from app.services.pdf_service import process_pdf
-from app.services.vector_service import add_documents_to_index
+from fastapi.concurrency import run_in_threadpool
+from app.services import job_service
 import logging
-from app.logger.logging_config import get_logging_config
 
-# 配置日志
-logging.config.dictConfig(get_logging_config())
 logger = logging.getLogger("myapp")
 
 router = APIRouter()
 
 
-@router.post("/upload_pdf/")
+@router.post("/upload_pdf/", status_code=202)
 async def upload_pdf(file: UploadFile = File(...)):
     try:
         # 检查文件类型
         if not file.filename.lower().endswith(".pdf"):
             raise HTTPException(status_code=400, detail="只支持PDF文件")
 
-        docs, chunk_count = await process_pdf(file)
-        add_documents_to_index(docs)
-        return {"message": "PDF uploaded and indexed", "chunks": chunk_count}
+        # 只暂存文件并登记任务，解析与嵌入在后台工作线程中完成；
+        # 复制、哈希与fsync在线程池中执行，不阻塞事件循环
+        job = await run_in_threadpool(job_service.get_queue().submit, file.filename, file.file)
+        return {"message": "PDF accepted", "job_id": job["id"], "status": job["status"]}
 
     except HTTPException:
         raise
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+问答结果缓存模块
+
+两级缓存，避免常见问题重复执行嵌入、检索与LLM调用：
+1. 精确缓存：键为（索引版本, 查询参数, 归一化后的问题文本），命中时不需要计算查询嵌入
+2. 语义缓存：新问题的查询嵌入与已缓存问题的余弦相似度不低于阈值时复用其回答
+
+所有条目都绑定写入时的索引版本（向量存储每次写入/删除后递增），
+上传新文档后旧版本的条目全部失效；条目另有TTL，总数超出容量后按LRU淘汰。
+缓存只保存在进程内存中，服务重启后清空。
+"""
+import re
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.services.embedding_cache import normalize_text
+
+logger = logging.getLogger("app")
+
+# 问题末尾的标点不影响语义
+TRAILING_PUNCT_RE = re.compile(r"[\s?？!！。.,，;；~～]+$")
+
+
+def normalize_query(query: str) -> str:
+    """问题文本归一化：NFKC、合并空白、英文小写、去掉末尾标点"""
+    return TRAILING_PUNCT_RE.sub("", normalize_text(query).lower())
+
+
+class _Entry:
+    __slots__ = ("value", "embedding", "scope", "expires_at")
+
+    def __init__(self, value: Dict[str, Any], embedding: Optional[np.ndarray], scope: Hashable, expires_at: float):
+        self.value = value
+        self.embedding = embedding
+        self.scope = scope
+        self.expires_at = expires_at
+
+
+class AnswerCache:
+    """
+    带TTL与LRU淘汰的两级问答缓存（线程安全）
+
+    scope 为影响回答的查询参数（如 (top_k, 是否重排序)），只有参数相同的条目才能命中
+
+    参数:
+        max_entries: int - 最多缓存的回答数量
+        ttl_seconds: float - 条目有效期（秒）
+        similarity_threshold: float - 语义缓存的余弦相似度阈值
+        semantic: bool - 是否启用语义缓存
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float, similarity_threshold: float, semantic: bool = True):
+        self.max_entries = max(max_entries, 1)
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.semantic = semantic
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self._version: Any = None
+        self._entries: "OrderedDict[Tuple[Hashable, str], _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    # ------------------------------ 内部 ------------------------------
+    def _sync_version(self, version: Any) -> None:
+        """索引版本变化时清空全部条目（调用方持有锁）"""
+        if version != self._version:
+            if self._entries:
+                self.invalidations += len(self._entries)
+                logger.info("索引版本变化（%s -> %s），问答缓存失效: %d", self._version, version, len(self._entries))
+                self._entries.clear()
+            self._version = version
+
+    def _live(self, key: Tuple[Hashable, str], entry: _Entry, now: float) -> bool:
+        if entry.expires_at > now:
+            return True
+        del self._entries[key]
+        self.expirations += 1
+        return False
+
+    @staticmethod
+    def _unit(embedding: Sequence[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm > 0 else vector
+
+    # ------------------------------ 查询 ------------------------------
+    def get_exact(self, query: str, scope: Hashable, version: Any) -> Optional[Dict[str, Any]]:
+        """精确查询；未命中时不计入 misses（调用方可能继续进行语义查询）"""
+        key = (scope, normalize_query(query))
+        with self._lock:
+            self._sync_version(version)
+            entry = self._entries.get(key)
+            if entry is None or not self._live(key, entry, time.time()):
+                if not self.semantic:
+                    self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.exact_hits += 1
+            return entry.value
+
+    def get_semantic(self, embedding: Sequence[float], scope: Hashable, version: Any) -> Optional[Dict[str, Any]]:
+        """语义查询：返回相似度最高且不低于阈值的条目"""
+        if not self.semantic:
+            return None
+        query = self._unit(embedding)
+        with self._lock:
+            self._sync_version(version)
+            now = time.time()
+            keys, vectors = [], []
+            for key, entry in list(self._entries.items()):
+                if entry.scope == scope and entry.embedding is not None and self._live(key, entry, now):
+                    keys.append(key)
+                    vectors.append(entry.embedding)
+            if vectors:
+                scores = np.stack(vectors) @ query
+                best = int(np.argmax(scores))
+                if scores[best] >= self.similarity_threshold:
+                    self._entries.move_to_end(keys[best])
+                    self.semantic_hits += 1
+                    logger.info("问答缓存语义命中（相似度 %.4f）", float(scores[best]))
+                    return self._entries[keys[best]].value
+            self.misses += 1
+            return None
+
+    def put(
+        self,
+        query: str,
+        scope: Hashable,
+        version: Any,
+        value: Dict[str, Any],
+        embedding: Optional[Sequence[float]] = None,
+    ) -> None:
+        """写入回答；version 为检索之前读取的索引版本，期间索引已更新时不写入"""
+        key = (scope, normalize_query(query))
+        vector = self._unit(embedding) if embedding is not None else None
+        with self._lock:
+            if self._version is not None and version != self._version:
+                return
+            self._version = version
+            self._entries[key] = _Entry(value, vector, scope, time.time() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """命中率与容量信息"""
+        with self._lock:
+            hits = self.exact_hits + self.semantic_hits
+            lookups = hits + self.misses
+            return {
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "index_version": self._version,
+            }
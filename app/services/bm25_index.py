@@ -0,0 +1,501 @@
+# -*- coding: utf-8 -*-
+"""
+BM25稀疏检索模块
+
+稠密检索使用的 all-MiniLM-L6-v2 是英文模型，对中文人名、罕见词的精确匹配较弱。
+本模块维护一个持久化的倒排索引，与向量检索并行召回，查询时用RRF融合两路结果。
+
+- 分词：CJK连续片段切为二元组（bigram），拉丁字母/数字按单词；可选 jieba 搜索引擎模式分词
+- 倒排表：每次写入生成一个新的倒排段，(词项, 段) 对应一行，
+  文档号差分编码后与词频一起用varint压缩存储；查询时用numpy向量化解码与打分
+- 删除：从文档表删除后在内存位图中标记，查询时过滤；段数量或已删除文档过多时在后台线程中合并倒排段，
+  合并时清除已删除文档并为存活文档重新连续编号；合并不持有锁，查询与写入可以并行进行
+
+存储（SQLite）：
+- docs: 文档号 -> 节点ID、ref_doc_id、文档长度（词项数）
+- postings: (词项, 段) -> 文档数、varint编码的倒排表
+"""
+import os
+import re
+import math
+import logging
+import sqlite3
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+from app.services.embedding_cache import normalize_text
+
+logger = logging.getLogger("app")
+
+TOKENIZERS = ("bigram", "jieba")
+# CJK连续片段，或拉丁字母/数字组成的单词
+TOKEN_RUN_RE = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+|[a-z0-9]+")
+# SQLite单条语句的参数数量上限（保守取值）
+SQLITE_MAX_PARAMS = 500
+
+
+# ------------------------------ varint ------------------------------
+def varint_encode(values: Sequence[int]) -> bytes:
+    """无符号整数序列的varint编码（每字节7位，最高位为续位标志），numpy向量化实现"""
+    v = np.asarray(values, dtype=np.uint64)
+    if v.size == 0:
+        return b""
+    nbytes = np.ones(v.size, dtype=np.int64)
+    rest = v >> np.uint64(7)
+    while rest.any():
+        nbytes += rest > 0
+        rest >>= np.uint64(7)
+    starts = np.cumsum(nbytes) - nbytes
+    pos = np.arange(int(nbytes.sum())) - np.repeat(starts, nbytes)
+    payload = (np.repeat(v, nbytes) >> (pos * 7).astype(np.uint64)) & np.uint64(0x7F)
+    more = pos < np.repeat(nbytes, nbytes) - 1
+    return (payload | (more.astype(np.uint64) << np.uint64(7))).astype(np.uint8).tobytes()
+
+
+def varint_decode(data: bytes) -> np.ndarray:
+    """varint解码，返回uint64数组"""
+    b = np.frombuffer(data, dtype=np.uint8)
+    if b.size == 0:
+        return np.zeros(0, dtype=np.uint64)
+    ends = np.flatnonzero(b < 0x80)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    lengths = ends - starts + 1
+    shift = (np.arange(b.size) - np.repeat(starts, lengths)) * 7
+    parts = (b & 0x7F).astype(np.uint64) << shift.astype(np.uint64)
+    return np.add.reduceat(parts, starts)
+
+
+def encode_postings(dids: Sequence[int], tfs: Sequence[int]) -> bytes:
+    """倒排表编码：递增文档号的差分 + 词频"""
+    dids = np.asarray(dids, dtype=np.uint64)
+    deltas = np.diff(dids, prepend=np.uint64(0))
+    return varint_encode(np.concatenate((deltas, np.asarray(tfs, dtype=np.uint64))))
+
+
+def decode_postings(n: int, data: bytes) -> Tuple[np.ndarray, np.ndarray]:
+    values = varint_decode(data)
+    return np.cumsum(values[:n]).astype(np.int64), values[n:].astype(np.float32)
+
+
+# ------------------------------ 分词 ------------------------------
+def _jieba():
+    try:
+        import jieba
+    except ImportError as e:
+        raise ImportError("BM25_TOKENIZER=jieba 需要安装 jieba: pip install jieba") from e
+    return jieba
+
+
+def tokenize(text: str, tokenizer: str = "bigram") -> List[str]:
+    """
+    分词：CJK片段切为二元组（单字片段保留单字）或使用jieba，拉丁字母/数字按单词（小写）
+    """
+    tokens: List[str] = []
+    for match in TOKEN_RUN_RE.finditer(normalize_text(text).lower()):
+        run = match.group()
+        if run[0] < "\u0080":
+            tokens.append(run)
+        elif tokenizer == "jieba":
+            tokens.extend(word for word in _jieba().lcut_for_search(run) if word.strip())
+        elif len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+# ------------------------------ 索引 ------------------------------
+class BM25Index:
+    """
+    持久化BM25倒排索引
+
+    参数:
+        path: str - SQLite数据库路径
+        tokenizer: str - bigram / jieba
+        k1, b: float - BM25参数
+        compact_segments: int - 倒排段数量超过该值时合并
+        compact_deleted_ratio: float - 已删除文档占比超过该值时合并
+        background_compaction: bool - 是否在后台线程中合并（False 时在写入线程中同步合并）
+    """
+
+    def __init__(
+        self,
+        path: str,
+        tokenizer: str = "bigram",
+        k1: float = 1.2,
+        b: float = 0.75,
+        compact_segments: int = 16,
+        compact_deleted_ratio: float = 0.2,
+        background_compaction: bool = True,
+    ):
+        if tokenizer not in TOKENIZERS:
+            raise ValueError(f"未知的BM25分词器: {tokenizer}，可选值: {', '.join(TOKENIZERS)}")
+        if tokenizer == "jieba":
+            _jieba()
+        self.tokenizer = tokenizer
+        self.k1 = k1
+        self.b = b
+        self.compact_segments = compact_segments
+        self.compact_deleted_ratio = compact_deleted_ratio
+        self.background_compaction = background_compaction
+        self._path = path
+        self._lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._compact_thread: threading.Thread | None = None
+        # 合并（重新编号文档号）的次数，查询据此判断解码期间文档号是否失效
+        self._generation = 0
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        with self._db:
+            self._db.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS docs (
+                    did INTEGER PRIMARY KEY,
+                    node_id TEXT NOT NULL UNIQUE,
+                    ref_doc_id TEXT,
+                    length INTEGER NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_docs_ref_doc_id ON docs(ref_doc_id);
+                CREATE TABLE IF NOT EXISTS postings (
+                    term TEXT NOT NULL,
+                    segment INTEGER NOT NULL,
+                    n INTEGER NOT NULL,
+                    data BLOB NOT NULL,
+                    PRIMARY KEY (term, segment)
+                ) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL
+                );
+                """
+            )
+        meta = dict(self._db.execute("SELECT key, value FROM meta").fetchall())
+        self._next_did = int(meta.get("next_did", 0))
+        self._next_segment = int(meta.get("next_segment", 0))
+        # 分词器变化后已有倒排表无法复用，由调用方重建
+        self.needs_rebuild = meta.get("tokenizer", tokenizer) != tokenizer
+        self._load_docs()
+
+    def _load_docs(self) -> None:
+        """加载文档长度与存活位图到内存，查询时用于过滤与长度归一化"""
+        capacity = max(self._next_did, 1024)
+        self._lengths = np.zeros(capacity, dtype=np.float32)
+        self._live = np.zeros(capacity, dtype=bool)
+        for did, length in self._db.execute("SELECT did, length FROM docs"):
+            self._lengths[did] = length
+            self._live[did] = True
+        self._n_docs = int(self._live.sum())
+        self._total_length = float(self._lengths[self._live].sum())
+
+    def _ensure_capacity(self, size: int) -> None:
+        if size <= self._lengths.size:
+            return
+        capacity = max(size, self._lengths.size * 2)
+        self._lengths = np.resize(self._lengths, capacity)
+        self._lengths[self._next_did:] = 0
+        self._live = np.resize(self._live, capacity)
+        self._live[self._next_did:] = False
+
+    def _set_meta(self, **values) -> None:
+        self._db.executemany(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+            [(key, str(value)) for key, value in values.items()],
+        )
+
+    # ---------------------------- 统计 ----------------------------
+    def count(self) -> int:
+        """索引中的文档（分块）数量"""
+        return self._n_docs
+
+    def stats(self) -> Dict[str, object]:
+        return {"tokenizer": self.tokenizer, "docs": self._n_docs, "deleted": self._next_did - self._n_docs}
+
+    # ---------------------------- 写入 ----------------------------
+    def _delete_docs(self, column: str, values: Sequence[str]) -> int:
+        """在当前事务中删除文档，更新内存位图（调用方持有锁）"""
+        deleted = 0
+        for i in range(0, len(values), SQLITE_MAX_PARAMS):
+            batch = list(values[i:i + SQLITE_MAX_PARAMS])
+            placeholders = ",".join("?" * len(batch))
+            dids = [row[0] for row in self._db.execute(f"SELECT did FROM docs WHERE {column} IN ({placeholders})", batch)]
+            if not dids:
+                continue
+            self._db.execute(f"DELETE FROM docs WHERE {column} IN ({placeholders})", batch)
+            self._live[dids] = False
+            self._total_length -= float(self._lengths[dids].sum())
+            deleted += len(dids)
+        self._n_docs -= deleted
+        return deleted
+
+    def add(
+        self,
+        items: Iterable[Tuple[str, str, str]],
+        replace_ref_doc_ids: Sequence[str] = (),
+    ) -> int:
+        """
+        写入一批文档 (node_id, ref_doc_id, text)，作为一个新的倒排段提交
+
+        replace_ref_doc_ids 中的旧文档与同ID的旧节点在同一事务中删除
+        """
+        items = list(items)
+        term_postings: Dict[str, Tuple[List[int], List[int]]] = {}
+        doc_rows = []
+        with self._lock:
+            start = self._next_did
+            for offset, (node_id, ref_doc_id, text) in enumerate(items):
+                did = start + offset
+                counts = Counter(tokenize(text, self.tokenizer))
+                doc_rows.append((did, node_id, ref_doc_id, sum(counts.values())))
+                for term, tf in counts.items():
+                    dids, tfs = term_postings.setdefault(term, ([], []))
+                    dids.append(did)
+                    tfs.append(tf)
+
+            segment = self._next_segment
+            with self._db:
+                self._delete_docs("ref_doc_id", list(replace_ref_doc_ids))
+                self._delete_docs("node_id", [row[1] for row in doc_rows])
+                self._db.executemany(
+                    "INSERT INTO docs (did, node_id, ref_doc_id, length) VALUES (?, ?, ?, ?)", doc_rows
+                )
+                self._db.executemany(
+                    "INSERT INTO postings (term, segment, n, data) VALUES (?, ?, ?, ?)",
+                    [
+                        (term, segment, len(dids), encode_postings(dids, tfs))
+                        for term, (dids, tfs) in term_postings.items()
+                    ],
+                )
+                self._set_meta(
+                    next_did=start + len(doc_rows),
+                    next_segment=segment + 1 if doc_rows else segment,
+                    tokenizer=self.tokenizer,
+                )
+
+            self._ensure_capacity(start + len(doc_rows))
+            for did, _, _, length in doc_rows:
+                self._lengths[did] = length
+                self._live[did] = True
+            self._next_did = start + len(doc_rows)
+            if doc_rows:
+                self._next_segment = segment + 1
+            self._n_docs += len(doc_rows)
+            self._total_length += float(sum(row[3] for row in doc_rows))
+        self._maybe_compact()
+        return len(doc_rows)
+
+    def delete_ref_docs(self, ref_doc_ids: Sequence[str]) -> int:
+        """删除文档的全部分块"""
+        with self._lock:
+            with self._db:
+                deleted = self._delete_docs("ref_doc_id", list(ref_doc_ids))
+        self._maybe_compact()
+        return deleted
+
+    def rebuild(self, items: Iterable[Tuple[str, str, str]], batch_size: int = 2000) -> int:
+        """清空后按批重建索引（分词器变化、或与向量存储不一致时）"""
+        # 等待进行中的合并结束，避免其切换时写回已清空的倒排表
+        with self._compact_lock, self._lock:
+            with self._db:
+                self._db.execute("DELETE FROM docs")
+                self._db.execute("DELETE FROM postings")
+                self._db.execute("DELETE FROM meta")
+                self._set_meta(tokenizer=self.tokenizer)
+            self._next_did = 0
+            self._next_segment = 0
+            self._load_docs()
+        self.needs_rebuild = False
+
+        total, batch = 0, []
+        for item in items:
+            batch.append(item)
+            if len(batch) >= batch_size:
+                total += self.add(batch)
+                batch = []
+        if batch:
+            total += self.add(batch)
+        self.compact()
+        logger.info("已重建BM25索引（文档数: %d）", total)
+        return total
+
+    # ---------------------------- 合并 ----------------------------
+    def _maybe_compact(self) -> None:
+        """倒排段数量或已删除文档占比超过阈值时合并（默认启动后台线程）"""
+        with self._lock:
+            dead = self._next_did - self._n_docs
+            segments = self._db.execute("SELECT COUNT(DISTINCT segment) FROM postings").fetchone()[0]
+            too_many_dead = self._next_did and dead / self._next_did > self.compact_deleted_ratio
+            if segments <= self.compact_segments and not too_many_dead:
+                return
+            if self.background_compaction:
+                if self._compact_thread is not None and self._compact_thread.is_alive():
+                    return
+                self._compact_thread = threading.Thread(
+                    target=self._compact_safely, name="bm25-compaction", daemon=True
+                )
+                self._compact_thread.start()
+                return
+        self.compact()
+
+    def _compact_safely(self) -> None:
+        try:
+            self.compact()
+        except Exception as e:
+            logger.error("BM25倒排段合并失败: %s", str(e), exc_info=True)
+
+    def compact(self) -> None:
+        """
+        合并全部倒排段为一个段，清除已删除文档，并为存活文档重新连续编号
+
+        合并开始时记录快照（段号、文档号上限、存活位图），耗时的解码与重新编码用独立的只读连接读取
+        快照中的段，不持有锁；最后持有锁完成一次短暂的切换：
+        - 合并期间新增的段（文档号不小于快照上限）整体平移到合并结果之后，倒排表重新编码
+        - 合并期间删除的文档已从文档表中删除，切换后重新加载的存活位图中仍为已删除
+        """
+        with self._compact_lock:
+            with self._lock:
+                segment = self._next_segment
+                snapshot_next_did = self._next_did
+                snapshot_live = self._live[:snapshot_next_did].copy()
+            live_dids = np.flatnonzero(snapshot_live)
+            # 旧文档号 -> 新文档号；映射单调递增，倒排表重新编号后仍然有序
+            remap = np.full(max(snapshot_next_did, 1), -1, dtype=np.int64)
+            remap[live_dids] = np.arange(live_dids.size)
+
+            # 快照中的段（段号小于 segment）只会被合并修改，合并期间的写入只追加新段
+            merged = []
+            reader = sqlite3.connect(self._path)
+            try:
+                rows = reader.execute(
+                    "SELECT term, n, data FROM postings WHERE segment < ? ORDER BY term, segment", (segment,)
+                )
+                current_term, parts = None, []
+                for term, n, data in rows:
+                    if term != current_term:
+                        if parts:
+                            merged.append(self._merge_parts(current_term, parts, segment - 1, remap, snapshot_live))
+                        current_term, parts = term, []
+                    parts.append(decode_postings(n, data))
+                if parts:
+                    merged.append(self._merge_parts(current_term, parts, segment - 1, remap, snapshot_live))
+            finally:
+                reader.close()
+            merged = [row for row in merged if row is not None]
+
+            with self._lock:
+                # 合并期间新增的文档号整体平移，使其紧接在合并结果之后
+                shift = snapshot_next_did - int(live_dids.size)
+                with self._db:
+                    moved = []
+                    if shift:
+                        for term, seg, n, data in self._db.execute(
+                            "SELECT term, segment, n, data FROM postings WHERE segment >= ?", (segment,)
+                        ).fetchall():
+                            dids, tfs = decode_postings(n, data)
+                            moved.append((encode_postings(dids - shift, tfs.astype(np.int64)), term, seg))
+                    self._db.execute("DELETE FROM postings WHERE segment < ?", (segment,))
+                    self._db.executemany(
+                        "INSERT INTO postings (term, segment, n, data) VALUES (?, ?, ?, ?)", merged
+                    )
+                    self._db.executemany("UPDATE postings SET data = ? WHERE term = ? AND segment = ?", moved)
+                    # 按旧文档号升序改写：新文档号不大于旧文档号，目标位置此时已空出；
+                    # 合并期间已删除的文档没有对应的行，不受影响
+                    updates = [(int(remap[did]), int(did)) for did in live_dids if remap[did] != did]
+                    if shift:
+                        updates.extend(
+                            (did - shift, did) for did in range(snapshot_next_did, self._next_did)
+                        )
+                    self._db.executemany("UPDATE docs SET did = ? WHERE did = ?", updates)
+                    self._set_meta(next_did=self._next_did - shift)
+                self._next_did -= shift
+                self._generation += 1
+                # 替换而不是原地修改数组：进行中的查询仍持有旧数组，与其读到的旧倒排表一致
+                self._load_docs()
+        logger.info("已合并BM25倒排段（词项数: %d, 文档数: %d）", len(merged), self._n_docs)
+
+    @staticmethod
+    def _merge_parts(term: str, parts, segment: int, remap: np.ndarray, live_mask: np.ndarray):
+        dids = np.concatenate([p[0] for p in parts])
+        tfs = np.concatenate([p[1] for p in parts])
+        live = live_mask[dids]
+        if not live.any():
+            return None
+        return term, segment, int(live.sum()), encode_postings(remap[dids[live]], tfs[live].astype(np.int64))
+
+    # ---------------------------- 查询 ----------------------------
+    def search(self, query: str, top_k: int) -> List[Tuple[str, float]]:
+        """
+        BM25检索
+
+        返回:
+            List[Tuple[str, float]] - (节点ID, BM25得分)，按得分降序
+        """
+        terms = sorted(set(tokenize(query, self.tokenizer)))
+        if not terms or self._n_docs == 0:
+            return []
+        while True:
+            result = self._search(terms, top_k)
+            if result is not None:
+                return result
+
+    def _search(self, terms: List[str], top_k: int) -> List[Tuple[str, float]] | None:
+        """一次检索；解码期间倒排段被合并（文档号已重新编号）时返回None，由调用方重试"""
+        with self._lock:
+            generation = self._generation
+            rows = []
+            for i in range(0, len(terms), SQLITE_MAX_PARAMS):
+                batch = terms[i:i + SQLITE_MAX_PARAMS]
+                rows.extend(self._db.execute(
+                    f"SELECT term, n, data FROM postings WHERE term IN ({','.join('?' * len(batch))})", batch
+                ).fetchall())
+            live_mask = self._live
+            lengths = self._lengths
+            n_docs = self._n_docs
+            avgdl = self._total_length / n_docs if n_docs else 1.0
+
+        by_term: Dict[str, List[Tuple[np.ndarray, np.ndarray]]] = {}
+        for term, n, data in rows:
+            by_term.setdefault(term, []).append(decode_postings(n, data))
+
+        all_dids, all_scores = [], []
+        for parts in by_term.values():
+            dids = np.concatenate([p[0] for p in parts])
+            tfs = np.concatenate([p[1] for p in parts])
+            live = live_mask[dids]
+            dids, tfs = dids[live], tfs[live]
+            df = dids.size
+            if df == 0:
+                continue
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * lengths[dids] / avgdl)
+            all_dids.append(dids)
+            all_scores.append(idf * tfs * (self.k1 + 1) / (tfs + norm))
+        if not all_dids:
+            return []
+
+        unique, inverse = np.unique(np.concatenate(all_dids), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(all_scores))
+        k = min(top_k, unique.size)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        top_dids = [int(d) for d in unique[top]]
+        with self._lock:
+            if self._generation != generation:
+                return None
+            node_ids = dict(self._db.execute(
+                f"SELECT did, node_id FROM docs WHERE did IN ({','.join('?' * len(top_dids))})", top_dids
+            ).fetchall())
+        return [(node_ids[did], float(scores[i])) for did, i in zip(top_dids, top) if did in node_ids]
+
+    def close(self) -> None:
+        """等待后台合并结束并关闭数据库"""
+        thread = self._compact_thread
+        if thread is not None:
+            thread.join()
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+中文分块模块
+
+LlamaIndex 默认的 SentenceSplitter 面向英文：按 tiktoken 计量长度，句子切分规则不识别中文标点，
+中文书籍切出的分块大小不均；而嵌入模型（默认 all-MiniLM-L6-v2）只读取前 256 个 token，
+超出部分被静默截断，既浪费嵌入计算，也丢失了被截断的内容。
+
+CJKChunker：
+1. 在中文句末标点（。！？；）及其后的引号/括号、英文句末标点和段落空行处切分句子
+2. 使用嵌入模型自己的分词器计量句子长度，分块不超过模型的最大输入长度，不会被截断
+3. 按句子贪心装箱，相邻分块之间保留不超过 overlap_tokens 的重叠句子
+4. 整个窗口的句子一次性批量分词（Rust实现的fast tokenizer），多MB文本也能快速处理
+
+分块是原文的连续子串（只去掉首尾空白），调用方可以据此计算字符偏移。
+"""
+import re
+import logging
+from functools import lru_cache
+from typing import List, Sequence, Tuple
+
+logger = logging.getLogger("app")
+
+# 句子边界：句末标点（可连续出现）及紧随其后的右引号/右括号，或段落空行
+SENTENCE_BOUNDARY_RE = re.compile(r"[。！？；!?;]+[”’」』）)》\"']*|\n\s*\n")
+# 无法加载分词器时的近似计量：CJK字符、拉丁单词、其他非空白符号各计1个token
+APPROX_TOKEN_RE = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]|[A-Za-z0-9]+|[^\sA-Za-z0-9]")
+
+
+@lru_cache(maxsize=4)
+def load_tokenizer(model_name: str):
+    """加载嵌入模型的分词器，不可用时返回None（使用近似计量）"""
+    try:
+        from transformers import AutoTokenizer
+
+        return AutoTokenizer.from_pretrained(model_name)
+    except Exception as e:
+        logger.warning("无法加载分词器 %s，分块长度使用近似计量: %s", model_name, str(e))
+        return None
+
+
+def split_sentences(text: str) -> List[str]:
+    """按句末标点与段落空行切分句子，各句依次拼接即为原文"""
+    sentences, start = [], 0
+    for match in SENTENCE_BOUNDARY_RE.finditer(text):
+        sentences.append(text[start:match.end()])
+        start = match.end()
+    if start < len(text):
+        sentences.append(text[start:])
+    return sentences
+
+
+class CJKChunker:
+    """
+    按嵌入模型token计量的中文分块器，接口与 SentenceSplitter.split_text 一致
+
+    参数:
+        max_tokens: int - 嵌入模型的最大输入长度（含特殊token）
+        overlap_tokens: int - 相邻分块的重叠长度上限
+        tokenizer - HuggingFace分词器，None时使用近似计量
+    """
+
+    def __init__(self, max_tokens: int, overlap_tokens: int, tokenizer=None):
+        self.tokenizer = tokenizer
+        special = tokenizer.num_special_tokens_to_add() if tokenizer is not None else 2
+        # 分块正文可用的token数：扣除 [CLS] / [SEP] 等特殊token
+        self.budget = max(max_tokens - special, 1)
+        self.overlap_tokens = min(overlap_tokens, self.budget // 2)
+
+    # ------------------------------ 计量 ------------------------------
+    def count_tokens(self, texts: Sequence[str]) -> List[int]:
+        """批量计算文本的token数（不含特殊token）"""
+        if not texts:
+            return []
+        if self.tokenizer is None:
+            return [len(APPROX_TOKEN_RE.findall(text)) for text in texts]
+        # verbose=False：句子可能超过模型最大长度，这里只计量，不需要截断警告
+        encoded = self.tokenizer(list(texts), add_special_tokens=False, verbose=False)["input_ids"]
+        return [len(ids) for ids in encoded]
+
+    def _hard_split(self, sentence: str) -> List[Tuple[str, int]]:
+        """超长句子按token边界硬切分为不超过预算的片段"""
+        if self.tokenizer is not None and getattr(self.tokenizer, "is_fast", False):
+            offsets = self.tokenizer(
+                sentence, add_special_tokens=False, return_offsets_mapping=True, verbose=False
+            )["offset_mapping"]
+            pieces, start = [], 0
+            for i in range(self.budget, len(offsets), self.budget):
+                end = offsets[i][0]
+                pieces.append((sentence[start:end], self.budget))
+                start = end
+            pieces.append((sentence[start:], len(offsets) - self.budget * len(pieces)))
+            return pieces
+
+        # 近似计量：按token匹配位置切分
+        matches = list(APPROX_TOKEN_RE.finditer(sentence))
+        pieces, start = [], 0
+        for i in range(self.budget, len(matches), self.budget):
+            end = matches[i].start()
+            pieces.append((sentence[start:end], self.budget))
+            start = end
+        pieces.append((sentence[start:], len(matches) - self.budget * len(pieces)))
+        return pieces
+
+    # ------------------------------ 分块 ------------------------------
+    def split_text(self, text: str) -> List[str]:
+        """切分文本，返回分块列表（每块不超过 budget 个token）"""
+        sentences = split_sentences(text)
+        units: List[Tuple[str, int]] = []
+        for sentence, n_tokens in zip(sentences, self.count_tokens(sentences)):
+            if n_tokens > self.budget:
+                units.extend(self._hard_split(sentence))
+            else:
+                units.append((sentence, n_tokens))
+
+        chunks: List[str] = []
+        current: List[Tuple[str, int]] = []
+        current_tokens = 0
+        for unit in units:
+            if current and current_tokens + unit[1] > self.budget:
+                self._emit(chunks, current)
+                # 保留末尾不超过 overlap_tokens 的句子作为下一块的开头
+                overlap: List[Tuple[str, int]] = []
+                overlap_tokens = 0
+                for prev in reversed(current):
+                    if overlap_tokens + prev[1] > self.overlap_tokens or overlap_tokens + prev[1] + unit[1] > self.budget:
+                        break
+                    overlap.insert(0, prev)
+                    overlap_tokens += prev[1]
+                current, current_tokens = overlap, overlap_tokens
+            current.append(unit)
+            current_tokens += unit[1]
+        if current:
+            self._emit(chunks, current)
+        return chunks
+
+    @staticmethod
+    def _emit(chunks: List[str], units: List[Tuple[str, int]]) -> None:
+        chunk = "".join(text for text, _ in units).strip()
+        if chunk:
+            chunks.append(chunk)
+
+
+def create_chunker(
+    kind: str,
+    model_name: str,
+    max_tokens: int,
+    overlap_tokens: int,
+    chunk_size: int,
+    chunk_overlap: int,
+):
+    """
+    按配置创建分块器
+
+    参数:
+        kind: str - cjk（按嵌入模型token计量的中文分块器）/ sentence（LlamaIndex SentenceSplitter）
+    """
+    if kind == "sentence":
+        from llama_index.core.node_parser import SentenceSplitter
+
+        return SentenceSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    if kind == "cjk":
+        return CJKChunker(max_tokens, overlap_tokens, tokenizer=load_tokenizer(model_name))
+    raise ValueError(f"未知的分块器: {kind}，可选值: cjk / sentence")
+
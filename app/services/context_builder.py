@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+LLM上下文打包模块
+
+检索到的分块（含相邻分块扩展）在送入LLM之前按token预算打包，控制提示词长度，
+从而控制DeepSeek的延迟与费用：
+1. 按相关度（得分）降序排列
+2. 丢弃与已选分块SimHash近似重复的分块（如同一本书的不同版本）
+3. 合并多余空白后按LLM分词器计量，依次装入预算；放不下的分块在句子边界处截断，
+   截断后过短的分块跳过，继续尝试后面更短的分块
+
+计量使用 CONTEXT_TOKENIZER 指定的分词器：默认为本地目录中DeepSeek自己的分词器（data/tokenizers/deepseek-v3，
+由 python -m app.fetch_tokenizer 下载），approx 为近似计量（不需要任何文件），其他含 "/" 的名称为HuggingFace分词器，
+否则为 tiktoken 编码名；加载失败（如本地目录不存在）时使用近似计量。
+"""
+import os
+import re
+import logging
+from functools import lru_cache
+from typing import Callable, List, Tuple
+
+from llama_index.core.schema import MetadataMode, NodeWithScore, TextNode
+
+from app.services.chunker import APPROX_TOKEN_RE, load_tokenizer, split_sentences
+from app.services.dedup import hamming_distance, simhash
+
+logger = logging.getLogger("app")
+
+TokenCounter = Callable[[List[str]], List[int]]
+
+# 行内连续空白（含全角空格）与跨行空白
+_INLINE_SPACE_RE = re.compile(r"[ \t\u3000]+")
+_LINE_BREAK_RE = re.compile(r"\s*\n\s*")
+
+
+def compress_whitespace(text: str) -> str:
+    """合并PDF提取文本中的多余空白"""
+    return _INLINE_SPACE_RE.sub(" ", _LINE_BREAK_RE.sub("\n", text)).strip()
+
+
+def _approx_counter(texts: List[str]) -> List[int]:
+    return [len(APPROX_TOKEN_RE.findall(text)) for text in texts]
+
+
+@lru_cache(maxsize=4)
+def get_token_counter(name: str) -> TokenCounter:
+    """按名称加载批量token计数函数：近似计量 / 本地或HuggingFace分词器 / tiktoken，加载失败时使用近似计量"""
+    if name == "approx":
+        return _approx_counter
+    if os.path.isabs(name) or name.startswith("."):
+        # 本地分词器目录：不存在时不尝试从HuggingFace Hub下载
+        if not os.path.isdir(name):
+            logger.warning(
+                "分词器目录 %s 不存在（可运行 python -m app.fetch_tokenizer 下载），上下文长度使用近似计量", name
+            )
+            return _approx_counter
+    if "/" in name or os.sep in name:
+        tokenizer = load_tokenizer(name)
+        if tokenizer is None:
+            return _approx_counter
+
+        def count_hf(texts: List[str]) -> List[int]:
+            if not texts:
+                return []
+            encoded = tokenizer(list(texts), add_special_tokens=False, verbose=False)["input_ids"]
+            return [len(ids) for ids in encoded]
+
+        return count_hf
+
+    try:
+        import tiktoken
+
+        encoding = tiktoken.get_encoding(name)
+    except Exception as e:
+        logger.warning("无法加载分词器 %s，上下文长度使用近似计量: %s", name, str(e))
+        return _approx_counter
+    return lambda texts: [len(ids) for ids in encoding.encode_batch(list(texts), disallowed_special=())]
+
+
+def _trim_to_sentences(text: str, budget: int, count_tokens: TokenCounter) -> Tuple[str, int]:
+    """保留不超过 budget 个token的前若干个完整句子，返回 (原文前缀, token数)"""
+    sentences = split_sentences(text)
+    kept, used = 0, 0
+    for n_tokens in count_tokens([compress_whitespace(s) for s in sentences]):
+        if used + n_tokens > budget:
+            break
+        kept += 1
+        used += n_tokens
+    return "".join(sentences[:kept]).rstrip(), used
+
+
+def _with_text(hit: NodeWithScore, raw_text: str, trimmed: bool) -> NodeWithScore:
+    node = hit.node
+    end_char_idx = node.end_char_idx
+    if trimmed and node.start_char_idx is not None:
+        end_char_idx = node.start_char_idx + len(raw_text)
+    packed = TextNode(
+        id_=node.node_id,
+        text=compress_whitespace(raw_text),
+        metadata=dict(node.metadata),
+        excluded_embed_metadata_keys=list(node.excluded_embed_metadata_keys),
+        excluded_llm_metadata_keys=list(node.excluded_llm_metadata_keys),
+        relationships=dict(node.relationships),
+        start_char_idx=node.start_char_idx,
+        end_char_idx=end_char_idx,
+    )
+    return NodeWithScore(node=packed, score=hit.score)
+
+
+def pack_nodes(
+    nodes: List[NodeWithScore],
+    budget_tokens: int,
+    count_tokens: TokenCounter,
+    dedup_distance: int = 3,
+    min_chunk_tokens: int = 32,
+) -> Tuple[List[NodeWithScore], int]:
+    """
+    按token预算打包检索结果
+
+    参数:
+        nodes: 检索结果
+        budget_tokens: int - 上下文token预算（含每个分块的元数据，如文件名与页码）
+        count_tokens: 批量token计数函数，见 get_token_counter
+        dedup_distance: int - SimHash汉明距离不超过该值的分块视为近似重复，小于0时不去重
+        min_chunk_tokens: int - 截断后正文少于该token数的分块不放入上下文
+
+    返回:
+        (打包后的节点列表, 上下文token数)
+    """
+    ordered = sorted(nodes, key=lambda n: n.score or 0, reverse=True)
+
+    candidates: List[Tuple[NodeWithScore, str]] = []
+    hashes: List[int] = []
+    for hit in ordered:
+        raw_text = hit.node.get_content()
+        if dedup_distance >= 0:
+            value = simhash(raw_text)
+            if any(hamming_distance(value, other) <= dedup_distance for other in hashes):
+                continue
+            hashes.append(value)
+        candidates.append((hit, raw_text))
+    if len(candidates) < len(ordered):
+        logger.info("上下文丢弃近似重复分块: %d -> %d", len(ordered), len(candidates))
+
+    text_tokens = count_tokens([compress_whitespace(raw_text) for _, raw_text in candidates])
+    # 元数据（文件名、页码）随分块一起进入提示词，计入预算
+    metadata_tokens = count_tokens([hit.node.get_metadata_str(mode=MetadataMode.LLM) for hit, _ in candidates])
+
+    packed: List[NodeWithScore] = []
+    used = 0
+    for (hit, raw_text), n_text, n_meta in zip(candidates, text_tokens, metadata_tokens):
+        if budget_tokens - used < min_chunk_tokens:
+            break
+        remaining = budget_tokens - used - n_meta
+        if remaining < min_chunk_tokens:
+            continue
+        trimmed = n_text > remaining
+        if trimmed:
+            raw_text, n_text = _trim_to_sentences(raw_text, remaining, count_tokens)
+            if n_text < min_chunk_tokens:
+                continue
+        packed.append(_with_text(hit, raw_text, trimmed))
+        used += n_text + n_meta
+    return packed, used
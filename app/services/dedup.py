@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+去重模块
+
+1. 文件级去重：导入前按内容计算SHA-256指纹，未变化的文件直接跳过
+2. 分块级近似去重（可选）：使用64位SimHash识别近似重复的分块，
+   在写入索引时折叠，避免相同段落挤占检索的top-k
+
+SimHash索引按4个16位分段建立倒排，汉明距离不超过3的两个哈希至少有一个分段完全相同，
+因此只需比较分段命中的候选即可。
+"""
+import os
+import hashlib
+import logging
+import sqlite3
+import threading
+from typing import Callable, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.services.embedding_cache import normalize_text
+
+logger = logging.getLogger("app")
+
+SIMHASH_BANDS = 4
+SIMHASH_BAND_BITS = 16
+# SQLite单条语句的参数数量上限（保守取值）
+SQLITE_MAX_PARAMS = 500
+
+
+# ------------------------------ 指纹 ------------------------------
+def file_fingerprint(content: bytes) -> str:
+    """文件内容的SHA-256指纹"""
+    return hashlib.sha256(content).hexdigest()
+
+
+def simhash(text: str, ngram: int = 3) -> int:
+    """
+    计算文本的64位SimHash
+
+    特征为归一化文本的字符n-gram，对中文无需分词；
+    特征哈希的按位投票使用numpy向量化完成。
+    """
+    text = normalize_text(text)
+    if len(text) < ngram:
+        grams = [text]
+    else:
+        grams = [text[i:i + ngram] for i in range(len(text) - ngram + 1)]
+    hashes = np.frombuffer(
+        b"".join(hashlib.blake2b(g.encode("utf-8"), digest_size=8).digest() for g in grams),
+        dtype=np.uint8,
+    ).reshape(len(grams), 8)
+    # 每个特征展开为64个比特，按列统计 1 的数量与 0 的数量之差
+    bits = np.unpackbits(hashes, axis=1).astype(np.int32)
+    votes = bits.sum(axis=0) * 2 - len(grams)
+    value = 0
+    for bit in votes > 0:
+        value = (value << 1) | int(bit)
+    return value
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def _bands(value: int) -> List[int]:
+    mask = (1 << SIMHASH_BAND_BITS) - 1
+    return [(value >> (i * SIMHASH_BAND_BITS)) & mask for i in range(SIMHASH_BANDS)]
+
+
+def _to_signed(value: int) -> int:
+    """SQLite整数为有符号64位"""
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def _to_unsigned(value: int) -> int:
+    return value + (1 << 64) if value < 0 else value
+
+
+# ------------------------------ SimHash索引 ------------------------------
+class SimHashIndex:
+    """已入库分块的SimHash倒排索引（SQLite）"""
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        with self._db:
+            self._db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS simhashes (
+                    node_id TEXT PRIMARY KEY,
+                    ref_doc_id TEXT NOT NULL,
+                    value INTEGER NOT NULL,
+                    b0 INTEGER NOT NULL,
+                    b1 INTEGER NOT NULL,
+                    b2 INTEGER NOT NULL,
+                    b3 INTEGER NOT NULL
+                )
+                """
+            )
+            for i in range(SIMHASH_BANDS):
+                self._db.execute(f"CREATE INDEX IF NOT EXISTS idx_simhashes_b{i} ON simhashes(b{i})")
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_simhashes_ref_doc_id ON simhashes(ref_doc_id)")
+
+    def find(self, value: int, max_distance: int) -> List[str]:
+        """查找与value汉明距离不超过max_distance的已入库分块ID"""
+        bands = _bands(value)
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT node_id, value FROM simhashes WHERE b0 = ? OR b1 = ? OR b2 = ? OR b3 = ?",
+                bands,
+            ).fetchall()
+        return [node_id for node_id, other in rows if hamming_distance(value, _to_unsigned(other)) <= max_distance]
+
+    def add(self, items: Iterable[Tuple[str, str, int]]) -> None:
+        """登记分块：(node_id, ref_doc_id, simhash)"""
+        rows = [(node_id, ref_doc_id, _to_signed(value), *_bands(value)) for node_id, ref_doc_id, value in items]
+        with self._lock:
+            with self._db:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO simhashes (node_id, ref_doc_id, value, b0, b1, b2, b3) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+
+    def delete_ref_docs(self, ref_doc_ids: Sequence[str]) -> None:
+        """删除文档的全部分块登记"""
+        with self._lock:
+            with self._db:
+                for i in range(0, len(ref_doc_ids), SQLITE_MAX_PARAMS):
+                    batch = list(ref_doc_ids[i:i + SQLITE_MAX_PARAMS])
+                    self._db.execute(
+                        f"DELETE FROM simhashes WHERE ref_doc_id IN ({','.join('?' * len(batch))})", batch
+                    )
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+def collapse_near_duplicates(
+    texts: Sequence[str],
+    index: Optional[SimHashIndex],
+    max_distance: int,
+    node_exists: Optional[Callable[[List[str]], List[str]]] = None,
+) -> Tuple[List[int], List[int]]:
+    """
+    折叠近似重复的分块
+
+    参数:
+        texts: Sequence[str] - 待写入的分块文本
+        index: Optional[SimHashIndex] - 已入库分块的SimHash索引，None表示只在本批内去重
+        max_distance: int - 判定为近似重复的最大汉明距离（不超过3时分段检索无遗漏）
+        node_exists: 回调，过滤掉SimHash索引中已被删除的分块ID
+
+    返回:
+        tuple - (保留的分块下标, 对应的SimHash值)
+    """
+    kept, kept_hashes = [], []
+    # 本批内同样按分段分桶，只比较落在同一桶里的候选
+    buckets = [dict() for _ in range(SIMHASH_BANDS)]
+    for i, text in enumerate(texts):
+        value = simhash(text)
+        bands = _bands(value)
+        if any(
+            hamming_distance(value, other) <= max_distance
+            for band, bucket in zip(bands, buckets)
+            for other in bucket.get(band, ())
+        ):
+            continue
+        if index is not None:
+            candidates = index.find(value, max_distance)
+            if candidates and node_exists is not None:
+                candidates = node_exists(candidates)
+            if candidates:
+                continue
+        kept.append(i)
+        kept_hashes.append(value)
+        for band, bucket in zip(bands, buckets):
+            bucket.setdefault(band, []).append(value)
+    return kept, kept_hashes
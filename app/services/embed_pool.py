@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+多进程嵌入工作池模块
+
+单个Python进程里的嵌入模型无法用满多核机器：批量重建索引时，把分块分片到 N 个工作进程，
+每个进程持有自己的嵌入模型，推理线程数固定为 threads_per_worker（N × threads 不超过CPU核数）。
+
+- 向量通过共享内存回传：每个提交创建一块 n × dim 的 float32 共享内存，
+  工作进程把自己那一批的向量直接写入对应的行，进程间只传递共享内存名称与行号，不序列化向量
+- 提交内的文本按长度排序后按 batch_size 切分，同一批的padding最少，各批分散到全部工作进程
+- 工作进程使用 spawn 启动，只导入 embeddings 模块，不加载索引与LLM
+
+本模块只依赖标准库、numpy 与 embeddings 模块。
+"""
+import os
+import logging
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger("app")
+
+# 固定推理线程数的环境变量，需要在导入 torch / onnxruntime 之前设置
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS")
+
+
+# ------------------------------ 工作进程 ------------------------------
+# 子进程内的嵌入模型，由进程池 initializer 创建
+_worker_model = None
+
+
+def _init_worker(backend: str, model_name: str, batch_size: int, quantize: bool, threads: int,
+                 max_length: int, cache_dir: str) -> None:
+    global _worker_model
+
+    for name in THREAD_ENV_VARS:
+        os.environ[name] = str(threads)
+    # 工作进程之间已经并行，分词器不再另开线程
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    if backend == "torch":
+        import torch
+
+        torch.set_num_threads(threads)
+        torch.set_num_interop_threads(1)
+
+    from app.services.embeddings import create_embed_model
+
+    _worker_model = create_embed_model(
+        backend=backend,
+        model_name=model_name,
+        batch_size=batch_size,
+        quantize=quantize,
+        threads=threads,
+        max_length=max_length,
+        cache_dir=cache_dir,
+    )
+
+
+def _embed_rows(shm_name: str, shape: Tuple[int, int], row_start: int, texts: List[str]) -> int:
+    """嵌入一批文本，写入共享内存矩阵的 [row_start, row_start + len(texts)) 行"""
+    vectors = _worker_model.get_text_embedding_batch(texts)
+    shm = SharedMemory(name=shm_name)
+    try:
+        out = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+        out[row_start:row_start + len(texts)] = vectors
+        del out
+    finally:
+        shm.close()
+    return len(texts)
+
+
+# ------------------------------ 主进程 ------------------------------
+class EmbeddingJob:
+    """一次提交的嵌入任务；result() 等待全部批次完成，返回按输入顺序排列的向量矩阵"""
+
+    def __init__(self, shm: SharedMemory, shape: Tuple[int, int], order: List[int], futures: List[Future]):
+        self._shm = shm
+        self._shape = shape
+        self._order = order
+        self._futures = futures
+
+    def done(self) -> bool:
+        return all(future.done() for future in self._futures)
+
+    def result(self) -> np.ndarray:
+        try:
+            for future in self._futures:
+                future.result()
+            vectors = np.empty(self._shape, dtype=np.float32)
+            # 共享内存中按长度排序后的行号 -> 输入下标
+            vectors[self._order] = np.ndarray(self._shape, dtype=np.float32, buffer=self._shm.buf)
+            return vectors
+        finally:
+            self.release()
+
+    def release(self) -> None:
+        """取消未开始的批次并释放共享内存（result() 结束时自动调用）"""
+        if self._shm is None:
+            return
+        for future in self._futures:
+            future.cancel()
+        for future in self._futures:
+            if not future.cancelled():
+                future.exception()
+        self._shm.close()
+        self._shm.unlink()
+        self._shm = None
+
+
+class EmbeddingPool:
+    """
+    多进程嵌入工作池
+
+    参数:
+        workers: int - 工作进程数
+        threads_per_worker: int - 每个工作进程的推理线程数
+        dim: int - 向量维度
+        backend / model_name / quantize / max_length / cache_dir - 见 embeddings.create_embed_model
+        batch_size: int - 每个进程池任务嵌入的文本数
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        threads_per_worker: int,
+        dim: int,
+        backend: str,
+        model_name: str,
+        batch_size: int = 64,
+        quantize: bool = True,
+        max_length: int = 256,
+        cache_dir: str = "",
+    ):
+        self.workers = max(workers, 1)
+        self.threads_per_worker = max(threads_per_worker, 1)
+        self.dim = dim
+        self.batch_size = max(batch_size, 1)
+        # spawn：调用方已加载索引与模型（多线程、持有锁），fork不安全
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(backend, model_name, self.batch_size, quantize, self.threads_per_worker, max_length, cache_dir),
+        )
+        logger.info(
+            "嵌入工作池已启动: %d 个进程 × %d 线程（后端: %s）", self.workers, self.threads_per_worker, backend
+        )
+
+    def submit(self, texts: Sequence[str]) -> EmbeddingJob:
+        """提交一组文本，立即返回；向量写入共享内存，由 EmbeddingJob.result() 取回"""
+        shape = (len(texts), self.dim)
+        shm = SharedMemory(create=True, size=max(len(texts) * self.dim * 4, 1))
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        futures = [
+            self._pool.submit(
+                _embed_rows, shm.name, shape, start, [texts[i] for i in order[start:start + self.batch_size]]
+            )
+            for start in range(0, len(order), self.batch_size)
+        ]
+        return EmbeddingJob(shm, shape, order, futures)
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """同步嵌入，返回 len(texts) × dim 的向量矩阵"""
+        return self.submit(texts).result()
+
+    def warmup(self) -> None:
+        """每个工作进程完成一次嵌入，模型加载不计入后续计时"""
+        self.embed(["warmup"] * self.workers * self.batch_size)
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self) -> "EmbeddingPool":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+嵌入向量缓存模块
+
+按内容寻址的持久化嵌入缓存：键为（嵌入模型名, 嵌入后端, 归一化分块文本的哈希），
+同一段文本无论来自重复上传、新版本书籍还是重新索引，都只嵌入一次；
+同一模型的不同后端（torch / ONNX / ONNX int8）输出的向量不同，不共享缓存。
+
+存储布局（每个嵌入模型与后端一组文件）：
+- <model>-<variant>.f16: float16向量矩阵，使用 numpy.memmap 内存映射，按槽位存放
+- <model>-<variant>.sqlite3: 哈希 -> 槽位 的索引，记录最近使用时间用于LRU淘汰
+"""
+import os
+import re
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+import unicodedata
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger("app")
+
+# SQLite单条语句的参数数量上限（保守取值）
+SQLITE_MAX_PARAMS = 500
+
+
+def normalize_text(text: str) -> str:
+    """文本归一化：NFKC全半角统一，合并连续空白"""
+    text = unicodedata.normalize("NFKC", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class EmbeddingCache:
+    """
+    容量受限的LRU嵌入缓存
+
+    参数:
+        cache_dir: str - 缓存目录
+        model_name: str - 嵌入模型名称，参与缓存键计算
+        variant: str - 嵌入后端（如 torch / onnx-int8），参与缓存键计算
+        dim: int - 向量维度
+        max_entries: int - 最多缓存的向量数量，超出后淘汰最久未使用的条目
+    """
+
+    def __init__(self, cache_dir: str, model_name: str, dim: int, max_entries: int, variant: str = "torch"):
+        self.model_name = model_name
+        self.variant = variant
+        self.dim = dim
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(cache_dir, exist_ok=True)
+        slug = re.sub(r"[^0-9A-Za-z_.-]+", "_", f"{model_name}-{variant}")
+        vectors_path = os.path.join(cache_dir, f"{slug}.f16")
+        mode = "r+" if os.path.exists(vectors_path) else "w+"
+        self._vectors = np.memmap(vectors_path, dtype=np.float16, mode=mode, shape=(max_entries, dim))
+
+        self._db = sqlite3.connect(os.path.join(cache_dir, f"{slug}.sqlite3"), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        with self._db:
+            self._db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS entries (
+                    key BLOB PRIMARY KEY,
+                    slot INTEGER NOT NULL UNIQUE,
+                    last_used REAL NOT NULL
+                )
+                """
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_entries_last_used ON entries(last_used)")
+            # 容量调小后，超出范围的槽位直接丢弃
+            self._db.execute("DELETE FROM entries WHERE slot >= ?", (max_entries,))
+
+        used = {row[0] for row in self._db.execute("SELECT slot FROM entries")}
+        self._free_slots = [slot for slot in range(max_entries - 1, -1, -1) if slot not in used]
+
+    def _key(self, text: str) -> bytes:
+        payload = f"{self.model_name}\0{self.variant}\0{normalize_text(text)}".encode("utf-8")
+        return hashlib.blake2b(payload, digest_size=16).digest()
+
+    def _lookup(self, keys: Sequence[bytes]) -> Dict[bytes, int]:
+        slots = {}
+        for i in range(0, len(keys), SQLITE_MAX_PARAMS):
+            batch = list(keys[i:i + SQLITE_MAX_PARAMS])
+            rows = self._db.execute(
+                f"SELECT key, slot FROM entries WHERE key IN ({','.join('?' * len(batch))})", batch
+            ).fetchall()
+            slots.update(rows)
+        return slots
+
+    def get_many(self, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        """
+        批量查询缓存
+
+        返回:
+            List[Optional[List[float]]] - 与texts一一对应，未命中的位置为None
+        """
+        keys = [self._key(text) for text in texts]
+        with self._lock:
+            slots = self._lookup(keys)
+            now = time.time()
+            with self._db:
+                self._db.executemany(
+                    "UPDATE entries SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in slots],
+                )
+            results = []
+            for key in keys:
+                slot = slots.get(key)
+                results.append(None if slot is None else self._vectors[slot].astype(np.float32).tolist())
+            hits = len([r for r in results if r is not None])
+            self.hits += hits
+            self.misses += len(results) - hits
+        return results
+
+    def put_many(self, texts: Sequence[str], embeddings: Sequence[Sequence[float]]) -> None:
+        """批量写入缓存，容量不足时按LRU淘汰"""
+        entries = {}
+        for text, embedding in zip(texts, embeddings):
+            entries[self._key(text)] = embedding
+        if not entries:
+            return
+
+        with self._lock:
+            existing = self._lookup(list(entries))
+            new_keys = [key for key in entries if key not in existing][: self.max_entries]
+            shortage = len(new_keys) - len(self._free_slots)
+            if shortage > 0:
+                # 先提交淘汰，被淘汰的槽位在目录中不再被引用后才回收复用；
+                # 否则在写入向量与提交目录之间崩溃时，保留下来的键会指向另一段文本的向量
+                with self._db:
+                    evicted = self._db.execute(
+                        "SELECT key, slot FROM entries ORDER BY last_used LIMIT ?", (shortage,)
+                    ).fetchall()
+                    self._db.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key, _ in evicted])
+                self._free_slots.extend(slot for _, slot in evicted)
+                self.evictions += len(evicted)
+
+            # 向量只写入空闲槽位（目录中没有键指向它们），落盘后再提交目录
+            now = time.time()
+            rows = []
+            for key in new_keys[: len(self._free_slots)]:
+                slot = self._free_slots.pop()
+                self._vectors[slot] = np.asarray(entries[key], dtype=np.float16)
+                rows.append((key, slot, now))
+            self._vectors.flush()
+            try:
+                with self._db:
+                    self._db.executemany("INSERT INTO entries (key, slot, last_used) VALUES (?, ?, ?)", rows)
+            except sqlite3.Error:
+                self._free_slots.extend(slot for _, slot, _ in rows)
+                raise
+
+    def stats(self) -> Dict[str, float]:
+        """命中/未命中计数与容量信息"""
+        with self._lock:
+            size = self.max_entries - len(self._free_slots)
+            lookups = self.hits + self.misses
+            return {
+                "model": self.model_name,
+                "variant": self.variant,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "size": size,
+                "max_entries": self.max_entries,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            self._vectors.flush()
+            self._db.close()
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+嵌入模型后端模块
+
+嵌入模型由 EMBED_BACKEND 选择：
+- torch（默认）：LlamaIndex HuggingFaceEmbedding（sentence-transformers），有CUDA时使用GPU
+- onnx：ONNX Runtime 在CPU上推理，可选int8动态量化（EMBED_QUANTIZE），算子内线程数 EMBED_THREADS；
+  首次使用时通过 optimum 导出模型（见 onnx_models），推理不需要torch
+
+onnx 后端与 sentence-transformers 的池化方式一致（mean pooling + L2归一化），
+向量与 torch 后端兼容：余弦相似度 fp32 ≥ 0.9999、int8 ≥ 0.99（COMPAT_MIN_COSINE，
+benchmarks/bench_embed_backends.py 测量），
+同一索引中两种后端写入的向量可以混用。
+
+LazyEmbedding 在首次嵌入（或显式 load()）时才创建实际模型，导入应用时不导入torch、不加载模型权重。
+"""
+import logging
+import threading
+from typing import Any, Callable, List, Optional
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from pydantic import Field, PrivateAttr
+
+from app.services.onnx_models import OnnxSession, export_onnx_model
+
+logger = logging.getLogger("app")
+
+BACKENDS = ("torch", "onnx")
+# onnx 后端向量与 torch 后端向量的最小余弦相似度（容差），按是否int8量化
+COMPAT_MIN_COSINE = {False: 0.9999, True: 0.99}
+
+
+class OnnxEmbedding(BaseEmbedding):
+    """
+    ONNX Runtime 嵌入模型（CPU）
+
+    参数:
+        model_name: str - HuggingFace嵌入模型名称
+        cache_dir: str - ONNX模型导出缓存目录
+        quantize: bool - 是否使用int8动态量化
+        threads: int - 算子内线程数
+        max_length: int - 最大输入token数（与 sentence-transformers 的 max_seq_length 一致）
+        pooling: str - mean / cls
+    """
+
+    max_length: int = Field(default=256, description="最大输入token数")
+    pooling: str = Field(default="mean", description="池化方式: mean / cls")
+    normalize: bool = Field(default=True, description="是否L2归一化")
+
+    _tokenizer: Any = PrivateAttr()
+    _tokenizer_lock: Any = PrivateAttr()
+    _session: OnnxSession = PrivateAttr()
+
+    def __init__(
+        self,
+        model_name: str,
+        cache_dir: str,
+        quantize: bool = True,
+        threads: int = 4,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(model_name=model_name, **kwargs)
+        from transformers import AutoTokenizer
+
+        self._tokenizer = AutoTokenizer.from_pretrained(model_name)
+        # fast tokenizer 并发调用不安全；推理会话本身支持并发
+        self._tokenizer_lock = threading.Lock()
+        path = export_onnx_model(model_name, "feature-extraction", cache_dir, quantize=quantize)
+        self._session = OnnxSession(path, threads)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "OnnxEmbedding"
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        with self._tokenizer_lock:
+            encoded = self._tokenizer(
+                list(texts), padding=True, truncation=True, max_length=self.max_length, return_tensors="np"
+            )
+        hidden = self._session.run(encoded)[0]
+        if self.pooling == "cls":
+            pooled = hidden[:, 0]
+        else:
+            mask = encoded["attention_mask"][..., None].astype(hidden.dtype)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        if self.normalize:
+            pooled = pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled.astype(np.float32).tolist()
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._embed([query])[0]
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._get_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._embed([text])[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(texts)
+
+
+class LazyEmbedding(BaseEmbedding):
+    """
+    延迟创建的嵌入模型代理
+
+    参数:
+        factory: Callable[[], BaseEmbedding] - 创建实际嵌入模型的函数，首次使用时在锁内调用一次
+    """
+
+    _factory: Callable[[], BaseEmbedding] = PrivateAttr()
+    _model: Optional[BaseEmbedding] = PrivateAttr(default=None)
+    _lock: Any = PrivateAttr()
+
+    def __init__(self, factory: Callable[[], BaseEmbedding], **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self._factory = factory
+        self._lock = threading.Lock()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "LazyEmbedding"
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    def load(self) -> BaseEmbedding:
+        """创建（只创建一次）并返回实际的嵌入模型"""
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = self._factory()
+        return self._model
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self.load().get_query_embedding(query)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return await self.load().aget_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self.load().get_text_embedding(text)
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self.load().get_text_embedding_batch(texts)
+
+
+def create_embed_model(
+    backend: str,
+    model_name: str,
+    batch_size: int,
+    quantize: bool = True,
+    threads: int = 4,
+    max_length: int = 256,
+    cache_dir: str = "",
+) -> BaseEmbedding:
+    """按配置创建嵌入模型"""
+    if backend == "torch":
+        # 导入PyTorch用于CUDA检测
+        import torch
+        from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+        logger.info("使用设备进行嵌入计算: %s", device)
+        return HuggingFaceEmbedding(model_name=model_name, embed_batch_size=batch_size, device=device)
+    if backend == "onnx":
+        logger.info("使用ONNX Runtime进行嵌入计算（int8: %s, 线程数: %d）", quantize, threads)
+        return OnnxEmbedding(
+            model_name=model_name,
+            cache_dir=cache_dir,
+            quantize=quantize,
+            threads=threads,
+            max_length=max_length,
+            embed_batch_size=batch_size,
+        )
+    raise ValueError(f"未知的嵌入后端: {backend}，可选值: {', '.join(BACKENDS)}")
@@ -0,0 +1,957 @@
+# -*- coding: utf-8 -*-
+"""
+FAISS向量存储模块
+
+该模块提供基于FAISS的LlamaIndex向量存储实现，用于替代默认的SimpleVectorStore：
+1. 向量以二进制 .faiss 文件持久化，加载时使用内存映射（mmap），
+   启动耗时和常驻内存不随语料规模增长
+2. 追加式持久化：每次写入只生成一个新的向量段（seg-*.faiss），
+   节点文本与元数据写入SQLite目录库，写入代价与新增节点数成正比
+3. 后台压缩：段数量或已删除向量过多时合并向量段；段的规模接近基础索引时
+   将两者合并为新的基础索引，小语料使用精确的Flat索引，语料增长到阈值后重建为IVF/HNSW索引
+
+崩溃一致性：段文件先原子写入磁盘，再在同一个SQLite事务中登记段和节点，
+事务提交前崩溃只会留下未登记的孤立文件，下次打开时自动清理。
+分批写入（StagedBatch）的节点在提交前暂存在磁盘上，一本书的写入不需要在内存中累积全部节点。
+
+向量使用内积（METRIC_INNER_PRODUCT）度量，嵌入模型输出的是归一化向量，
+因此检索得分即余弦相似度，分数越大越相关。
+"""
+import os
+import re
+import json
+import math
+import time
+import logging
+import uuid
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import faiss
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.schema import BaseNode
+from llama_index.core.storage.docstore.utils import doc_to_json, json_to_doc
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    VectorStoreQuery,
+    VectorStoreQueryResult,
+)
+
+logger = logging.getLogger("app")
+
+CATALOG_FILENAME = "catalog.sqlite3"
+SEGMENT_FILE_RE = re.compile(r"^(seg|base)-\d+\.faiss(\.tmp)?$")
+STAGING_FILE_RE = re.compile(r"^staging-[0-9a-f]+\.f32$")
+# 提交暂存批次时每次从暂存文件读入的向量行数
+STAGING_READ_ROWS = 8192
+# SQLite单条语句的参数数量上限（保守取值）
+SQLITE_MAX_PARAMS = 500
+
+
+# ------------------------------ 索引构建 ------------------------------
+def choose_index_kind(n_vectors: int, index_type: str, threshold: int) -> str:
+    """
+    根据向量数量和配置选择索引类型
+
+    参数:
+        n_vectors: int - 向量数量
+        index_type: str - 配置的索引类型：auto / flat / ivf / hnsw
+        threshold: int - 从Flat切换到近似索引的向量数量阈值
+
+    返回:
+        str - 实际使用的索引类型：flat / ivf / hnsw
+    """
+    if index_type == "flat" or n_vectors < threshold:
+        return "flat"
+    if index_type == "hnsw":
+        return "hnsw"
+    # auto 与 ivf 在语料增长后都使用IVF
+    return "ivf"
+
+
+def _ivf_nlist(n_vectors: int) -> int:
+    """IVF聚类中心数量：经验值 4*sqrt(N)，并保证每个中心至少有39个训练样本"""
+    nlist = int(4 * math.sqrt(max(n_vectors, 1)))
+    return max(1, min(nlist, n_vectors // 39))
+
+
+def build_faiss_index(dim: int, kind: str, n_vectors: int = 0, hnsw_m: int = 32) -> faiss.Index:
+    """
+    创建空的FAISS索引，外层使用IndexIDMap2以支持自定义向量ID
+
+    参数:
+        dim: int - 向量维度
+        kind: str - 索引类型：flat / ivf / hnsw
+        n_vectors: int - 预计的向量数量，用于确定IVF聚类中心数量
+        hnsw_m: int - HNSW图中每个节点的邻居数
+
+    返回:
+        faiss.Index - 未添加向量的索引（IVF索引需要先训练）
+    """
+    if kind == "flat":
+        inner = faiss.IndexFlatIP(dim)
+    elif kind == "ivf":
+        inner = faiss.index_factory(dim, f"IVF{_ivf_nlist(n_vectors)},Flat", faiss.METRIC_INNER_PRODUCT)
+    elif kind == "hnsw":
+        inner = faiss.IndexHNSWFlat(dim, hnsw_m, faiss.METRIC_INNER_PRODUCT)
+    else:
+        raise ValueError(f"不支持的FAISS索引类型: {kind}")
+    return faiss.IndexIDMap2(inner)
+
+
+def index_kind_of(index: faiss.Index) -> str:
+    """识别已有索引的类型"""
+    if faiss.try_extract_index_ivf(index) is not None:
+        return "ivf"
+    inner = faiss.downcast_index(index.index) if hasattr(index, "id_map") else faiss.downcast_index(index)
+    if hasattr(inner, "hnsw"):
+        return "hnsw"
+    return "flat"
+
+
+def read_faiss_index(path: str, mmap: bool = True) -> faiss.Index:
+    """
+    从磁盘读取FAISS索引
+
+    参数:
+        path: str - .faiss 文件路径
+        mmap: bool - 是否以只读内存映射方式加载
+
+    返回:
+        faiss.Index - 加载的索引；mmap模式下索引数据不会整体读入内存
+    """
+    if not mmap:
+        return faiss.read_index(path)
+    # IO_FLAG_MMAP 映射IVF倒排表，IO_FLAG_MMAP_IFC 映射Flat/HNSW的向量数据（faiss>=1.10）
+    flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY | getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+    return faiss.read_index(path, flags)
+
+
+def write_faiss_index(index: faiss.Index, path: str) -> None:
+    """
+    原子地将FAISS索引写入磁盘：先写临时文件并fsync，再替换目标文件
+
+    这样写入过程中崩溃不会留下半个索引文件，同时不影响已映射旧文件的读者
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    faiss.write_index(index, tmp_path)
+    with open(tmp_path, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def extract_vectors(index: faiss.Index) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    从IndexIDMap2索引中取出全部向量及其ID
+
+    返回:
+        tuple - (ids: int64数组, vectors: float32矩阵)
+    """
+    ids = faiss.vector_to_array(index.id_map).astype("int64")
+    inner = faiss.downcast_index(index.index)
+    ivf = faiss.try_extract_index_ivf(inner)
+    if ivf is not None:
+        ivf.make_direct_map()
+    vectors = inner.reconstruct_n(0, inner.ntotal)
+    return ids, vectors
+
+
+def _node_to_json(node: BaseNode) -> str:
+    """序列化节点（不包含嵌入向量，向量只保存在FAISS中）"""
+    node_without_embedding = node.model_copy()
+    node_without_embedding.embedding = None
+    return json.dumps(doc_to_json(node_without_embedding), ensure_ascii=False)
+
+
+def _batched(items: Sequence, size: int = SQLITE_MAX_PARAMS):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+# ------------------------------ 分批写入 ------------------------------
+class StagedBatch:
+    """
+    一个分批写入的批次：多次 add 的节点暂存在磁盘上，commit 时作为一个向量段一次性提交
+
+    向量追加写入暂存文件（staging-<id>.f32），节点行写入目录库的 staged_nodes 表，
+    提交前对检索不可见，内存占用与已暂存的节点数无关；中途崩溃的批次在下次打开时清理。
+    """
+
+    def __init__(self, store: "MmapFaissVectorStore"):
+        self.store = store
+        self.batch_id = uuid.uuid4().hex
+        self.vectors_path = os.path.join(store._persist_dir, f"staging-{self.batch_id}.f32")
+        self.count = 0
+        # 提交后节点的向量ID范围 [start, stop)，用于读回已提交的节点
+        self.vids: Optional[Tuple[int, int]] = None
+        self._closed = False
+
+    def add(self, nodes: Sequence[BaseNode]) -> None:
+        """暂存一批已计算嵌入向量的节点"""
+        if not nodes:
+            return
+        embeddings = np.asarray([node.get_embedding() for node in nodes], dtype="float32")
+        if embeddings.shape[1] != self.store._dim:
+            raise ValueError(f"向量维度({embeddings.shape[1]})与索引维度({self.store._dim})不一致")
+        with open(self.vectors_path, "ab") as f:
+            f.write(embeddings.tobytes())
+        rows = [
+            (self.batch_id, self.count + i, node.node_id, node.ref_doc_id, _node_to_json(node),
+             node.metadata.get("chunk_index"))
+            for i, node in enumerate(nodes)
+        ]
+        with self.store._lock:
+            with self.store._db:
+                self.store._db.executemany(
+                    "INSERT INTO staged_nodes (batch_id, seq, node_id, ref_doc_id, node_json, chunk_index) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+        self.count += len(rows)
+
+    def commit(
+        self,
+        replace_ref_doc_ids: Sequence[str] = (),
+        document: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """
+        提交批次：暂存的节点作为一个向量段，与替换删除、文档登记在同一个事务中生效
+
+        参数见 MmapFaissVectorStore.append_batch
+        """
+        try:
+            self.store._commit_staged(self, replace_ref_doc_ids=replace_ref_doc_ids, document=document)
+        except BaseException:
+            self.abort()
+            raise
+        self._remove_file()
+        self._closed = True
+
+    def abort(self) -> None:
+        """放弃批次，删除暂存的节点与向量"""
+        if self._closed:
+            return
+        self._closed = True
+        with self.store._lock:
+            with self.store._db:
+                self.store._db.execute("DELETE FROM staged_nodes WHERE batch_id = ?", (self.batch_id,))
+        self._remove_file()
+
+    def _remove_file(self) -> None:
+        if os.path.exists(self.vectors_path):
+            os.remove(self.vectors_path)
+
+
+# ------------------------------ 向量存储 ------------------------------
+class MmapFaissVectorStore(BasePydanticVectorStore):
+    """
+    基于内存映射FAISS索引的追加式向量存储
+
+    磁盘布局（persist_dir目录下）：
+    - catalog.sqlite3: 段登记表、节点表（文本/元数据）、文档登记表（内容哈希）、元信息
+    - base-<gen>.faiss: 压缩后的基础索引（Flat/IVF/HNSW）
+    - seg-<id>.faiss: 每次写入生成的小型Flat段
+    - staging-<batch>.f32: 未提交批次的暂存向量（节点行暂存在 staged_nodes 表）
+
+    删除只在SQLite中移除节点行（墓碑），检索时过滤，压缩时真正清除向量。
+    """
+
+    stores_text: bool = True
+
+    _persist_dir: str = PrivateAttr()
+    _dim: int = PrivateAttr()
+    _index_type: str = PrivateAttr()
+    _threshold: int = PrivateAttr()
+    _nprobe: int = PrivateAttr()
+    _hnsw_m: int = PrivateAttr()
+    _ef_search: int = PrivateAttr()
+    _use_mmap: bool = PrivateAttr()
+    _compact_segments: int = PrivateAttr()
+    _compact_tombstone_ratio: float = PrivateAttr()
+    _background_compaction: bool = PrivateAttr()
+
+    _db: Any = PrivateAttr()
+    _base: Any = PrivateAttr()
+    _base_file: str = PrivateAttr()
+    _segments: List[Tuple[int, str, Any]] = PrivateAttr()
+    _next_vid: int = PrivateAttr()
+    _next_sid: int = PrivateAttr()
+    _tombstones: int = PrivateAttr()
+    _version: int = PrivateAttr()
+    _lock: Any = PrivateAttr()
+    _compact_lock: Any = PrivateAttr()
+    _compact_thread: Any = PrivateAttr()
+    _local: Any = PrivateAttr()
+
+    def __init__(
+        self,
+        persist_dir: str,
+        dim: int,
+        index_type: str = "auto",
+        threshold: int = 50000,
+        nprobe: int = 16,
+        hnsw_m: int = 32,
+        ef_search: int = 64,
+        use_mmap: bool = True,
+        compact_segments: int = 8,
+        compact_tombstone_ratio: float = 0.2,
+        background_compaction: bool = True,
+    ) -> None:
+        super().__init__()
+        self._persist_dir = persist_dir
+        self._dim = dim
+        self._index_type = index_type
+        self._threshold = threshold
+        self._nprobe = nprobe
+        self._hnsw_m = hnsw_m
+        self._ef_search = ef_search
+        self._use_mmap = use_mmap
+        self._compact_segments = compact_segments
+        self._compact_tombstone_ratio = compact_tombstone_ratio
+        self._background_compaction = background_compaction
+
+        self._lock = threading.RLock()
+        self._compact_lock = threading.Lock()
+        self._compact_thread = None
+        self._local = threading.local()
+        self._open()
+
+    # ---------------------------- 打开与恢复 ----------------------------
+    def _open(self) -> None:
+        """打开目录库，加载基础索引与各段，清理崩溃遗留的孤立文件"""
+        os.makedirs(self._persist_dir, exist_ok=True)
+        self._db = sqlite3.connect(
+            os.path.join(self._persist_dir, CATALOG_FILENAME),
+            check_same_thread=False,
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        with self._db:
+            self._db.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS segments (
+                    id INTEGER PRIMARY KEY,
+                    file TEXT NOT NULL,
+                    n_vectors INTEGER NOT NULL,
+                    created_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS nodes (
+                    vid INTEGER PRIMARY KEY,
+                    node_id TEXT NOT NULL UNIQUE,
+                    ref_doc_id TEXT,
+                    node_json TEXT NOT NULL,
+                    chunk_index INTEGER
+                );
+                CREATE INDEX IF NOT EXISTS idx_nodes_ref_doc_id ON nodes(ref_doc_id);
+                CREATE TABLE IF NOT EXISTS documents (
+                    filename TEXT PRIMARY KEY,
+                    sha256 TEXT NOT NULL,
+                    ref_doc_id TEXT NOT NULL,
+                    chunk_count INTEGER NOT NULL,
+                    updated_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_documents_sha256 ON documents(sha256);
+                CREATE TABLE IF NOT EXISTS staged_nodes (
+                    batch_id TEXT NOT NULL,
+                    seq INTEGER NOT NULL,
+                    node_id TEXT NOT NULL,
+                    ref_doc_id TEXT,
+                    node_json TEXT NOT NULL,
+                    chunk_index INTEGER,
+                    PRIMARY KEY (batch_id, seq)
+                );
+                CREATE TABLE IF NOT EXISTS meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL
+                );
+                """
+            )
+            # 旧版本目录库没有 chunk_index 列（相邻分块索引），补齐后旧节点该列为NULL
+            columns = {row[1] for row in self._db.execute("PRAGMA table_info(nodes)")}
+            if "chunk_index" not in columns:
+                self._db.execute("ALTER TABLE nodes ADD COLUMN chunk_index INTEGER")
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS idx_nodes_chunk ON nodes(ref_doc_id, chunk_index)"
+            )
+            # 上次退出时未提交的批次作废
+            self._db.execute("DELETE FROM staged_nodes")
+
+        meta = dict(self._db.execute("SELECT key, value FROM meta").fetchall())
+        self._next_vid = int(meta.get("next_vid", 0))
+        self._tombstones = int(meta.get("tombstones", 0))
+        self._version = int(meta.get("version", 0))
+        self._base_file = meta.get("base_file", "")
+        self._base = None
+        if self._base_file:
+            self._base = self._read(self._base_file)
+
+        self._segments = []
+        for sid, file in self._db.execute("SELECT id, file FROM segments ORDER BY id"):
+            self._segments.append((sid, file, self._read(file)))
+        self._next_sid = max([sid for sid, _, _ in self._segments], default=0) + 1
+
+        for index in self._indexes():
+            if index.d != self._dim:
+                raise ValueError(f"FAISS索引维度({index.d})与嵌入模型维度({self._dim})不一致")
+
+        self._remove_orphan_files()
+        logger.info(
+            "已打开FAISS向量存储: %s（基础索引: %s, 段数: %d, 向量数: %d, mmap: %s）",
+            self._persist_dir,
+            index_kind_of(self._base) if self._base is not None else "无",
+            len(self._segments),
+            self.ntotal,
+            self._use_mmap,
+        )
+
+    def _read(self, file: str) -> faiss.Index:
+        index = read_faiss_index(os.path.join(self._persist_dir, file), mmap=self._use_mmap)
+        self._apply_search_params(index)
+        return index
+
+    def _apply_search_params(self, index: faiss.Index) -> None:
+        """设置近似索引的检索参数"""
+        ivf = faiss.try_extract_index_ivf(index)
+        if ivf is not None:
+            ivf.nprobe = self._nprobe
+        inner = faiss.downcast_index(index.index)
+        if hasattr(inner, "hnsw"):
+            inner.hnsw.efSearch = self._ef_search
+
+    def _remove_orphan_files(self) -> None:
+        """删除未在目录库中登记的段/基础索引文件与未提交批次的暂存文件（写入或压缩中途崩溃的遗留物）"""
+        referenced = {file for _, file, _ in self._segments}
+        if self._base_file:
+            referenced.add(self._base_file)
+        for name in os.listdir(self._persist_dir):
+            if (SEGMENT_FILE_RE.match(name) or STAGING_FILE_RE.match(name)) and name not in referenced:
+                os.remove(os.path.join(self._persist_dir, name))
+                logger.warning("已清理未登记的索引文件: %s", name)
+
+    def _indexes(self) -> List[faiss.Index]:
+        indexes = [self._base] if self._base is not None else []
+        return indexes + [index for _, _, index in self._segments]
+
+    def _set_meta(self, **values: Any) -> None:
+        self._db.executemany(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+            [(key, str(value)) for key, value in values.items()],
+        )
+
+    # ---------------------------- 基本属性 ----------------------------
+    @property
+    def client(self) -> Any:
+        """返回底层SQLite目录库连接"""
+        return self._db
+
+    @property
+    def ntotal(self) -> int:
+        """FAISS中的向量数量（含尚未压缩清除的已删除向量）"""
+        with self._lock:
+            return sum(index.ntotal for index in self._indexes())
+
+    @property
+    def segment_count(self) -> int:
+        """尚未压缩的段数量"""
+        return len(self._segments)
+
+    @property
+    def version(self) -> int:
+        """数据版本号：每次写入或删除节点后递增（压缩不改变内容，不递增），用于失效查询结果缓存"""
+        return self._version
+
+    def get_meta(self, key: str) -> Optional[str]:
+        """读取目录库中的元信息"""
+        with self._lock:
+            row = self._db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str) -> None:
+        """写入目录库中的元信息"""
+        with self._lock:
+            with self._db:
+                self._set_meta(**{key: value})
+
+    def count(self) -> int:
+        """有效节点数量"""
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM nodes").fetchone()[0]
+
+    # ---------------------------- 写入 ----------------------------
+    def begin_batch(self) -> "StagedBatch":
+        """开始一个分批写入的批次，见 StagedBatch"""
+        return StagedBatch(self)
+
+    @contextmanager
+    def append_batch(
+        self,
+        replace_ref_doc_ids: Sequence[str] = (),
+        document: Optional[Dict[str, Any]] = None,
+    ):
+        """
+        将上下文内的所有 add 调用合并为一个段，在正常退出时一次性提交
+
+        用于一次上传：要么整本书的节点全部可见，要么全部不可见；各次 add 的节点暂存在磁盘上，
+        不在内存中累积
+
+        参数:
+            replace_ref_doc_ids: Sequence[str] - 在同一事务中删除的旧文档，用于原子地替换文件
+            document: Optional[dict] - 在同一事务中登记的文档记录（filename/sha256/ref_doc_id/chunk_count）
+        """
+        if getattr(self._local, "pending", None) is not None:
+            # 嵌套调用时并入外层批次
+            yield
+            return
+        batch = self._local.pending = self.begin_batch()
+        try:
+            yield
+        except BaseException:
+            batch.abort()
+            raise
+        finally:
+            self._local.pending = None
+        batch.commit(replace_ref_doc_ids=replace_ref_doc_ids, document=document)
+
+    def add(self, nodes: Sequence[BaseNode], **add_kwargs: Any) -> List[str]:
+        """
+        添加节点（文本与向量）
+
+        参数:
+            nodes: Sequence[BaseNode] - 已计算嵌入向量的节点
+
+        返回:
+            List[str] - 节点ID列表
+        """
+        if not nodes:
+            return []
+        pending = getattr(self._local, "pending", None)
+        if pending is not None:
+            pending.add(nodes)
+        else:
+            batch = self.begin_batch()
+            batch.add(nodes)
+            batch.commit()
+        return [node.node_id for node in nodes]
+
+    def _commit_staged(
+        self,
+        batch: "StagedBatch",
+        replace_ref_doc_ids: Sequence[str] = (),
+        document: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """将暂存的节点写为一个新段，并在一个事务中登记段、节点、替换删除与文档记录"""
+        n = batch.count
+        if not n and not replace_ref_doc_ids and document is None:
+            return
+
+        file = None
+        if n:
+            with self._lock:
+                sid = self._next_sid
+                self._next_sid += 1
+                start = self._next_vid
+                self._next_vid += n
+            batch.vids = (start, start + n)
+
+            # 段文件写入不持有锁，允许多个上传并行落盘；向量从暂存文件分块读入
+            vectors = np.memmap(batch.vectors_path, dtype="float32", mode="r", shape=(n, self._dim))
+            segment = build_faiss_index(self._dim, "flat")
+            for i in range(0, n, STAGING_READ_ROWS):
+                j = min(i + STAGING_READ_ROWS, n)
+                segment.add_with_ids(
+                    np.ascontiguousarray(vectors[i:j]), np.arange(start + i, start + j, dtype="int64")
+                )
+            del vectors
+            file = f"seg-{sid:08d}.faiss"
+            write_faiss_index(segment, os.path.join(self._persist_dir, file))
+
+        with self._lock:
+            with self._db:
+                # 被替换文档的旧节点、以及同ID的旧节点删除后，其向量变为墓碑
+                removed = 0
+                for ids in _batched(list(replace_ref_doc_ids)):
+                    cursor = self._db.execute(
+                        f"DELETE FROM nodes WHERE ref_doc_id IN ({','.join('?' * len(ids))})", ids
+                    )
+                    removed += cursor.rowcount
+                if file is not None:
+                    cursor = self._db.execute(
+                        "DELETE FROM nodes WHERE node_id IN (SELECT node_id FROM staged_nodes WHERE batch_id = ?)",
+                        (batch.batch_id,),
+                    )
+                    removed += cursor.rowcount
+                    self._db.execute(
+                        "INSERT INTO segments (id, file, n_vectors, created_at) VALUES (?, ?, ?, ?)",
+                        (sid, file, n, time.time()),
+                    )
+                    self._db.execute(
+                        "INSERT INTO nodes (vid, node_id, ref_doc_id, node_json, chunk_index) "
+                        "SELECT ? + seq, node_id, ref_doc_id, node_json, chunk_index FROM staged_nodes "
+                        "WHERE batch_id = ? ORDER BY seq",
+                        (start, batch.batch_id),
+                    )
+                    self._db.execute("DELETE FROM staged_nodes WHERE batch_id = ?", (batch.batch_id,))
+                if document is not None:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO documents (filename, sha256, ref_doc_id, chunk_count, updated_at) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (
+                            document["filename"],
+                            document["sha256"],
+                            document["ref_doc_id"],
+                            document["chunk_count"],
+                            time.time(),
+                        ),
+                    )
+                self._set_meta(
+                    next_vid=self._next_vid, tombstones=self._tombstones + removed, version=self._version + 1
+                )
+            self._tombstones += removed
+            self._version += 1
+            if file is not None:
+                self._segments.append((sid, file, self._read(file)))
+        if file is not None:
+            logger.info("已追加向量段 %s（节点数: %d）", file, n)
+        self._maybe_schedule_compaction()
+
+    # ---------------------------- 文档登记 ----------------------------
+    def get_document(self, filename: str) -> Optional[Dict[str, Any]]:
+        """按文件名查询已登记的文档"""
+        return self._fetch_document("filename", filename)
+
+    def find_document_by_sha256(self, sha256: str) -> Optional[Dict[str, Any]]:
+        """按内容哈希查询已登记的文档"""
+        return self._fetch_document("sha256", sha256)
+
+    def _fetch_document(self, column: str, value: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT filename, sha256, ref_doc_id, chunk_count, updated_at FROM documents WHERE {column} = ?",
+                (value,),
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("filename", "sha256", "ref_doc_id", "chunk_count", "updated_at"), row))
+
+    # ---------------------------- 删除 ----------------------------
+    def _delete_where(self, column: str, values: Sequence[str]) -> int:
+        deleted = 0
+        with self._lock:
+            with self._db:
+                for batch in _batched(list(values)):
+                    cursor = self._db.execute(
+                        f"DELETE FROM nodes WHERE {column} IN ({','.join('?' * len(batch))})", batch
+                    )
+                    deleted += cursor.rowcount
+                    if column == "ref_doc_id":
+                        self._db.execute(
+                            f"DELETE FROM documents WHERE ref_doc_id IN ({','.join('?' * len(batch))})", batch
+                        )
+                if deleted:
+                    self._set_meta(tombstones=self._tombstones + deleted, version=self._version + 1)
+            if deleted:
+                self._tombstones += deleted
+                self._version += 1
+        if deleted:
+            self._maybe_schedule_compaction()
+        return deleted
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        """按ref_doc_id删除该文档的全部节点及其文档登记"""
+        deleted = self._delete_where("ref_doc_id", [ref_doc_id])
+        logger.info("已删除文档 %s 的 %d 个节点", ref_doc_id, deleted)
+
+    def delete_nodes(
+        self,
+        node_ids: Optional[List[str]] = None,
+        filters: Optional[Any] = None,
+        **delete_kwargs: Any,
+    ) -> None:
+        """按节点ID删除节点"""
+        if filters is not None:
+            raise ValueError("FAISS向量存储暂不支持元数据过滤")
+        if node_ids:
+            self._delete_where("node_id", node_ids)
+
+    # ---------------------------- 查询 ----------------------------
+    def _load_nodes(self, column: str, values: Sequence[Any]) -> Dict[Any, BaseNode]:
+        """从目录库批量读取节点，返回 {列值: 节点}"""
+        result = {}
+        with self._lock:
+            for batch in _batched(list(values)):
+                rows = self._db.execute(
+                    f"SELECT {column}, node_json FROM nodes WHERE {column} IN ({','.join('?' * len(batch))})",
+                    batch,
+                ).fetchall()
+                for key, node_json in rows:
+                    result[key] = json_to_doc(json.loads(node_json))
+        return result
+
+    def get_nodes(
+        self,
+        node_ids: Optional[List[str]] = None,
+        filters: Optional[Any] = None,
+    ) -> List[BaseNode]:
+        """按节点ID读取节点"""
+        if filters is not None:
+            raise ValueError("FAISS向量存储暂不支持元数据过滤")
+        if not node_ids:
+            return []
+        nodes = self._load_nodes("node_id", node_ids)
+        return [nodes[node_id] for node_id in node_ids if node_id in nodes]
+
+    def iter_nodes(self, batch_size: int = 1000, vids: Optional[Tuple[int, int]] = None) -> Iterator[BaseNode]:
+        """
+        按写入顺序遍历全部节点（重建派生索引时使用），每批单独持有锁
+
+        vids 为 (start, stop) 时只遍历该向量ID范围内的节点（如一个已提交批次的节点）
+        """
+        last_vid, stop = (-1, None) if vids is None else (vids[0] - 1, vids[1])
+        while True:
+            with self._lock:
+                if stop is None:
+                    rows = self._db.execute(
+                        "SELECT vid, node_json FROM nodes WHERE vid > ? ORDER BY vid LIMIT ?", (last_vid, batch_size)
+                    ).fetchall()
+                else:
+                    rows = self._db.execute(
+                        "SELECT vid, node_json FROM nodes WHERE vid > ? AND vid < ? ORDER BY vid LIMIT ?",
+                        (last_vid, stop, batch_size),
+                    ).fetchall()
+            if not rows:
+                return
+            for vid, node_json in rows:
+                yield json_to_doc(json.loads(node_json))
+            last_vid = rows[-1][0]
+
+    def get_neighbors(self, ref_doc_id: str, first: int, last: int) -> List[BaseNode]:
+        """
+        按分块序号读取同一文档中 [first, last] 范围内的分块（相邻上下文扩展），按序号排列
+
+        使用 (ref_doc_id, chunk_index) 索引，不需要重新检索或嵌入
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT node_json FROM nodes WHERE ref_doc_id = ? AND chunk_index BETWEEN ? AND ? "
+                "ORDER BY chunk_index",
+                (ref_doc_id, first, last),
+            ).fetchall()
+        return [json_to_doc(json.loads(node_json)) for (node_json,) in rows]
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        """
+        检索与查询向量最相似的top k个节点
+
+        参数:
+            query: VectorStoreQuery - 包含查询向量和similarity_top_k
+
+        返回:
+            VectorStoreQueryResult - 节点、相似度（内积）与节点ID
+        """
+        if query.filters is not None:
+            raise ValueError("FAISS向量存储暂不支持元数据过滤")
+
+        with self._lock:
+            # 基础索引与段在创建后不再修改，持有快照即可在锁外并发检索
+            indexes = self._indexes()
+            tombstones = self._tombstones
+        top_k = query.similarity_top_k
+        total = sum(index.ntotal for index in indexes)
+        # 多取一些候选以抵消尚未清除的已删除向量
+        fetch_k = min(total, top_k + min(tombstones, max(4 * top_k, 100)))
+        if fetch_k == 0:
+            return VectorStoreQueryResult(nodes=[], similarities=[], ids=[])
+
+        query_embedding = np.asarray(query.query_embedding, dtype="float32")[np.newaxis, :]
+        candidates = []
+        for index in indexes:
+            k = min(fetch_k, index.ntotal)
+            if k == 0:
+                continue
+            scores, vids = index.search(query_embedding, k)
+            candidates.extend(
+                (float(score), int(vid)) for score, vid in zip(scores[0], vids[0]) if vid >= 0
+            )
+        candidates.sort(key=lambda item: item[0], reverse=True)
+        candidates = candidates[:fetch_k]
+
+        nodes_by_vid = self._load_nodes("vid", [vid for _, vid in candidates])
+        nodes, similarities, ids = [], [], []
+        for score, vid in candidates:
+            node = nodes_by_vid.get(vid)
+            if node is None:
+                continue
+            nodes.append(node)
+            similarities.append(score)
+            ids.append(node.node_id)
+            if len(nodes) >= top_k:
+                break
+        return VectorStoreQueryResult(nodes=nodes, similarities=similarities, ids=ids)
+
+    # ---------------------------- 压缩 ----------------------------
+    def _maybe_schedule_compaction(self) -> None:
+        """段数量或墓碑比例超过阈值时启动后台压缩"""
+        if not self._background_compaction or not self._needs_compaction():
+            return
+        with self._lock:
+            if self._compact_thread is not None and self._compact_thread.is_alive():
+                return
+            self._compact_thread = threading.Thread(
+                target=self._compact_safely, name="faiss-compaction", daemon=True
+            )
+            self._compact_thread.start()
+
+    def _needs_compaction(self) -> bool:
+        total = self.ntotal
+        return len(self._segments) >= self._compact_segments or (
+            total > 0 and self._tombstones / total > self._compact_tombstone_ratio
+        )
+
+    def _compact_safely(self) -> None:
+        try:
+            self.compact()
+        except Exception as e:
+            logger.error("FAISS向量段压缩失败: %s", str(e), exc_info=True)
+
+    def compact(self, major: Optional[bool] = None) -> bool:
+        """
+        合并向量段并清除已删除的向量
+
+        - 小合并：段的向量总数远小于基础索引时，只把所有段合并为一个新的Flat段，
+          代价与新增数据量成正比
+        - 大合并：把基础索引与所有段合并为新的基础索引（按规模选择Flat/IVF/HNSW），
+          同时清除墓碑
+
+        耗时的向量合并与索引训练不持有锁，查询和写入可以并行进行；
+        最后在一个SQLite事务中切换索引并注销已合并的段。
+
+        参数:
+            major: Optional[bool] - 是否强制大合并，None表示自动选择
+
+        返回:
+            bool - 是否执行了压缩
+        """
+        if not self._compact_lock.acquire(blocking=False):
+            return False
+        try:
+            with self._lock:
+                base_file = self._base_file
+                base_total = self._base.ntotal if self._base is not None else 0
+                segments = list(self._segments)
+                tombstones = self._tombstones
+            if not segments and tombstones == 0:
+                return False
+            if major is None:
+                segment_total = sum(index.ntotal for _, _, index in segments)
+                major = (
+                    segment_total * 4 >= base_total
+                    or tombstones > self._compact_tombstone_ratio * (base_total + segment_total)
+                )
+            if not major and len(segments) < 2:
+                return False
+
+            started = time.time()
+            sources = []
+            if major and base_file:
+                # 映射的IVF索引无法建立direct map，压缩时读入内存副本
+                sources.append(read_faiss_index(os.path.join(self._persist_dir, base_file), mmap=False))
+            sources.extend(index for _, _, index in segments)
+            all_ids, all_vectors = [], []
+            for index in sources:
+                if index.ntotal == 0:
+                    continue
+                ids, vectors = extract_vectors(index)
+                all_ids.append(ids)
+                all_vectors.append(vectors)
+
+            with self._lock:
+                live_vids = np.fromiter(
+                    (row[0] for row in self._db.execute("SELECT vid FROM nodes")), dtype="int64"
+                )
+            if all_ids:
+                ids = np.concatenate(all_ids)
+                vectors = np.concatenate(all_vectors)
+                mask = np.isin(ids, live_vids)
+                ids, vectors, purged = ids[mask], vectors[mask], int((~mask).sum())
+            else:
+                ids, vectors, purged = np.empty(0, dtype="int64"), None, 0
+
+            new_file = ""
+            if len(ids) > 0:
+                if major:
+                    kind = choose_index_kind(len(ids), self._index_type, self._threshold)
+                    new_file = f"base-{int(time.time() * 1000):016d}.faiss"
+                else:
+                    kind = "flat"
+                    with self._lock:
+                        new_sid = self._next_sid
+                        self._next_sid += 1
+                    new_file = f"seg-{new_sid:08d}.faiss"
+                merged = build_faiss_index(self._dim, kind, len(ids), self._hnsw_m)
+                if not merged.is_trained:
+                    merged.train(vectors)
+                merged.add_with_ids(vectors, ids)
+                write_faiss_index(merged, os.path.join(self._persist_dir, new_file))
+
+            compacted = {sid for sid, _, _ in segments}
+            with self._lock:
+                with self._db:
+                    for batch in _batched(sorted(compacted)):
+                        self._db.execute(
+                            f"DELETE FROM segments WHERE id IN ({','.join('?' * len(batch))})", batch
+                        )
+                    tombstones = max(0, self._tombstones - purged)
+                    if major:
+                        self._set_meta(base_file=new_file, tombstones=tombstones)
+                    else:
+                        self._set_meta(tombstones=tombstones)
+                        if new_file:
+                            self._db.execute(
+                                "INSERT INTO segments (id, file, n_vectors, created_at) VALUES (?, ?, ?, ?)",
+                                (new_sid, new_file, len(ids), time.time()),
+                            )
+                self._tombstones = tombstones
+                remaining = [seg for seg in self._segments if seg[0] not in compacted]
+                if major:
+                    self._base_file = new_file
+                    self._base = self._read(new_file) if new_file else None
+                    self._segments = remaining
+                else:
+                    merged_segment = [(new_sid, new_file, self._read(new_file))] if new_file else []
+                    self._segments = merged_segment + remaining
+
+            # 已映射旧文件的读者不受删除影响（文件在最后一个映射释放后才真正回收）
+            obsolete = [file for _, file, _ in segments] + ([base_file] if major else [])
+            for file in obsolete:
+                if file and file != new_file:
+                    path = os.path.join(self._persist_dir, file)
+                    if os.path.exists(path):
+                        os.remove(path)
+
+            logger.info(
+                "FAISS向量段%s完成: 合并 %d 个段，清除 %d 个已删除向量，输出 %s（向量数 %d），耗时 %.2fs",
+                "大合并" if major else "小合并",
+                len(segments), purged, new_file or "无", len(ids), time.time() - started,
+            )
+            return True
+        finally:
+            self._compact_lock.release()
+
+    # ---------------------------- 持久化与关闭 ----------------------------
+    def persist(self, persist_path: Optional[str] = None, fs: Optional[Any] = None) -> None:
+        """
+        写入在 add/delete 时已经提交，这里无需任何操作
+
+        保留该方法以兼容 StorageContext.persist 的调用
+        """
+
+    def close(self) -> None:
+        """等待后台压缩结束并关闭目录库"""
+        thread = self._compact_thread
+        if thread is not None:
+            thread.join()
+        with self._lock:
+            self._db.close()
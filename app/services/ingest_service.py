@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+文档导入服务模块
+
+编排一次PDF上传的完整导入流程，保证重复上传是幂等的：
+1. 在任何解析/嵌入工作之前，按文件内容计算SHA-256指纹
+2. 同名且内容未变化的文件：不做任何处理
+3. 内容与已导入的其他文件完全相同：不重复导入；该文件名之前导入的旧内容一并删除，
+   避免旧分块继续以该文件名被检索到
+4. 同名但内容变化的文件：在同一事务中删除旧节点（按ref_doc_id）并写入新节点
+"""
+import logging
+from typing import Any, Callable, Dict, Optional
+
+from app.services.dedup import file_fingerprint
+from app.services.pdf_service import pdf_to_documents, save_pdf
+from app.services.vector_service import (
+    add_documents_to_index,
+    delete_document,
+    find_document_by_sha256,
+    get_document_record,
+)
+
+logger = logging.getLogger("app")
+
+
+def ingest_pdf_bytes(
+    filename: str,
+    content: bytes,
+    progress: Optional[Callable[..., None]] = None,
+) -> Dict[str, Any]:
+    """
+    导入一个PDF文件
+
+    参数:
+        filename: str - 文件名
+        content: bytes - 文件内容
+        progress: 进度回调，见 app.services.job_service.JobProgress
+
+    返回:
+        dict - status: indexed / replaced / unchanged / duplicate，以及分块数量等信息
+    """
+    sha256 = file_fingerprint(content)
+
+    existing = get_document_record(filename)
+    if existing is not None and existing["sha256"] == sha256:
+        logger.info("文件未变化，跳过导入: %s", filename)
+        return {"status": "unchanged", "filename": filename, "chunks": existing["chunk_count"]}
+
+    duplicate = find_document_by_sha256(sha256)
+    if duplicate is not None and duplicate["filename"] != filename:
+        logger.info("文件内容与已导入的 %s 相同，跳过导入: %s", duplicate["filename"], filename)
+        if existing is not None:
+            # 同名文件的旧版本已被新内容取代，删除旧分块
+            delete_document(existing["ref_doc_id"])
+            logger.info("已删除 %s 的旧版本: %s", filename, existing["ref_doc_id"])
+        return {
+            "status": "duplicate",
+            "filename": filename,
+            "duplicate_of": duplicate["filename"],
+            "chunks": duplicate["chunk_count"],
+            "replaced": existing is not None,
+        }
+
+    pdf_path = save_pdf(filename, content)
+    # 以内容哈希作为文档ID：同一PDF的全部分块共享该ref_doc_id；
+    # docs 是边提取边分块的生成器，由 add_documents_to_index 按批嵌入并暂存，不在内存中累积整本书
+    docs = pdf_to_documents(pdf_path, filename, doc_id=sha256, progress=progress)
+
+    replace_ref_doc_ids = [existing["ref_doc_id"]] if existing is not None else []
+    chunk_count = add_documents_to_index(
+        docs,
+        replace_ref_doc_ids=replace_ref_doc_ids,
+        document={"filename": filename, "sha256": sha256, "ref_doc_id": sha256},
+        progress=progress,
+    )
+    status = "replaced" if existing is not None else "indexed"
+    logger.info("文件导入完成: %s（%s, 分块数: %d）", filename, status, chunk_count)
+    return {"status": status, "filename": filename, "chunks": chunk_count}
+
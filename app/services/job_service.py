@@ -0,0 +1,334 @@
+# -*- coding: utf-8 -*-
+"""
+后台导入任务队列模块
+
+上传接口只负责暂存文件并登记任务，立即返回任务ID；解析、分块、嵌入与写入索引
+由工作线程池在后台完成：
+1. 任务持久化在本地SQLite队列中，服务重启后未完成的任务重新排队
+   （导入流程按内容指纹幂等，重复执行是安全的）；已执行 max_attempts 次的任务标记为失败，
+   避免导致进程崩溃的文件在每次重启后无限重试
+2. 同时运行的任务数受 JOB_WORKERS 限制；同一文件名或同一内容指纹的任务串行执行，
+   内容相同的两个文件不会同时通过重复检查而被重复导入
+3. 任务进度（阶段、已提取页数、已嵌入分块数、吞吐）通过 /api/jobs/{id} 查询
+"""
+import os
+import json
+import time
+import uuid
+import hashlib
+import logging
+import sqlite3
+import threading
+from typing import Any, BinaryIO, Dict, List, Optional
+
+from app.config import config
+from app.logger.request_context import request_id_var
+from app.services.ingest_service import ingest_pdf_bytes
+
+logger = logging.getLogger("app")
+
+# 任务状态
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# 进度写入SQLite的最小间隔（秒），阶段变化时立即写入
+PROGRESS_FLUSH_INTERVAL = 0.5
+# 暂存上传文件时每次复制的字节数
+UPLOAD_COPY_BLOCK_SIZE = 1024 * 1024
+
+_COUNTERS = ("pages_done", "pages_total", "chunks_embedded", "chunks_total")
+
+
+class JobProgress:
+    """
+    导入进度回调：progress(stage=None, **counters)
+
+    计数器保存在内存中，按 PROGRESS_FLUSH_INTERVAL 节流写入任务表
+    """
+
+    def __init__(self, queue: "JobQueue", job_id: str):
+        self._queue = queue
+        self._job_id = job_id
+        self._fields: Dict[str, Any] = {}
+        self._last_flush = 0.0
+
+    def __call__(self, stage: Optional[str] = None, **counters: int) -> None:
+        now = time.time()
+        if stage is not None:
+            self._fields["stage"] = stage
+            if stage == "embedding":
+                self._fields["embed_started_at"] = now
+        for key, value in counters.items():
+            if key in _COUNTERS:
+                self._fields[key] = value
+        if stage is not None or now - self._last_flush >= PROGRESS_FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._fields:
+            self._queue.update(self._job_id, **self._fields)
+            self._fields = {}
+        self._last_flush = time.time()
+
+
+class JobQueue:
+    """
+    基于SQLite的持久化导入任务队列与工作线程池
+
+    参数:
+        db_path: str - 任务数据库路径
+        upload_dir: str - 上传文件暂存目录，任务结束后删除暂存文件
+        workers: int - 工作线程数量
+        max_attempts: int - 任务执行次数上限，超过后重启时不再重新排队
+    """
+
+    def __init__(self, db_path: str, upload_dir: str, workers: int, max_attempts: int = 3):
+        self.upload_dir = upload_dir
+        self.workers = max(workers, 1)
+        self.max_attempts = max(max_attempts, 1)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._stopping = False
+        self._threads: List[threading.Thread] = []
+
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        os.makedirs(upload_dir, exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        with self._db:
+            self._db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    filename TEXT NOT NULL,
+                    upload_path TEXT NOT NULL,
+                    sha256 TEXT,
+                    status TEXT NOT NULL,
+                    stage TEXT NOT NULL,
+                    pages_done INTEGER NOT NULL DEFAULT 0,
+                    pages_total INTEGER NOT NULL DEFAULT 0,
+                    chunks_embedded INTEGER NOT NULL DEFAULT 0,
+                    chunks_total INTEGER NOT NULL DEFAULT 0,
+                    result TEXT,
+                    error TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    embed_started_at REAL,
+                    finished_at REAL
+                )
+                """
+            )
+            # 旧版本任务表没有 sha256 列，补齐后旧任务该列为NULL（只按文件名串行）
+            columns = {row[1] for row in self._db.execute("PRAGMA table_info(jobs)")}
+            if "sha256" not in columns:
+                self._db.execute("ALTER TABLE jobs ADD COLUMN sha256 TEXT")
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, created_at)")
+            # 上次退出时仍在运行的任务：未达到次数上限的重新排队，其余标记为失败
+            abandoned = self._db.execute(
+                "UPDATE jobs SET status = ?, stage = ?, error = ?, finished_at = ? WHERE status = ? AND attempts >= ?",
+                (FAILED, FAILED, f"导入任务 {self.max_attempts} 次执行均被中断", time.time(), RUNNING, self.max_attempts),
+            ).rowcount
+            recovered = self._db.execute(
+                "UPDATE jobs SET status = ?, stage = ? WHERE status = ?", (QUEUED, QUEUED, RUNNING)
+            ).rowcount
+        if abandoned:
+            logger.warning("导入任务多次执行均被中断，标记为失败: %d", abandoned)
+        if recovered:
+            logger.info("重新排队未完成的导入任务: %d", recovered)
+
+    # ------------------------------ 任务表 ------------------------------
+    def submit(self, filename: str, fileobj: BinaryIO) -> Dict[str, Any]:
+        """
+        暂存上传文件并登记任务，返回任务信息
+
+        文件按块复制到暂存目录并同时计算SHA-256，不把整个文件读入内存；
+        包含磁盘写入与fsync，在异步路由中需放到线程池执行
+        """
+        job_id = uuid.uuid4().hex
+        upload_path = os.path.join(self.upload_dir, f"{job_id}.pdf")
+        digest = hashlib.sha256()
+        with open(upload_path, "wb") as f:
+            while True:
+                block = fileobj.read(UPLOAD_COPY_BLOCK_SIZE)
+                if not block:
+                    break
+                digest.update(block)
+                f.write(block)
+            f.flush()
+            os.fsync(f.fileno())
+        sha256 = digest.hexdigest()
+
+        with self._wakeup:
+            with self._db:
+                self._db.execute(
+                    "INSERT INTO jobs (id, filename, upload_path, sha256, status, stage, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (job_id, filename, upload_path, sha256, QUEUED, QUEUED, time.time()),
+                )
+            self._wakeup.notify()
+        logger.info("导入任务已登记: %s（%s）", job_id, filename)
+        return self.get(job_id)
+
+    def update(self, job_id: str, **fields: Any) -> None:
+        if not fields:
+            return
+        assignments = ", ".join(f"{key} = ?" for key in fields)
+        with self._lock:
+            with self._db:
+                self._db.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """任务详情，包含吞吐（pages_per_sec / chunks_per_sec）"""
+        with self._lock:
+            row = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _job_to_dict(row) if row is not None else None
+
+    def list(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """最近的任务，按登记时间倒序"""
+        with self._lock:
+            rows = self._db.execute("SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+        return [_job_to_dict(row) for row in rows]
+
+    def counts(self) -> Dict[str, int]:
+        """各状态的任务数量"""
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+    def _claim(self) -> Optional[sqlite3.Row]:
+        """取出最早登记的任务并标记为运行中；同一文件名或同一内容指纹已有任务在运行时跳过"""
+        row = self._db.execute(
+            """
+            SELECT * FROM jobs AS j
+            WHERE j.status = ? AND NOT EXISTS (
+                SELECT 1 FROM jobs AS r
+                WHERE r.status = ? AND (r.filename = j.filename OR r.sha256 = j.sha256)
+            )
+            ORDER BY j.created_at LIMIT 1
+            """,
+            (QUEUED, RUNNING),
+        ).fetchone()
+        if row is None:
+            return None
+        with self._db:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, stage = ?, attempts = attempts + 1, started_at = ? WHERE id = ?",
+                (RUNNING, "starting", time.time(), row["id"]),
+            )
+        return row
+
+    # ------------------------------ 工作线程 ------------------------------
+    def start(self) -> None:
+        with self._lock:
+            self._stopping = False
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"ingest-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info("导入任务工作线程已启动: %d", self.workers)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """停止工作线程；运行中的任务在下次启动时重新排队"""
+        with self._wakeup:
+            self._stopping = True
+            self._wakeup.notify_all()
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+        # 仍在执行的任务会继续写进度，此时不关闭数据库连接（进程退出时释放）
+        if all(not thread.is_alive() for thread in self._threads):
+            with self._lock:
+                self._db.close()
+        self._threads = []
+
+    def _worker(self) -> None:
+        while True:
+            with self._wakeup:
+                row = None
+                while not self._stopping:
+                    row = self._claim()
+                    if row is not None:
+                        break
+                    # 任务结束后同名任务可能变为可执行，定时重试
+                    self._wakeup.wait(timeout=1.0)
+                if self._stopping:
+                    return
+            self._run(row)
+
+    def _run(self, row: sqlite3.Row) -> None:
+        job_id = row["id"]
+        # 导入过程中的日志以任务ID作为请求ID
+        token = request_id_var.set(job_id)
+        progress = JobProgress(self, job_id)
+        logger.info("开始执行导入任务: %s（%s）", job_id, row["filename"])
+        try:
+            with open(row["upload_path"], "rb") as f:
+                content = f.read()
+            result = ingest_pdf_bytes(row["filename"], content, progress=progress)
+        except Exception as e:
+            logger.error("导入任务失败: %s: %s", job_id, str(e), exc_info=True)
+            progress.flush()
+            self.update(job_id, status=FAILED, stage=FAILED, error=str(e), finished_at=time.time())
+        else:
+            progress.flush()
+            self.update(
+                job_id,
+                status=DONE,
+                stage=DONE,
+                result=json.dumps(result, ensure_ascii=False),
+                finished_at=time.time(),
+            )
+            logger.info("导入任务完成: %s（%s）", job_id, result["status"])
+        try:
+            os.remove(row["upload_path"])
+        except OSError:
+            pass
+        request_id_var.reset(token)
+        with self._wakeup:
+            self._wakeup.notify_all()
+
+
+def _job_to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+    job = {key: row[key] for key in row.keys() if key not in ("upload_path", "sha256", "result")}
+    job["result"] = json.loads(row["result"]) if row["result"] else None
+
+    now = row["finished_at"] or time.time()
+    started = row["started_at"]
+    embed_started = row["embed_started_at"]
+    extract_seconds = ((embed_started or now) - started) if started else 0
+    embed_seconds = (now - embed_started) if embed_started else 0
+    job["elapsed_seconds"] = round(now - started, 3) if started else 0.0
+    job["pages_per_sec"] = round(row["pages_done"] / extract_seconds, 2) if extract_seconds > 0 else None
+    job["chunks_per_sec"] = round(row["chunks_embedded"] / embed_seconds, 2) if embed_seconds > 0 else None
+    return job
+
+
+# ------------------------------ 对外函数 ------------------------------
+job_queue: Optional[JobQueue] = None
+
+
+def start() -> None:
+    """应用启动时创建任务队列并启动工作线程"""
+    global job_queue
+    if job_queue is None:
+        job_queue = JobQueue(
+            config.JOB_DB_PATH, config.JOB_UPLOAD_DIR, config.JOB_WORKERS, config.JOB_MAX_ATTEMPTS
+        )
+        job_queue.start()
+
+
+def stop() -> None:
+    """应用关闭时停止工作线程"""
+    global job_queue
+    if job_queue is not None:
+        job_queue.stop()
+        job_queue = None
+
+
+def get_queue() -> JobQueue:
+    if job_queue is None:
+        raise RuntimeError("导入任务队列尚未启动")
+    return job_queue
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+Prometheus 指标模块
+
+各阶段耗时直方图（秒）：
+- 导入：PDF文本提取、分块（每个文件一次）、嵌入批次（document：导入分块，query：查询嵌入）
+- 查询：向量检索（含BM25与RRF融合）、重排序、LLM首字延迟（流式）与总耗时
+- HTTP：按路由模板与状态码统计的请求耗时
+
+仪表（gauge）在 /metrics 抓取时更新：向量数量、节点数量、索引目录大小、导入队列深度、进行中的查询数、丢弃的日志条数。
+LLM客户端（app/llm/resilient_client.py）记录重试次数、最终失败次数、对冲请求数与token限流等待时间，熔断器状态在变化时更新。
+指标注册在默认的 REGISTRY 中，由 app/routes/metrics.py 输出。
+"""
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+from prometheus_client import Counter, Gauge, Histogram
+
+# 查询阶段（毫秒级）与导入阶段（秒到分钟级）使用不同的桶
+QUERY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0, 120.0)
+INGEST_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+PDF_EXTRACT_SECONDS = Histogram(
+    "rag_pdf_extract_seconds", "PDF文本提取耗时（每个文件）", buckets=INGEST_BUCKETS
+)
+CHUNKING_SECONDS = Histogram(
+    "rag_chunking_seconds", "文本分块与节点转换耗时（每个文件）", buckets=INGEST_BUCKETS
+)
+EMBED_BATCH_SECONDS = Histogram(
+    "rag_embed_batch_seconds", "嵌入批次耗时", ["kind"], buckets=QUERY_BUCKETS + (30.0, 60.0)
+)
+VECTOR_SEARCH_SECONDS = Histogram(
+    "rag_vector_search_seconds", "向量检索耗时（含BM25检索与RRF融合）", buckets=QUERY_BUCKETS
+)
+RERANK_SECONDS = Histogram("rag_rerank_seconds", "交叉编码器重排序耗时", buckets=QUERY_BUCKETS)
+LLM_TTFT_SECONDS = Histogram("rag_llm_ttft_seconds", "LLM首字延迟（流式）", buckets=LLM_BUCKETS)
+LLM_SECONDS = Histogram("rag_llm_seconds", "LLM生成总耗时", ["mode"], buckets=LLM_BUCKETS)
+HTTP_REQUEST_SECONDS = Histogram(
+    "rag_http_request_seconds", "HTTP请求耗时", ["method", "route", "status"], buckets=QUERY_BUCKETS + LLM_BUCKETS[7:]
+)
+
+EMBEDDED_CHUNKS = Counter("rag_embedded_chunks_total", "嵌入模型实际嵌入的分块数（不含嵌入缓存命中）")
+CHUNK_LOCATE_MISSES = Counter("rag_chunk_locate_misses_total", "无法在原文中精确定位的分块数（其偏移与页码为近似值）")
+QUERIES_COALESCED = Counter("rag_queries_coalesced_total", "合并到进行中的相同查询的请求数", ["mode"])
+LLM_RETRIES = Counter("rag_llm_retries_total", "LLM请求重试次数", ["reason"])
+LLM_ERRORS = Counter("rag_llm_errors_total", "LLM调用最终失败次数（按错误类型）", ["error"])
+LLM_HEDGED = Counter("rag_llm_hedged_requests_total", "超过延迟阈值后发出的对冲请求数")
+LLM_RATE_LIMIT_WAIT_SECONDS = Histogram(
+    "rag_llm_rate_limit_wait_seconds", "客户端token限流的等待时间", buckets=QUERY_BUCKETS + (30.0, 60.0)
+)
+
+INDEX_VECTORS = Gauge("rag_index_vectors", "向量索引中的向量数量")
+INDEX_NODES = Gauge("rag_index_nodes", "向量索引中的节点数量")
+INDEX_SIZE_BYTES = Gauge("rag_index_size_bytes", "向量存储目录大小（字节）")
+JOB_QUEUE_DEPTH = Gauge("rag_job_queue_depth", "排队中的导入任务数")
+JOBS_RUNNING = Gauge("rag_jobs_running", "运行中的导入任务数")
+QUERIES_IN_FLIGHT = Gauge("rag_queries_in_flight", "正在处理的查询数")
+LLM_CIRCUIT_OPEN = Gauge("rag_llm_circuit_open", "LLM熔断器是否打开（1：打开或半开）")
+LOG_RECORDS_DROPPED = Gauge("rag_log_records_dropped", "日志队列满时丢弃的日志条数（进程启动以来）")
+
+
+@contextmanager
+def observe(histogram, **labels: str) -> Iterator[None]:
+    """记录代码块耗时（秒）到直方图"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        (histogram.labels(**labels) if labels else histogram).observe(time.perf_counter() - started)
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+ONNX Runtime 模型工具
+
+HuggingFace模型首次使用时通过 optimum 导出为ONNX，可选int8动态量化，
+导出结果缓存在 ONNX_CACHE_DIR 下，之后直接加载；推理只依赖 onnxruntime 与分词器，不需要torch。
+
+可选依赖：pip install "optimum[onnxruntime]"
+"""
+import os
+import re
+import logging
+import threading
+from typing import Dict, List
+
+logger = logging.getLogger("app")
+
+# 导出任务 -> optimum 模型类
+_EXPORT_CLASSES = {
+    "feature-extraction": "ORTModelForFeatureExtraction",
+    "text-classification": "ORTModelForSequenceClassification",
+}
+_export_lock = threading.Lock()
+
+
+def _require_onnxruntime():
+    try:
+        import onnxruntime
+    except ImportError as e:
+        raise ImportError('ONNX后端需要安装 onnxruntime: pip install "optimum[onnxruntime]"') from e
+    return onnxruntime
+
+
+def export_onnx_model(model_name: str, task: str, cache_dir: str, quantize: bool = True) -> str:
+    """
+    导出（或复用已导出的）ONNX模型，返回 .onnx 文件路径
+
+    参数:
+        model_name: str - HuggingFace模型名称
+        task: str - feature-extraction（嵌入模型）/ text-classification（交叉编码器）
+        cache_dir: str - 导出缓存目录
+        quantize: bool - 是否进行int8动态量化（权重int8，激活在运行时量化）
+    """
+    slug = re.sub(r"[^0-9A-Za-z_.-]+", "_", model_name)
+    model_dir = os.path.join(cache_dir, slug)
+    fp32_path = os.path.join(model_dir, "model.onnx")
+    int8_path = os.path.join(model_dir, "model_int8.onnx")
+    target = int8_path if quantize else fp32_path
+
+    with _export_lock:
+        if os.path.exists(target):
+            return target
+
+        if not os.path.exists(fp32_path):
+            try:
+                import optimum.onnxruntime as ort_models
+            except ImportError as e:
+                raise ImportError('导出ONNX模型需要安装 optimum: pip install "optimum[onnxruntime]"') from e
+            logger.info("导出ONNX模型: %s（%s）", model_name, task)
+            model = getattr(ort_models, _EXPORT_CLASSES[task]).from_pretrained(model_name, export=True)
+            model.save_pretrained(model_dir)
+
+        if quantize:
+            _require_onnxruntime()
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+
+            logger.info("int8动态量化ONNX模型: %s", model_name)
+            quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+    return target
+
+
+class OnnxSession:
+    """
+    ONNX Runtime 推理会话（CPU）
+
+    参数:
+        path: str - .onnx 文件路径
+        threads: int - 单次推理的算子内线程数（intra_op_num_threads）
+    """
+
+    def __init__(self, path: str, threads: int):
+        ort = _require_onnxruntime()
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = max(threads, 1)
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self._session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_names = [i.name for i in self._session.get_inputs()]
+        self.path = path
+
+    def run(self, encoded: Dict) -> List:
+        """以分词器输出（return_tensors="np"）为输入推理，只传入模型声明的输入"""
+        feed = {name: encoded[name].astype("int64") for name in self.input_names if name in encoded}
+        return self._session.run(None, feed)
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+PDF文本提取模块
+
+按页流式提取PDF文本：iter_pdf_pages 是一个页面生成器，分块器按页窗口增量消费，
+内存占用只与窗口内的页数相关，而不是整本书的文本。
+
+- 页数较多的PDF按页区间分发到进程池并行提取，按页序返回结果，
+  同时在途的页区间数量有上限，保证内存有界
+- 提取后端通过 PDF_BACKEND 选择：pypdf2（默认）/ pypdfium2 / pdfminer，
+  后两者为可选依赖，未安装时给出明确的错误信息
+
+本模块只依赖标准库与PDF解析库，子进程导入开销很小。
+"""
+import os
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterator, List, Optional, Tuple
+
+BACKENDS = ("pypdf2", "pypdfium2", "pdfminer")
+
+
+# ------------------------------ 提取后端 ------------------------------
+class _PyPDF2Document:
+    def __init__(self, path: str):
+        from PyPDF2 import PdfReader
+
+        self._reader = PdfReader(path)
+
+    def page_count(self) -> int:
+        return len(self._reader.pages)
+
+    def extract(self, start: int, stop: int) -> List[str]:
+        return [self._reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+class _PdfiumDocument:
+    def __init__(self, path: str):
+        try:
+            import pypdfium2
+        except ImportError as e:
+            raise ImportError("PDF_BACKEND=pypdfium2 需要安装 pypdfium2: pip install pypdfium2") from e
+        self._pdf = pypdfium2.PdfDocument(path)
+
+    def page_count(self) -> int:
+        return len(self._pdf)
+
+    def extract(self, start: int, stop: int) -> List[str]:
+        texts = []
+        for i in range(start, stop):
+            page = self._pdf[i]
+            textpage = page.get_textpage()
+            texts.append(textpage.get_text_range())
+            textpage.close()
+            page.close()
+        return texts
+
+
+class _PdfminerDocument:
+    def __init__(self, path: str):
+        try:
+            from pdfminer.high_level import extract_text
+            from pdfminer.pdfpage import PDFPage
+        except ImportError as e:
+            raise ImportError("PDF_BACKEND=pdfminer 需要安装 pdfminer.six: pip install pdfminer.six") from e
+        self._path = path
+        self._extract_text = extract_text
+        with open(path, "rb") as f:
+            self._page_count = sum(1 for _ in PDFPage.get_pages(f))
+
+    def page_count(self) -> int:
+        return self._page_count
+
+    def extract(self, start: int, stop: int) -> List[str]:
+        # pdfminer 在每页文本之后输出换页符 \f
+        text = self._extract_text(self._path, page_numbers=list(range(start, stop)))
+        pages = text.split("\f")
+        return (pages + [""] * (stop - start))[: stop - start]
+
+
+def open_pdf(path: str, backend: str = "pypdf2"):
+    """按后端名称打开PDF，返回支持 page_count() / extract(start, stop) 的文档对象"""
+    if backend == "pypdf2":
+        return _PyPDF2Document(path)
+    if backend == "pypdfium2":
+        return _PdfiumDocument(path)
+    if backend == "pdfminer":
+        return _PdfminerDocument(path)
+    raise ValueError(f"未知的PDF提取后端: {backend}，可选值: {', '.join(BACKENDS)}")
+
+
+# ------------------------------ 进程池 ------------------------------
+# 子进程内打开的文档，由进程池 initializer 设置，同一进程内的页区间复用
+_worker_document = None
+
+
+def _init_worker(path: str, backend: str) -> None:
+    global _worker_document
+    _worker_document = open_pdf(path, backend)
+
+
+def _extract_range(start: int, stop: int) -> List[str]:
+    return _worker_document.extract(start, stop)
+
+
+def iter_pdf_pages(
+    path: str,
+    backend: str = "pypdf2",
+    workers: int = 1,
+    parallel_min_pages: int = 50,
+    pages_per_task: int = 16,
+    progress: Optional[Callable[..., None]] = None,
+) -> Iterator[Tuple[int, str]]:
+    """
+    按页序逐页产出 (页码, 文本)，页码从1开始
+
+    参数:
+        path: str - PDF文件路径
+        backend: str - 提取后端
+        workers: int - 进程池大小，不超过1时串行提取
+        parallel_min_pages: int - 页数不少于该值时才使用进程池
+        pages_per_task: int - 每个进程池任务提取的页数
+        progress: 进度回调，每页产出后报告 pages_done / pages_total
+    """
+    document = open_pdf(path, backend)
+    pages_total = document.page_count()
+
+    if workers <= 1 or pages_total < parallel_min_pages:
+        batches = (
+            (start, document.extract(start, min(start + pages_per_task, pages_total)))
+            for start in range(0, pages_total, pages_per_task)
+        )
+        yield from _emit(batches, pages_total, progress)
+        return
+
+    del document
+    # spawn：调用方可能是持有锁的多线程进程（Web服务、导入工作线程），fork不安全
+    pool = ProcessPoolExecutor(
+        max_workers=min(workers, os.cpu_count() or 1),
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(path, backend),
+    )
+    try:
+        yield from _emit(_ordered_ranges(pool, pages_total, pages_per_task, workers * 2), pages_total, progress)
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def _ordered_ranges(pool: ProcessPoolExecutor, pages_total: int, pages_per_task: int, window: int):
+    """按页序产出 (起始页下标, 页文本列表)；在途任务不超过 window 个"""
+    starts = iter(range(0, pages_total, pages_per_task))
+    pending = deque()
+
+    def submit_next() -> None:
+        start = next(starts, None)
+        if start is not None:
+            pending.append((start, pool.submit(_extract_range, start, min(start + pages_per_task, pages_total))))
+
+    for _ in range(window):
+        submit_next()
+    while pending:
+        start, future = pending.popleft()
+        texts = future.result()
+        submit_next()
+        yield start, texts
+
+
+def _emit(batches, pages_total: int, progress: Optional[Callable[..., None]]) -> Iterator[Tuple[int, str]]:
+    for start, texts in batches:
+        for offset, text in enumerate(texts):
+            page_no = start + offset + 1
+            yield page_no, text
+            if progress is not None:
+                progress(pages_done=page_no, pages_total=pages_total)
@@ -4,13 +4,19 @@ PDF处理服务模块
 
 该模块负责PDF文件的处理，包括：
 1. PDF文件的保存与存储
-2. PDF文本内容的提取
-3. 文本内容的分块处理
+2. PDF文本内容的提取（按页流式提取，大文件使用进程池并行，见 pdf_extract.py）
+3. 文本内容的分块处理（按页窗口增量分块，不拼接整本书的文本），
+   记录每个分块的页码、在全文中的字符偏移与分块序号
 4. 转换为LlamaIndex可处理的Document节点
 
 是RAG系统中文本数据预处理的核心组件
 """
 import os
+import re
+import time
+import logging
+from bisect import bisect_right
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 # 导入配置类
 from app.config import config, BASE_DIR
 
@@ -20,9 +26,13 @@ CHUNK_OVERLAP = config.CHUNK_OVERLAP
 # 导入PDFDocument模型，用于PDF文档数据的封装
 from app.models.document import PDFDocument
 # 导入文本分块器，用于将长文本分割成合适大小的块
-from llama_index.core.node_parser import SentenceSplitter
-# 导入PDF阅读器，用于提取PDF文件中的文本内容
-from PyPDF2 import PdfReader
+from app.services.chunker import create_chunker
+# 导入按页流式提取PDF文本的生成器
+from app.services.pdf_extract import iter_pdf_pages
+# 导入阶段耗时指标
+from app.services import metrics
+
+logger = logging.getLogger("app")
 
 # ------------------------------ 配置部分 ------------------------------
 # PDF文件存储路径：基于BASE_DIR创建data/pdfs目录
@@ -31,27 +41,150 @@ PDF_STORAGE = os.path.join(BASE_DIR, "data", "pdfs")
 os.makedirs(PDF_STORAGE, exist_ok=True)
 
 
+# 分块器（延迟创建：cjk 分块器需要加载嵌入模型的分词器）
+_splitter = None
+
+
 # ------------------------------ 核心函数 ------------------------------
-def read_pdf(file_path: str) -> str:
+def get_splitter():
+    """获取配置的分块器，见 app.services.chunker.create_chunker"""
+    global _splitter
+    if _splitter is None:
+        _splitter = create_chunker(
+            config.CHUNKER,
+            model_name=config.EMBED_MODEL_NAME,
+            max_tokens=config.CHUNK_MAX_TOKENS,
+            overlap_tokens=config.CHUNK_OVERLAP_TOKENS,
+            chunk_size=CHUNK_SIZE,
+            chunk_overlap=CHUNK_OVERLAP,
+        )
+    return _splitter
+
+
+def iter_pages(file_path: str, progress: Optional[Callable[..., None]] = None) -> Iterator[Tuple[int, str]]:
+    """
+    按页流式提取PDF文本，使用配置的提取后端与进程池
+
+    参数:
+        file_path: str - PDF文件的路径
+        progress: 进度回调，每页提取完成后报告 pages_done / pages_total
+
+    返回:
+        Iterator[Tuple[int, str]] - (页码, 页面文本)，页码从1开始
     """
-    从PDF文件中提取文本内容
+    return iter_pdf_pages(
+        file_path,
+        backend=config.PDF_BACKEND,
+        workers=config.PDF_WORKERS,
+        parallel_min_pages=config.PDF_PARALLEL_MIN_PAGES,
+        pages_per_task=config.PDF_PAGES_PER_TASK,
+        progress=progress,
+    )
+
+
+def read_pdf(file_path: str, progress: Optional[Callable[..., None]] = None) -> str:
+    """
+    从PDF文件中提取全部文本内容（需要整本书文本时使用，导入流程使用 iter_pages）
     
     参数:
         file_path: str - PDF文件的路径
+        progress: 进度回调，见 iter_pages
     
     返回:
         str - 提取的PDF文本内容
     """
-    # 创建PDF阅读器对象
-    reader = PdfReader(file_path)
-    # 初始化文本变量
-    text = ""
-    # 遍历PDF的每一页，提取文本内容
-    for page in reader.pages:
-        # 提取当前页的文本，如果提取失败则使用空字符串
-        text += page.extract_text() or ""
-    # 返回提取的所有文本
-    return text
+    return "".join(text for _, text in iter_pages(file_path, progress=progress))
+
+
+def _find_ignoring_whitespace(text: str, chunk: str, pos: int) -> Optional[re.Match]:
+    """在 text 的 pos 之后查找 chunk，连续空白视为相同"""
+    words = chunk.split()
+    if not words:
+        return None
+    return re.compile(r"\s+".join(re.escape(word) for word in words)).search(text, pos)
+
+
+def iter_text_chunks(pages: Iterable[Tuple[int, str]], window_pages: int = None) -> Iterator[Dict[str, Any]]:
+    """
+    按页窗口增量分块：每累积 window_pages 页切分一次
+
+    窗口末尾的最后一块可能在页边界被截断，留到下一个窗口与后续页面一起重新切分，
+    因此分块结果与整本书一次性切分基本一致，而内存中只保留一个窗口的文本。
+
+    参数:
+        pages: Iterable[Tuple[int, str]] - 按页序的 (页码, 页面文本)
+        window_pages: int - 每次切分的页数，默认 PDF_CHUNK_WINDOW_PAGES
+
+    返回:
+        Iterator[dict] - 分块：text、page / page_end（起止页码）、
+        start_char / end_char（在全文中的字符偏移，全文为各页文本依次拼接）
+    """
+    window_pages = window_pages or config.PDF_CHUNK_WINDOW_PAGES
+    splitter = get_splitter()
+    # 页起始偏移与页码，只保留当前窗口覆盖的页
+    page_offsets: List[int] = []
+    page_numbers: List[int] = []
+    buffer: List[str] = []
+    carry = ""
+    window_start = 0  # 当前窗口（carry + buffer）在全文中的起始偏移
+    offset = 0  # 已读取文本的总长度
+    misses = 0  # 无法精确定位的分块数
+
+    def locate(window: str, chunks: List[str]) -> List[Dict[str, Any]]:
+        nonlocal misses
+        located, pos = [], 0
+        for chunk in chunks:
+            found = window.find(chunk, pos)
+            length = len(chunk)
+            if found < 0:
+                # 分块不是原文的精确子串（分块器规整了空白），按忽略空白差异的方式匹配
+                match = _find_ignoring_whitespace(window, chunk, pos)
+                if match is not None:
+                    found, length = match.start(), match.end() - match.start()
+                else:
+                    # 仍然找不到时退化为上一个位置，偏移与页码为近似值
+                    found = pos
+                    misses += 1
+            start = window_start + found
+            end = start + length
+            located.append({
+                "text": chunk,
+                "page": page_numbers[bisect_right(page_offsets, start) - 1],
+                "page_end": page_numbers[bisect_right(page_offsets, max(end - 1, start)) - 1],
+                "start_char": start,
+                "end_char": end,
+            })
+            pos = found + 1
+        return located
+
+    for page_no, text in pages:
+        page_offsets.append(offset)
+        page_numbers.append(page_no)
+        buffer.append(text)
+        offset += len(text)
+        if len(buffer) < window_pages:
+            continue
+        window = carry + "".join(buffer)
+        chunks = locate(window, splitter.split_text(window))
+        buffer = []
+        if chunks:
+            last = chunks.pop()
+            # 携带原文切片而不是分块文本：分块文本与原文不一致时，后续偏移仍以原文为准
+            carry = window[last["start_char"] - window_start:]
+            window_start = last["start_char"]
+        else:
+            carry, window_start = "", offset
+        # 丢弃窗口起点之前的页（保留包含窗口起点的那一页）
+        keep = max(bisect_right(page_offsets, window_start) - 1, 0)
+        del page_offsets[:keep], page_numbers[:keep]
+        yield from chunks
+
+    tail = carry + "".join(buffer)
+    if tail:
+        yield from locate(tail, splitter.split_text(tail))
+    if misses:
+        metrics.CHUNK_LOCATE_MISSES.inc(misses)
+        logger.warning("%d 个分块无法在原文中精确定位，其偏移与页码为近似值", misses)
 
 
 def split_text_to_chunks(text: str):
@@ -65,36 +198,94 @@ def split_text_to_chunks(text: str):
         list - 分块后的文本列表
     """
     # 创建文本分块器，设置分块大小和重叠大小
-    splitter = SentenceSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    splitter = get_splitter()
     # 执行分块操作
     chunks = splitter.split_text(text)
     # 返回分块后的文本列表
     return chunks
 
 
-async def process_pdf(file):
+def save_pdf(filename: str, content: bytes) -> str:
     """
-    处理上传的PDF文件，完成保存、文本提取、分块和节点转换的完整流程
-    
+    保存PDF文件到存储目录
+
     参数:
-        file - 上传的PDF文件对象
-    
+        filename: str - 文件名
+        content: bytes - 文件内容
+
     返回:
-        tuple - (文档节点列表, 分块数量)
+        str - 保存后的文件路径
     """
-    # 保存PDF文件到存储目录
-    pdf_path = os.path.join(PDF_STORAGE, file.filename)
+    pdf_path = os.path.join(PDF_STORAGE, filename)
     with open(pdf_path, "wb") as f:
-        f.write(await file.read())
+        f.write(content)
+    return pdf_path
+
+
+def pdf_to_documents(
+    pdf_path: str,
+    filename: str,
+    doc_id: str = None,
+    progress: Optional[Callable[..., None]] = None,
+) -> Iterator[Any]:
+    """
+    完成文本提取、分块和节点转换
+
+    参数:
+        pdf_path: str - PDF文件路径
+        filename: str - 原始文件名，写入分块元数据
+        doc_id: str - 文档ID，同一PDF的全部分块共享，None时每个分块各自生成
+        progress: 进度回调，报告阶段（extracting）与已提取的页数
+
+    返回:
+        Iterator - 文档节点的生成器：边提取边分块，调用方按批消费，不在内存中累积整本书的分块
+    """
+    # 按页流式提取文本，并按页窗口增量分块
+    if progress is not None:
+        progress(stage="extracting")
+    started = time.perf_counter()
+    consumer_seconds = 0.0
+    extract_seconds = [0.0]
+    pages = _timed(iter_pages(pdf_path, progress=progress), extract_seconds)
 
-    # 从PDF文件中提取文本内容
-    text = read_pdf(pdf_path)
+    for doc in chunks_to_documents(iter_text_chunks(pages), filename, doc_id=doc_id):
+        yielded = time.perf_counter()
+        yield doc
+        consumer_seconds += time.perf_counter() - yielded
+    # 提取与分块交替进行：等待下一页的时间计入提取，调用方处理分块（嵌入、写入）的时间不计入，其余计入分块
+    metrics.PDF_EXTRACT_SECONDS.observe(extract_seconds[0])
+    metrics.CHUNKING_SECONDS.observe(time.perf_counter() - started - extract_seconds[0] - consumer_seconds)
 
-    # 将提取的文本分割成小块
-    chunks = split_text_to_chunks(text)
 
-    # 将文本块转换为Document节点，包含元数据信息
-    docs = [PDFDocument(text=chunk, metadata={"source": file.filename}).to_node() for chunk in chunks]
+def _timed(pages: Iterator[Tuple[int, str]], seconds: List[float]) -> Iterator[Tuple[int, str]]:
+    """逐页产出，并把等待每一页的耗时累加到 seconds[0]"""
+    while True:
+        started = time.perf_counter()
+        page = next(pages, None)
+        seconds[0] += time.perf_counter() - started
+        if page is None:
+            return
+        yield page
+
+
+def chunks_to_documents(chunks: Iterable[Dict[str, Any]], filename: str, doc_id: str = None) -> Iterator[Any]:
+    """
+    将 iter_text_chunks 产出的文本块逐个转换为Document节点（生成器）
+
+    元数据包含文件名、起止页码与分块序号，字符偏移写入节点的 start_char_idx / end_char_idx
+    """
+    for chunk_index, chunk in enumerate(chunks):
+        metadata = {
+            "source": filename,
+            "page": chunk["page"],
+            "page_end": chunk["page_end"],
+            "chunk_index": chunk_index,
+        }
+        doc = PDFDocument(text=chunk["text"], metadata=metadata, doc_id=doc_id).to_node()
+        doc.start_char_idx = chunk["start_char"]
+        doc.end_char_idx = chunk["end_char"]
+        # 位置信息不参与嵌入：相同内容的分块无论来自哪个文件、哪一页都得到相同的向量，可以命中嵌入缓存
+        doc.excluded_embed_metadata_keys = list(metadata)
+        doc.excluded_llm_metadata_keys = ["page_end", "chunk_index"]
+        yield doc
 
-    # 返回文档节点列表和分块数量
-    return docs, len(chunks)
@@ -1,6 +1,254 @@
-from app.services.vector_service import query_vector_store
+# -*- coding: utf-8 -*-
+"""
+RAG问答服务模块
 
-def answer_question(query: str):
-    # 使用向量数据库检索 + LLM生成回答
-    answer = query_vector_store(query)
-    return answer
+异步查询路径，保证事件循环不被阻塞：
+1. 查询嵌入与向量检索（CPU密集）在有界线程池中执行
+2. LLM调用使用 DeepSeekLLM.acomplete（AsyncOpenAI + 连接池，带截止时间、重试与熔断），失败时返回文档摘要
+3. 同时处理的查询数受信号量限制，超出的请求排队等待
+4. 流式查询先返回检索到的来源，再逐个返回生成的文本增量
+5. 非流式问答先查询问答缓存（精确 / 语义），命中时不再检索与调用LLM
+6. 每次查询记录各阶段耗时：embed_ms / search_ms / rerank_ms / expand_ms / pack_ms / synthesize_ms / total_ms，
+   以及按token预算打包后的提示词token数 prompt_tokens
+7. 请求合并（QUERY_COALESCING）：归一化问题、查询参数与索引版本都相同的并发请求共享一次检索与LLM调用，
+   流式请求共享同一个事件流（中途加入的请求先收到已产出的事件）
+"""
+import asyncio
+import contextlib
+import contextvars
+import functools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, Hashable, List, Optional, Tuple
+
+from app.config import config
+from app.services import metrics
+from app.services.answer_cache import AnswerCache, normalize_query
+from app.services.single_flight import SingleFlight, StreamFlight
+from app.llm.errors import LLMError
+from app.services.vector_service import (
+    EMPTY_INDEX_MESSAGE,
+    astream_answer,
+    asynthesize_answer,
+    embed_query,
+    fallback_summary,
+    index_is_empty,
+    index_version,
+    node_citations,
+    node_sources,
+    retrieve_nodes,
+)
+
+logger = logging.getLogger("app")
+
+# 查询嵌入与向量检索的线程池
+_query_executor = ThreadPoolExecutor(max_workers=config.QUERY_THREADS, thread_name_prefix="query")
+# 同时处理的查询数上限
+_query_semaphore = asyncio.Semaphore(config.MAX_CONCURRENT_QUERIES)
+# 问答缓存
+answer_cache: Optional[AnswerCache] = (
+    AnswerCache(
+        max_entries=config.ANSWER_CACHE_MAX_ENTRIES,
+        ttl_seconds=config.ANSWER_CACHE_TTL,
+        similarity_threshold=config.ANSWER_CACHE_SIMILARITY,
+        semantic=config.ANSWER_CACHE_SEMANTIC,
+    )
+    if config.ANSWER_CACHE_ENABLED
+    else None
+)
+# 进行中的相同查询（非流式 / 流式分别合并）
+_answer_flights = SingleFlight()
+_stream_flights = StreamFlight()
+
+
+async def run_in_query_pool(func: Callable[..., Any], *args: Any) -> Any:
+    """在查询线程池中执行同步函数，并保留当前上下文变量"""
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(_query_executor, functools.partial(ctx.run, func, *args))
+
+
+@contextlib.asynccontextmanager
+async def _in_flight():
+    """进行中的查询数（已获得信号量的查询）"""
+    metrics.QUERIES_IN_FLIGHT.inc()
+    try:
+        yield
+    finally:
+        metrics.QUERIES_IN_FLIGHT.dec()
+
+
+def _elapsed_ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 2)
+
+
+def _index_state() -> Tuple[bool, int]:
+    """索引是否为空与数据版本号（读取目录库，在查询线程池中调用）"""
+    return index_is_empty(), index_version()
+
+
+def _result(
+    answer: str,
+    citations: Optional[List[Dict[str, Any]]] = None,
+    cached: bool = False,
+    prompt_tokens: int = 0,
+) -> Dict[str, Any]:
+    """问答结果：所有返回路径（包括索引为空与查询失败）都包含相同的字段"""
+    return {
+        "answer": answer,
+        "citations": citations or [],
+        "cached": cached,
+        "prompt_tokens": prompt_tokens,
+    }
+
+
+async def _flight_key(query: str, top_k: int, rerank: bool) -> Optional[Hashable]:
+    """请求合并的键：归一化问题、查询参数与索引版本；未启用合并或读取索引版本失败时返回None"""
+    if not config.QUERY_COALESCING:
+        return None
+    try:
+        version = await run_in_query_pool(index_version)
+    except Exception as e:
+        logger.warning("读取索引版本失败，不合并请求: %s", e)
+        return None
+    return normalize_query(query), top_k, rerank, version
+
+
+async def answer_question(query: str, top_k: int = 5, rerank: Optional[bool] = None) -> Dict[str, Any]:
+    """
+    使用向量数据库检索 + LLM生成回答；rerank 为None时按 RERANK_ENABLED 决定是否重排序
+
+    与进行中的相同查询（见 _flight_key）合并，共享同一个结果；
+    先查询问答缓存：精确命中直接返回；未命中时计算一次查询嵌入，
+    用于语义缓存查询，语义也未命中时复用该嵌入进行检索
+
+    返回:
+        dict - answer: 回答文本；citations: 引用的文件、页码与字符偏移；cached: 是否来自问答缓存；
+        prompt_tokens: 发送给LLM的提示词token数（缓存命中时为0）
+    """
+    rerank = config.RERANK_ENABLED if rerank is None else rerank
+    key = await _flight_key(query, top_k, rerank)
+    if key is None:
+        return await _answer_question(query, top_k, rerank)
+
+    result, shared = await _answer_flights.do(key, lambda: _answer_question(query, top_k, rerank))
+    if shared:
+        metrics.QUERIES_COALESCED.labels(mode="answer").inc()
+        logger.info("合并到进行中的相同查询 - 查询内容: %s", query)
+    return dict(result)
+
+
+async def _answer_question(query: str, top_k: int, rerank: bool) -> Dict[str, Any]:
+    """一次完整的问答流程（缓存查询、检索、LLM调用），见 answer_question"""
+    async with _query_semaphore, _in_flight():
+        logger.info("开始查询处理 - 查询内容: %s", query)
+        try:
+            # 检索之前读取版本号，期间有新文档写入时回答不会以新版本写入缓存
+            empty, version = await run_in_query_pool(_index_state)
+            if empty:
+                return _result(EMPTY_INDEX_MESSAGE)
+
+            started = time.perf_counter()
+            timings: Dict[str, float] = {}
+            # 缓存条目只在查询参数相同时复用
+            scope = (top_k, rerank)
+            cache = answer_cache
+            query_embedding = None
+            if cache is not None:
+                cached = cache.get_exact(query, scope, version)
+                if cached is None and cache.semantic:
+                    query_embedding = await run_in_query_pool(embed_query, query, timings)
+                    cached = cache.get_semantic(query_embedding, scope, version)
+                if cached is not None:
+                    logger.info("问答缓存命中", extra=dict(timings, total_ms=_elapsed_ms(started)))
+                    return dict(cached, cached=True, prompt_tokens=0)
+
+            nodes = await run_in_query_pool(retrieve_nodes, query, top_k, query_embedding, timings, rerank)
+            try:
+                answer = await asynthesize_answer(query, nodes, timings)
+                fallback = False
+            except LLMError as e:
+                logger.warning("LLM调用失败，返回文档摘要: %s", e)
+                answer = fallback_summary(nodes)
+                fallback = True
+            result = _result(answer, node_citations(nodes), prompt_tokens=timings.get("prompt_tokens", 0))
+            # LLM调用失败时返回的文档摘要不缓存
+            if cache is not None and not fallback:
+                cache.put(query, scope, version, result, embedding=query_embedding)
+            logger.info("查询完成", extra=dict(timings, total_ms=_elapsed_ms(started)))
+            return result
+        except Exception as e:
+            logger.error("查询错误: %s", str(e), exc_info=True)
+            return _result(f"查询失败：{str(e)}")
+
+
+async def stream_answer(query: str, top_k: int = 5, rerank: Optional[bool] = None) -> AsyncIterator[Dict[str, Any]]:
+    """
+    流式问答（rerank 见 answer_question），依次产出事件：
+
+    - {"event": "sources", "data": [...]}: 检索到的来源
+    - {"event": "token", "data": {"delta": "..."}}: 生成的文本增量
+    - {"event": "done", "data": {"ttft_ms": ..., "total_ms": ..., "prompt_tokens": ...}}: 首字延迟、总耗时与提示词token数
+    - {"event": "error", "data": {"message": "..."}}: 查询失败
+
+    与进行中的相同流式查询合并时，收到同一个事件流（done 事件中的耗时从第一个请求开始计算）；
+    所有合并的请求都断开后停止生成
+    """
+    rerank = config.RERANK_ENABLED if rerank is None else rerank
+    key = await _flight_key(query, top_k, rerank)
+    if key is None:
+        async for event in _stream_answer(query, top_k, rerank):
+            yield event
+        return
+
+    events, shared = _stream_flights.join(key, lambda: _stream_answer(query, top_k, rerank))
+    if shared:
+        metrics.QUERIES_COALESCED.labels(mode="stream").inc()
+        logger.info("合并到进行中的相同流式查询 - 查询内容: %s", query)
+    async for event in events:
+        yield event
+
+
+async def _stream_answer(query: str, top_k: int, rerank: bool) -> AsyncIterator[Dict[str, Any]]:
+    """一次完整的流式问答流程，见 stream_answer"""
+    async with _query_semaphore, _in_flight():
+        logger.info("开始流式查询处理 - 查询内容: %s", query)
+        started = time.perf_counter()
+        ttft_ms = None
+        try:
+            if await run_in_query_pool(index_is_empty):
+                yield {"event": "error", "data": {"message": EMPTY_INDEX_MESSAGE}}
+                return
+            timings: Dict[str, float] = {}
+            nodes = await run_in_query_pool(retrieve_nodes, query, top_k, None, timings, rerank)
+            yield {"event": "sources", "data": node_sources(nodes)}
+
+            llm_started = time.perf_counter()
+            async for delta in astream_answer(query, nodes, timings):
+                if ttft_ms is None:
+                    ttft_ms = _elapsed_ms(started)
+                    metrics.LLM_TTFT_SECONDS.observe(time.perf_counter() - llm_started)
+                yield {"event": "token", "data": {"delta": delta}}
+            metrics.LLM_SECONDS.labels(mode="stream").observe(time.perf_counter() - llm_started)
+        except Exception as e:
+            logger.error("流式查询错误: %s", str(e), exc_info=True)
+            yield {"event": "error", "data": {"message": f"查询失败：{str(e)}"}}
+            return
+
+        total_ms = _elapsed_ms(started)
+        logger.info("流式查询完成", extra=dict(timings, ttft_ms=ttft_ms, total_ms=total_ms))
+        yield {
+            "event": "done",
+            "data": {"ttft_ms": ttft_ms, "total_ms": total_ms, "prompt_tokens": timings.get("prompt_tokens", 0)},
+        }
+
+
+def get_answer_cache_stats() -> Optional[Dict[str, Any]]:
+    """问答缓存的命中率统计，未启用时返回None"""
+    return answer_cache.stats() if answer_cache is not None else None
+
+
+def shutdown() -> None:
+    """应用关闭时停止查询线程池"""
+    _query_executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""
+批量重建索引服务模块
+
+读取PDF存储目录（data/pdfs）中的全部文件，用多进程嵌入工作池（见 embed_pool）重新嵌入并写入向量索引：
+1. 主进程逐个文件边提取文本边分块，每 INGEST_BATCH_CHUNKS 个分块生成一批节点，先查询嵌入缓存
+2. 未命中的分块提交到工作池，各批分散到全部工作进程，向量经共享内存回传
+3. 一批的向量完成后写入节点并暂存到磁盘（见 vector_service.DocumentWriter），写入嵌入缓存；
+   一个文件的全部批次完成后作为一个向量段提交（替换同名文件的旧节点）
+
+主进程提取后面的分块时，工作池仍在嵌入前面的批次（同时在嵌入的批数不超过 REINDEX_INFLIGHT_BATCHES），
+工作进程不会因等待提取而空闲，内存中也不会累积整本书的分块。与上传导入相同，内容与其他已导入文件相同的文件会被跳过；
+同时在嵌入的文件之间不做近似重复折叠（此时前一个文件还未入库）。
+"""
+import os
+import time
+import logging
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+from llama_index.core.schema import MetadataMode
+
+from app.config import config
+from app.services import vector_service
+from app.services.dedup import file_fingerprint
+from app.services.embed_pool import EmbeddingPool
+from app.services.pdf_service import PDF_STORAGE, pdf_to_documents
+
+logger = logging.getLogger("app")
+
+
+class _PendingFile:
+    """正在写入索引的文件：各批次共享的写入器与统计"""
+
+    def __init__(self, filename: str, sha256: str, writer: "vector_service.DocumentWriter"):
+        self.filename = filename
+        self.sha256 = sha256
+        self.writer = writer
+        self.embedded = 0
+        self.started = time.perf_counter()
+
+
+class _PendingBatch:
+    """已提交到工作池、等待写入的一批节点；nodes 为None时表示文件的全部批次已提交，等待提交文件"""
+
+    def __init__(self, file: _PendingFile, nodes=None, texts=None, missing=None, job=None):
+        self.file = file
+        self.nodes = nodes
+        self.texts = texts
+        self.missing = missing
+        self.job = job
+
+
+def list_pdfs(pdf_dir: str) -> List[str]:
+    """目录中的PDF文件名（按文件名排序）"""
+    return sorted(name for name in os.listdir(pdf_dir) if name.lower().endswith(".pdf"))
+
+
+def _finish_batch(pending: _PendingBatch, use_cache: bool) -> None:
+    """等待一批节点的向量，写入节点与嵌入缓存后暂存到文件的写入器"""
+    vectors = pending.job.result() if pending.job is not None else None
+    if vectors is not None:
+        for row, i in enumerate(pending.missing):
+            pending.nodes[i].embedding = vectors[row].tolist()
+        cache = vector_service.get_embedding_cache() if use_cache else None
+        if cache is not None:
+            cache.put_many([pending.texts[i] for i in pending.missing], vectors)
+    pending.file.writer.add(pending.nodes)
+    pending.file.embedded += len(pending.missing)
+
+
+def _finish_file(file: _PendingFile) -> Dict[str, Any]:
+    """提交文件的全部批次"""
+    chunk_count = file.writer.commit()
+    seconds = time.perf_counter() - file.started
+    status = "replaced" if file.writer.replace_ref_doc_ids else "indexed"
+    logger.info(
+        "重建索引: %s（%s, 分块数: %d）",
+        file.filename,
+        status,
+        chunk_count,
+        extra={
+            "embedded": file.embedded,
+            "cache_hits": chunk_count - file.embedded,
+            "chunks_per_sec": round(file.embedded / seconds, 2) if seconds > 0 else None,
+        },
+    )
+    return {
+        "status": status,
+        "filename": file.filename,
+        "chunks": chunk_count,
+        "embedded": file.embedded,
+    }
+
+
+def reindex_library(
+    pdf_dir: Optional[str] = None,
+    workers: Optional[int] = None,
+    threads_per_worker: Optional[int] = None,
+    batch_size: Optional[int] = None,
+    only_changed: bool = False,
+    use_cache: bool = True,
+    progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> Dict[str, Any]:
+    """
+    重建目录中全部PDF的索引
+
+    参数:
+        pdf_dir: str - PDF目录，默认 PDF_STORAGE
+        workers: int - 嵌入工作进程数，默认 REINDEX_WORKERS
+        threads_per_worker: int - 每个工作进程的推理线程数，默认 REINDEX_THREADS_PER_WORKER（0 表示 CPU核数 / 进程数）
+        batch_size: int - 每个进程池任务嵌入的分块数，默认 REINDEX_BATCH_SIZE
+        only_changed: bool - 只处理未导入或内容已变化的文件
+        use_cache: bool - 是否查询/写入嵌入缓存（关闭后全部分块重新嵌入）
+        progress: 每个文件完成后的回调，参数为该文件的结果
+
+    返回:
+        dict - files（每个文件的结果）、chunks、embedded、seconds、chunks_per_sec
+    """
+    pdf_dir = pdf_dir or PDF_STORAGE
+    workers = workers or config.REINDEX_WORKERS
+    threads_per_worker = threads_per_worker or config.REINDEX_THREADS_PER_WORKER or max(
+        (os.cpu_count() or 1) // workers, 1
+    )
+    vector_service.load_index()
+    cache = vector_service.get_embedding_cache() if use_cache else None
+
+    results: List[Dict[str, Any]] = []
+    # 本次已提交的内容指纹 -> 文件名（这些文件在写入索引之前查不到记录）
+    submitted: Dict[str, str] = {}
+    inflight: "deque[_PendingBatch]" = deque()
+    # 已创建写入器、尚未提交的文件，出错时放弃其暂存的节点
+    open_files: List[_PendingFile] = []
+
+    def finish_oldest() -> None:
+        pending = inflight.popleft()
+        if pending.nodes is not None:
+            _finish_batch(pending, use_cache)
+            return
+        open_files.remove(pending.file)
+        result = _finish_file(pending.file)
+        results.append(result)
+        if progress is not None:
+            progress(result)
+
+    def submit(pending: _PendingBatch) -> None:
+        if len(inflight) >= max(config.REINDEX_INFLIGHT_BATCHES, 1):
+            finish_oldest()
+        inflight.append(pending)
+
+    started = time.perf_counter()
+    with EmbeddingPool(
+        workers=workers,
+        threads_per_worker=threads_per_worker,
+        dim=config.EMBED_DIM,
+        backend=config.EMBED_BACKEND,
+        model_name=config.EMBED_MODEL_NAME,
+        batch_size=batch_size or config.REINDEX_BATCH_SIZE,
+        quantize=config.EMBED_QUANTIZE,
+        max_length=config.EMBED_MAX_LENGTH,
+        cache_dir=config.ONNX_CACHE_DIR,
+    ) as pool:
+        try:
+            for filename in list_pdfs(pdf_dir):
+                path = os.path.join(pdf_dir, filename)
+                with open(path, "rb") as f:
+                    sha256 = file_fingerprint(f.read())
+
+                existing = vector_service.get_document_record(filename)
+                if only_changed and existing is not None and existing["sha256"] == sha256:
+                    results.append({"status": "unchanged", "filename": filename, "chunks": existing["chunk_count"]})
+                    continue
+                duplicate_of = submitted.get(sha256)
+                if duplicate_of is None:
+                    duplicate = vector_service.find_document_by_sha256(sha256)
+                    if duplicate is not None and duplicate["filename"] != filename:
+                        duplicate_of = duplicate["filename"]
+                if duplicate_of is not None:
+                    logger.info("文件内容与 %s 相同，跳过: %s", duplicate_of, filename)
+                    results.append({"status": "duplicate", "filename": filename, "duplicate_of": duplicate_of})
+                    continue
+                submitted[sha256] = filename
+
+                replace_ref_doc_ids = [existing["ref_doc_id"]] if existing is not None else []
+                writer = vector_service.DocumentWriter(
+                    replace_ref_doc_ids,
+                    document={"filename": filename, "sha256": sha256, "ref_doc_id": sha256},
+                )
+                file = _PendingFile(filename, sha256, writer)
+                open_files.append(file)
+                docs = pdf_to_documents(path, filename, doc_id=sha256)
+                for docs_batch in vector_service.iter_batches(docs, config.INGEST_BATCH_CHUNKS):
+                    nodes = writer.prepare(docs_batch)
+                    texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes]
+                    embeddings = cache.get_many(texts) if cache is not None else [None] * len(texts)
+                    for node, embedding in zip(nodes, embeddings):
+                        node.embedding = embedding
+                    missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+                    job = pool.submit([texts[i] for i in missing]) if missing else None
+                    submit(_PendingBatch(file, nodes, texts, missing, job))
+                submit(_PendingBatch(file))
+            while inflight:
+                finish_oldest()
+        finally:
+            for pending in inflight:
+                if pending.job is not None:
+                    pending.job.release()
+            for file in open_files:
+                file.writer.abort()
+    seconds = time.perf_counter() - started
+
+    chunks = sum(r.get("chunks", 0) for r in results if r["status"] in ("indexed", "replaced"))
+    embedded = sum(r.get("embedded", 0) for r in results)
+    summary = {
+        "files": results,
+        "workers": workers,
+        "threads_per_worker": threads_per_worker,
+        "chunks": chunks,
+        "embedded": embedded,
+        "seconds": round(seconds, 2),
+        "chunks_per_sec": round(embedded / seconds, 2) if seconds > 0 else None,
+    }
+    logger.info(
+        "重建索引完成: %d 个文件, %d 个分块（嵌入 %d 个）",
+        len(results),
+        chunks,
+        embedded,
+        extra={k: v for k, v in summary.items() if k != "files"},
+    )
+    return summary
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+交叉编码器重排序模块
+
+双塔嵌入检索（bi-encoder）只比较问题与分块各自的向量，中文问题上排序质量有限；
+交叉编码器把（问题, 分块）拼接后一起编码，打分更准确但更慢。因此先用向量 + BM25 检索
+较宽的候选集（RERANK_CANDIDATES），再由交叉编码器打分，只保留最好的 top_k 个。
+
+- 全部候选一次分词、按 batch_size 批量前向（候选数不超过 batch_size 时只有一次前向）
+- 后端：torch（可选int8动态量化 nn.Linear）/ onnx（ONNX Runtime，可选int8量化，见 onnx_models）
+- 推理在CPU上执行；onnx 后端的推理线程数由 RERANK_THREADS 控制，
+  torch 后端沿用进程的 torch 线程设置（与嵌入模型共享）
+"""
+import logging
+import threading
+from typing import List, Sequence
+
+import numpy as np
+
+from app.services.onnx_models import OnnxSession, export_onnx_model
+
+logger = logging.getLogger("app")
+
+BACKENDS = ("torch", "onnx")
+
+
+class CrossEncoderReranker:
+    """
+    交叉编码器重排序器
+
+    参数:
+        model_name: str - HuggingFace交叉编码器模型名称
+        backend: str - torch / onnx
+        quantize: bool - 是否使用int8动态量化
+        max_length: int - （问题, 分块）拼接后的最大token数，超出部分截断分块
+        batch_size: int - 每次前向的候选数
+        threads: int - 推理线程数（onnx 后端）
+        onnx_cache_dir: str - ONNX模型导出缓存目录
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        backend: str = "torch",
+        quantize: bool = True,
+        max_length: int = 384,
+        batch_size: int = 64,
+        threads: int = 4,
+        onnx_cache_dir: str = "",
+    ):
+        if backend not in BACKENDS:
+            raise ValueError(f"未知的重排序后端: {backend}，可选值: {', '.join(BACKENDS)}")
+        from transformers import AutoTokenizer
+
+        self.model_name = model_name
+        self.backend = backend
+        self.quantize = quantize
+        self.max_length = max_length
+        self.batch_size = max(batch_size, 1)
+        # fast tokenizer 与模型并发调用不安全，且单次推理已占满 threads 个核，重排序请求串行执行
+        self._lock = threading.Lock()
+        self._tokenizer = AutoTokenizer.from_pretrained(model_name)
+
+        if backend == "onnx":
+            path = export_onnx_model(model_name, "text-classification", onnx_cache_dir, quantize=quantize)
+            self._session = OnnxSession(path, threads)
+        else:
+            import torch
+            from transformers import AutoModelForSequenceClassification
+
+            self._torch = torch
+            model = AutoModelForSequenceClassification.from_pretrained(model_name).eval()
+            if quantize:
+                model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+            self._model = model
+        logger.info("交叉编码器已加载: %s（后端: %s, int8: %s）", model_name, backend, quantize)
+
+    def _forward(self, queries: List[str], passages: List[str]) -> np.ndarray:
+        tensors = "np" if self.backend == "onnx" else "pt"
+        encoded = self._tokenizer(
+            queries,
+            passages,
+            padding=True,
+            truncation="only_second",
+            max_length=self.max_length,
+            return_tensors=tensors,
+        )
+        if self.backend == "onnx":
+            logits = self._session.run(encoded)[0]
+        else:
+            with self._torch.inference_mode():
+                logits = self._model(**encoded).logits.float().numpy()
+        # 单输出（相关度）取第0列；二分类输出取“相关”类
+        return logits[:, 0] if logits.shape[1] == 1 else logits[:, 1]
+
+    def score(self, query: str, passages: Sequence[str]) -> List[float]:
+        """为（问题, 分块）打分，分数越高越相关"""
+        if not passages:
+            return []
+        # 按长度排序后分批，同一批的padding最少
+        order = sorted(range(len(passages)), key=lambda i: len(passages[i]))
+        scores = np.empty(len(passages), dtype=np.float32)
+        with self._lock:
+            for start in range(0, len(order), self.batch_size):
+                batch = order[start:start + self.batch_size]
+                scores[batch] = self._forward([query] * len(batch), [passages[i] for i in batch])
+        return scores.tolist()
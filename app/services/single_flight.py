@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+请求合并模块（single-flight）
+
+同一事件循环内，键相同的并发调用共享一次执行：
+- SingleFlight：第一个调用在独立任务中执行，之后到达的调用等待同一个结果；
+  某个调用方取消（客户端断开）不影响其他调用方，执行完成后键即释放，后续调用重新执行
+- StreamFlight：流式版本，执行产出的事件广播给全部订阅者，中途加入的订阅者先收到已产出的事件；
+  所有订阅者都断开后停止执行
+
+只在事件循环线程中使用，不加锁。
+"""
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+
+class SingleFlight:
+    """相同键的并发协程调用共享一次执行"""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        执行 func（键相同的调用正在执行时等待其结果）
+
+        返回:
+            (结果, 是否与进行中的调用共享)
+        """
+        task = self._calls.get(key)
+        shared = task is not None
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        # shield：调用方被取消时不取消共享的执行
+        return await asyncio.shield(task), shared
+
+    def _forget(self, key: Hashable, task: asyncio.Future) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+
+
+class _Broadcast:
+    """一次流式执行：已产出的事件与订阅者计数"""
+
+    def __init__(self):
+        self.events: List[Any] = []
+        self.done = False
+        self.subscribers = 0
+        self.task: Optional[asyncio.Future] = None
+        self._changed = asyncio.Event()
+
+    def publish(self, event: Any) -> None:
+        self.events.append(event)
+        self._wake()
+
+    def finish(self) -> None:
+        self.done = True
+        self._wake()
+
+    def _wake(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def subscribe(self) -> AsyncIterator[Any]:
+        """从第一个事件开始依次返回，执行结束后停止"""
+        i = 0
+        while True:
+            while i < len(self.events):
+                yield self.events[i]
+                i += 1
+            if self.done:
+                return
+            await self._changed.wait()
+
+
+class StreamFlight:
+    """相同键的并发流式调用共享一次执行，事件广播给全部订阅者"""
+
+    def __init__(self):
+        self._flights: Dict[Hashable, _Broadcast] = {}
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    def join(self, key: Hashable, make_stream: Callable[[], AsyncIterator[Any]]) -> Tuple[AsyncIterator[Any], bool]:
+        """
+        订阅键对应的流式执行，没有进行中的执行时启动 make_stream()
+
+        订阅在返回的迭代器开始迭代时才生效：从未迭代的迭代器（如客户端在响应开始前断开）
+        不占用订阅计数，也不会启动执行
+
+        返回:
+            (事件迭代器, 调用时是否有进行中的执行可共享)
+        """
+        return self._subscribe(key, make_stream), key in self._flights
+
+    async def _produce(
+        self, key: Hashable, broadcast: _Broadcast, make_stream: Callable[[], AsyncIterator[Any]]
+    ) -> None:
+        try:
+            async for event in make_stream():
+                broadcast.publish(event)
+        finally:
+            broadcast.finish()
+            self._forget(key, broadcast)
+
+    async def _subscribe(self, key: Hashable, make_stream: Callable[[], AsyncIterator[Any]]) -> AsyncIterator[Any]:
+        # 查找或启动执行与计数之间没有 await：登记中的执行至少有一个订阅者，计数归零时立即移除
+        broadcast = self._flights.get(key)
+        if broadcast is None:
+            broadcast = _Broadcast()
+            self._flights[key] = broadcast
+            broadcast.task = asyncio.ensure_future(self._produce(key, broadcast, make_stream))
+        broadcast.subscribers += 1
+        try:
+            async for event in broadcast.subscribe():
+                yield event
+        finally:
+            broadcast.subscribers -= 1
+            if broadcast.subscribers == 0 and not broadcast.done:
+                # 所有订阅者都已断开，停止执行（不再继续调用LLM）
+                broadcast.task.cancel()
+                self._forget(key, broadcast)
+
+    def _forget(self, key: Hashable, broadcast: _Broadcast) -> None:
+        if self._flights.get(key) is broadcast:
+            del self._flights[key]
@@ -2,7 +2,7 @@
 """
 向量服务模块
 
-- FAISS 向量存储
+- FAISS 向量存储（内存映射的 .faiss 文件，见 faiss_store.py）
 - LlamaIndex RAG
 - DeepSeek Chat API
 
@@ -15,29 +15,46 @@
 """
 
 import os
+import json
+import time
 import logging
-from typing import Any, Mapping, List
+import threading
+import contextlib
+import contextvars
+from functools import partial
+from itertools import islice
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, Iterator, List, Set
 
-from app.logger.logging_config import get_logging_config
 from app.config import config
 
-from openai import OpenAI
 from llama_index.core import VectorStoreIndex, StorageContext
 from llama_index.core.settings import Settings
-from llama_index.core.llms import CustomLLM, CompletionResponse, LLMMetadata
-from llama_index.core.llms.callbacks import llm_completion_callback
-from llama_index.core.embeddings import MockEmbedding
-
-# 导入PyTorch用于CUDA检测
-import torch
-
-# 导入HuggingFace嵌入模型
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+from llama_index.core.schema import (
+    BaseNode,
+    MetadataMode,
+    NodeRelationship,
+    NodeWithScore,
+    QueryBundle,
+    RelatedNodeInfo,
+    TextNode,
+)
+from llama_index.core.instrumentation import get_dispatcher
+from llama_index.core.instrumentation.event_handlers import BaseEventHandler
+from llama_index.core.instrumentation.events.llm import LLMCompletionStartEvent
+from llama_index.core.response_synthesizers import BaseSynthesizer, ResponseMode, get_response_synthesizer
+from llama_index.core.retrievers import BaseRetriever
 
-from app.llm.DeepSeekLLM import DeepSeekLLM
+from app.services.faiss_store import MmapFaissVectorStore
+from app.services.embedding_cache import EmbeddingCache
+from app.services.dedup import SimHashIndex, collapse_near_duplicates
+from app.services.bm25_index import BM25Index
+from app.services.context_builder import get_token_counter, pack_nodes
+from app.services.reranker import CrossEncoderReranker
+from app.services.embeddings import LazyEmbedding, create_embed_model
+from app.llm.errors import LLMError
+from app.services import metrics
 
 # 配置日志
-logging.config.dictConfig(get_logging_config(config.DEBUG))
 logger = logging.getLogger("app")
 
 
@@ -58,26 +75,27 @@ DEEPSEEK_MODEL = config.DEEPSEEK_MODEL
 # LlamaIndex 全局设置
 # =========================
 
-Settings.llm = DeepSeekLLM(
-    api_key=DEEPSEEK_API_KEY,
-    base_url=DEEPSEEK_API_BASE,
-    model=DEEPSEEK_MODEL,
-)
+# LLM 与嵌入模型都延迟创建，导入本模块不导入torch、不加载模型权重、不创建DeepSeek客户端：
+# - LLM：首次调用 get_llm() 时创建（已通过 Settings.llm 设置时直接使用）
+# - 嵌入模型：torch（HuggingFaceEmbedding）或 onnx（ONNX Runtime，可选int8量化），见 embeddings.py；
+#   首次嵌入时加载。应用启动时由 warmup() 在后台预热，完成前 /api/ready 返回503
 
 # ⚠️ MockEmbedding 只适合 demo / 调试
 # Settings.embed_model = MockEmbedding(embed_dim=384)
 
-# logger.info("DeepSeek LLM 初始化完成（使用 MockEmbedding）")
-
-# 检测CUDA是否可用
-device = "cuda" if torch.cuda.is_available() else "cpu"
-logger.info("使用设备进行嵌入计算: %s", device)
-
-# 使用真实的HuggingFace嵌入模型
-Settings.embed_model = HuggingFaceEmbedding(
-    model_name="sentence-transformers/all-MiniLM-L6-v2",  # 指定模型名称
-    embed_batch_size=100,  # 可根据需要调整批量大小
-    device=device  # 动态设置设备
+Settings.embed_model = LazyEmbedding(
+    partial(
+        create_embed_model,
+        backend=config.EMBED_BACKEND,
+        model_name=config.EMBED_MODEL_NAME,
+        batch_size=config.EMBED_BATCH_SIZE,
+        quantize=config.EMBED_QUANTIZE,
+        threads=config.EMBED_THREADS,
+        max_length=config.EMBED_MAX_LENGTH,
+        cache_dir=config.ONNX_CACHE_DIR,
+    ),
+    model_name=config.EMBED_MODEL_NAME,
+    embed_batch_size=config.EMBED_BATCH_SIZE,
 )
 
 
@@ -87,161 +105,1210 @@ Settings.embed_model = HuggingFaceEmbedding(
 
 index: VectorStoreIndex | None = None
 storage_context: StorageContext | None = None
+vector_store: MmapFaissVectorStore | None = None
+index_load_seconds: float | None = None
+embedding_cache: EmbeddingCache | None = None
+simhash_index: SimHashIndex | None = None
+bm25_index: BM25Index | None = None
+reranker: CrossEncoderReranker | None = None
+llm_client: Any = None  # get_llm 创建的 ResilientLLMClient，应用关闭时释放连接池
+warmup_seconds: float | None = None
+warmup_error: str | None = None
+_index_lock = threading.Lock()
+_cache_lock = threading.Lock()
+_llm_lock = threading.Lock()
+
+# 复用的检索器（按 similarity_top_k）与响应合成器（按 (response_mode, streaming)），
+# 检索器随索引对象重建，合成器随 Settings.llm 重建
+_retrievers: Dict[int, BaseRetriever] = {}
+_synthesizers: Dict[tuple, tuple] = {}
+_engine_lock = threading.Lock()
+
+
+class IndexManifestError(ValueError):
+    """持久化索引与当前嵌入模型配置不兼容"""
 
 
 # =========================
 # 对外函数
 # =========================
 
+def _create_vector_store() -> MmapFaissVectorStore:
+    """创建FAISS向量存储，已有索引文件时以内存映射方式加载"""
+    return MmapFaissVectorStore(
+        persist_dir=VECTOR_STORE_PATH,
+        dim=config.EMBED_DIM,
+        index_type=config.FAISS_INDEX_TYPE,
+        threshold=config.FAISS_ANN_THRESHOLD,
+        nprobe=config.FAISS_IVF_NPROBE,
+        hnsw_m=config.FAISS_HNSW_M,
+        ef_search=config.FAISS_HNSW_EF_SEARCH,
+        use_mmap=config.FAISS_MMAP,
+        compact_segments=config.VECTOR_COMPACT_SEGMENTS,
+        compact_tombstone_ratio=config.VECTOR_COMPACT_TOMBSTONE_RATIO,
+    )
+
+
+def _current_manifest() -> Dict[str, Any]:
+    """当前配置对应的索引清单：嵌入模型、向量维度、嵌入后端与分块参数"""
+    return {
+        "embed_model": config.EMBED_MODEL_NAME,
+        "embed_dim": config.EMBED_DIM,
+        "embed_backend": config.EMBED_BACKEND,
+        "embed_quantize": config.EMBED_QUANTIZE,
+        "chunker": config.CHUNKER,
+        "chunk_max_tokens": config.CHUNK_MAX_TOKENS,
+        "chunk_overlap_tokens": config.CHUNK_OVERLAP_TOKENS,
+        "chunk_size": config.CHUNK_SIZE,
+        "chunk_overlap": config.CHUNK_OVERLAP,
+    }
+
+
+def _validate_manifest(store: MmapFaissVectorStore) -> None:
+    """
+    校验持久化索引的清单
+
+    - 嵌入模型或维度不一致：已有向量无法与新查询向量比较，直接报错
+    - 嵌入后端或量化设置不一致：向量在容差范围内兼容，只记录警告
+    - 分块参数不一致：已有分块仍然可用，只记录警告
+    - 空索引或旧版本索引没有清单：写入当前清单
+    """
+    current = _current_manifest()
+    stored_json = store.get_meta("manifest")
+    if stored_json is None or store.count() == 0:
+        store.set_meta("manifest", json.dumps(current, ensure_ascii=False))
+        return
+
+    stored = json.loads(stored_json)
+    for key in ("embed_model", "embed_dim"):
+        if stored.get(key) != current[key]:
+            raise IndexManifestError(
+                f"向量索引清单不匹配: {key} 为 {stored.get(key)}，当前配置为 {current[key]}。"
+                f"请恢复原配置，或删除 {VECTOR_STORE_PATH} 后重新导入文档"
+            )
+    for key in ("embed_backend", "embed_quantize"):
+        if key in stored and stored[key] != current[key]:
+            logger.warning(
+                "嵌入后端与索引清单不一致: %s 为 %s，当前配置为 %s（向量在容差范围内兼容，可以混用）",
+                key, stored[key], current[key],
+            )
+    for key in ("chunker", "chunk_max_tokens", "chunk_overlap_tokens", "chunk_size", "chunk_overlap"):
+        if stored.get(key) != current[key]:
+            logger.warning(
+                "分块参数与索引清单不一致: %s 为 %s，当前配置为 %s（新上传文档将使用当前配置）",
+                key, stored.get(key), current[key],
+            )
+
+
+def _open_bm25_index(store: MmapFaissVectorStore) -> BM25Index:
+    """
+    打开BM25倒排索引（与向量存储位于同一目录）
+
+    分词器变化、旧版本索引没有倒排索引、或崩溃导致两者的分块数量不一致时，从向量存储中的节点重建
+    """
+    bm25 = BM25Index(
+        os.path.join(VECTOR_STORE_PATH, "bm25.sqlite3"),
+        tokenizer=config.BM25_TOKENIZER,
+        k1=config.BM25_K1,
+        b=config.BM25_B,
+    )
+    if bm25.needs_rebuild or bm25.count() != store.count():
+        logger.info("BM25索引与向量存储不一致（%d / %d），开始重建", bm25.count(), store.count())
+        bm25.rebuild(
+            (node.node_id, node.ref_doc_id, node.get_content()) for node in store.iter_nodes()
+        )
+    return bm25
+
+
 def _load_or_create_index():
-    global index, storage_context
+    global index, storage_context, vector_store, index_load_seconds, bm25_index
 
     if index is not None:
         return
 
-    try:
-        storage_context = StorageContext.from_defaults(
-            persist_dir=VECTOR_STORE_PATH
+    with _index_lock:
+        if index is not None:
+            return
+
+        started = time.perf_counter()
+        # 文本与向量都由FAISS向量存储持久化，不再需要docstore/index_store JSON文件
+        store = _create_vector_store()
+        _validate_manifest(store)
+        if config.HYBRID_SEARCH:
+            bm25_index = _open_bm25_index(store)
+        vector_store = store
+        index = VectorStoreIndex.from_vector_store(store)
+        storage_context = index.storage_context
+        _retrievers.clear()
+        index_load_seconds = time.perf_counter() - started
+        logger.info(
+            "已加载本地向量索引",
+            extra={
+                "load_time_ms": round(index_load_seconds * 1000, 2),
+                "vector_count": store.ntotal,
+                "node_count": store.count(),
+                "segment_count": store.segment_count,
+            },
         )
-        index = VectorStoreIndex.from_documents(
-            [],
-            storage_context=storage_context,
+
+
+def load_index() -> None:
+    """在应用启动时加载持久化索引（重复调用无副作用）"""
+    _load_or_create_index()
+
+
+def close_index() -> None:
+    """在应用关闭时释放向量存储、嵌入缓存与SimHash索引"""
+    global index, storage_context, vector_store, embedding_cache, simhash_index, bm25_index
+
+    with _index_lock:
+        if vector_store is not None:
+            vector_store.close()
+        if bm25_index is not None:
+            bm25_index.close()
+        index = storage_context = vector_store = bm25_index = None
+        _retrievers.clear()
+
+    with _cache_lock:
+        if embedding_cache is not None:
+            embedding_cache.close()
+            embedding_cache = None
+        if simhash_index is not None:
+            simhash_index.close()
+            simhash_index = None
+
+
+def _dir_size(path: str) -> int:
+    """目录下全部文件的大小（字节）；后台压缩期间删除的文件忽略"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except FileNotFoundError:
+                pass
+    return total
+
+
+def get_index_stats() -> Dict[str, Any]:
+    """返回索引状态，用于健康检查"""
+    store = vector_store
+    if index is None or store is None:
+        return {"loaded": False}
+    return {
+        "loaded": True,
+        "load_time_ms": round(index_load_seconds * 1000, 2) if index_load_seconds is not None else None,
+        "vector_count": store.ntotal,
+        "node_count": store.count(),
+        "segment_count": store.segment_count,
+        "size_bytes": _dir_size(VECTOR_STORE_PATH),
+        "manifest": _current_manifest(),
+        "embedding_cache": embedding_cache.stats() if embedding_cache is not None else None,
+        "bm25": bm25_index.stats() if bm25_index is not None else None,
+    }
+
+
+def documents_to_nodes(docs: List) -> List[TextNode]:
+    """
+    将分块后的Document转换为节点
+
+    PDF文本在 pdf_service 中已经按 CHUNK_SIZE 分块，这里不再经过NodeParser重复切分；
+    节点通过SOURCE关系指向原Document，保留元数据及其排除规则。
+    """
+    nodes = []
+    for doc in docs:
+        nodes.append(
+            TextNode(
+                text=doc.text,
+                metadata=dict(doc.metadata),
+                excluded_embed_metadata_keys=list(doc.excluded_embed_metadata_keys),
+                excluded_llm_metadata_keys=list(doc.excluded_llm_metadata_keys),
+                relationships={NodeRelationship.SOURCE: doc.as_related_node_info()},
+                start_char_idx=doc.start_char_idx,
+                end_char_idx=doc.end_char_idx,
+            )
         )
-        logger.info("已加载本地向量索引")
-    except Exception:
-        storage_context = StorageContext.from_defaults()
-        index = VectorStoreIndex([], storage_context=storage_context)
-        logger.info("创建新的向量索引")
+    return nodes
+
+
+def _link_neighbors(nodes: List[TextNode]) -> None:
+    """按分块序号为同一文档的相邻节点设置 PREVIOUS / NEXT 关系"""
+    by_doc: Dict[str, List[TextNode]] = {}
+    for node in nodes:
+        if node.metadata.get("chunk_index") is not None:
+            by_doc.setdefault(node.ref_doc_id, []).append(node)
+    for doc_nodes in by_doc.values():
+        doc_nodes.sort(key=lambda n: n.metadata["chunk_index"])
+        for prev, nxt in zip(doc_nodes, doc_nodes[1:]):
+            prev.relationships[NodeRelationship.NEXT] = RelatedNodeInfo(node_id=nxt.node_id)
+            nxt.relationships[NodeRelationship.PREVIOUS] = RelatedNodeInfo(node_id=prev.node_id)
+
+
+def get_reranker() -> CrossEncoderReranker:
+    """获取交叉编码器重排序器（首次使用时加载模型）"""
+    global reranker
 
+    if reranker is None:
+        with _engine_lock:
+            if reranker is None:
+                reranker = CrossEncoderReranker(
+                    model_name=config.RERANK_MODEL,
+                    backend=config.RERANK_BACKEND,
+                    quantize=config.RERANK_QUANTIZE,
+                    max_length=config.RERANK_MAX_LENGTH,
+                    batch_size=config.RERANK_BATCH_SIZE,
+                    threads=config.RERANK_THREADS,
+                    onnx_cache_dir=config.ONNX_CACHE_DIR,
+                )
+    return reranker
 
-def add_documents_to_index(docs: List):
+
+def rerank_nodes(query_text: str, nodes: List[NodeWithScore], top_k: int) -> List[NodeWithScore]:
+    """用交叉编码器为候选打分（一次批量前向），按分数保留前 top_k 个"""
+    if not nodes:
+        return nodes
+    scores = get_reranker().score(query_text, [hit.node.get_content() for hit in nodes])
+    ranked = sorted(zip(nodes, scores), key=lambda pair: pair[1], reverse=True)[:top_k]
+    return [NodeWithScore(node=hit.node, score=score) for hit, score in ranked]
+
+
+def _embed_variant() -> str:
+    """嵌入后端标识：torch / onnx / onnx-int8，不同后端的向量不共享嵌入缓存"""
+    if config.EMBED_BACKEND == "onnx":
+        return "onnx-int8" if config.EMBED_QUANTIZE else "onnx"
+    return config.EMBED_BACKEND
+
+
+def get_embedding_cache() -> EmbeddingCache | None:
+    """获取嵌入缓存（延迟创建），未启用时返回None"""
+    global embedding_cache
+
+    if not config.EMBED_CACHE_ENABLED:
+        return None
+    if embedding_cache is None:
+        with _cache_lock:
+            if embedding_cache is None:
+                embedding_cache = EmbeddingCache(
+                    cache_dir=config.EMBED_CACHE_DIR,
+                    model_name=config.EMBED_MODEL_NAME,
+                    dim=config.EMBED_DIM,
+                    max_entries=config.EMBED_CACHE_MAX_ENTRIES,
+                    variant=_embed_variant(),
+                )
+    return embedding_cache
+
+
+def embed_texts(texts: List[str], progress: Callable[..., None] | None = None) -> List[List[float]]:
     """
-    添加文档到向量索引
-    docs: List[llama_index.core.schema.Document]
+    批量计算文本的嵌入向量，先查询嵌入缓存，只对未命中的文本调用嵌入模型
+
+    未命中的文本按长度排序后交给嵌入模型，按 embed_batch_size 切分的每一批文本长度相近，
+    padding最少；progress 回调按批报告已嵌入的分块数量（chunks_embedded）。
     """
-    _load_or_create_index()
+    cache = get_embedding_cache()
+    embeddings = cache.get_many(texts) if cache is not None else [None] * len(texts)
+
+    missing = sorted((i for i, e in enumerate(embeddings) if e is None), key=lambda i: len(texts[i]))
+    embedded = len(texts) - len(missing)
+    if progress is not None:
+        progress(chunks_embedded=embedded)
 
-    if not docs:
+    step = max(config.EMBED_BATCH_SIZE, 1)
+    for start in range(0, len(missing), step):
+        batch = missing[start:start + step]
+        batch_texts = [texts[i] for i in batch]
+        with metrics.observe(metrics.EMBED_BATCH_SECONDS, kind="document"):
+            new_embeddings = Settings.embed_model.get_text_embedding_batch(batch_texts)
+        metrics.EMBEDDED_CHUNKS.inc(len(batch))
+        for i, embedding in zip(batch, new_embeddings):
+            embeddings[i] = embedding
+        if cache is not None:
+            cache.put_many(batch_texts, new_embeddings)
+        embedded += len(batch)
+        if progress is not None:
+            progress(chunks_embedded=embedded)
+    return embeddings
+
+
+def embed_nodes_sorted(nodes: List[BaseNode], progress: Callable[..., None] | None = None) -> None:
+    """批量计算节点的嵌入向量（原地写入 node.embedding），见 embed_texts"""
+    pending = [node for node in nodes if node.embedding is None]
+    if not pending:
         return
+    texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in pending]
+    for node, embedding in zip(pending, embed_texts(texts, progress=progress)):
+        node.embedding = embedding
 
-    for doc in docs:
-        index.insert(doc)
 
-    index.storage_context.persist(persist_dir=VECTOR_STORE_PATH)
-    logger.info("已插入 %d 个文档到向量索引", len(docs))
+def get_document_record(filename: str) -> Dict[str, Any] | None:
+    """按文件名查询已导入的文档记录（内容哈希、ref_doc_id、分块数量）"""
+    _load_or_create_index()
+    return vector_store.get_document(filename)
+
 
+def find_document_by_sha256(sha256: str) -> Dict[str, Any] | None:
+    """按内容哈希查询已导入的文档记录"""
+    _load_or_create_index()
+    return vector_store.find_document_by_sha256(sha256)
 
-def query_vector_store(query_text: str, top_k: int = 5) -> str:
+
+def delete_document(ref_doc_id: str) -> None:
+    """删除文档的全部节点与文档登记，并同步删除BM25倒排索引与SimHash登记"""
+    _load_or_create_index()
+    vector_store.delete(ref_doc_id)
+    if bm25_index is not None:
+        bm25_index.delete_ref_docs([ref_doc_id])
+    _get_simhash_index().delete_ref_docs([ref_doc_id])
+
+
+def _get_simhash_index() -> SimHashIndex:
+    global simhash_index
+
+    with _cache_lock:
+        if simhash_index is None:
+            simhash_index = SimHashIndex(os.path.join(VECTOR_STORE_PATH, "simhash.sqlite3"))
+    return simhash_index
+
+
+def _collapse_near_duplicates(
+    nodes: List[TextNode],
+    replace_ref_doc_ids,
+    pending_ids: Set[str] | None = None,
+) -> List[TextNode]:
     """
-    向量查询接口
-    
-    问题诊断步骤：
-    1. 检查向量索引状态
-    2. 检查DeepSeek API调用
-    3. 检查查询处理流程
+    折叠与本批或已入库分块近似重复的节点，并登记保留节点的SimHash
+
+    pending_ids 为同一文档前面批次中已暂存、尚未提交的节点ID，与这些节点近似重复的分块同样折叠
+    """
+    sim_index = _get_simhash_index()
+    # 被替换的旧版本即将删除，不能让新版本的分块与之判重
+    if replace_ref_doc_ids:
+        sim_index.delete_ref_docs(list(replace_ref_doc_ids))
+
+    pending_ids = pending_ids or set()
+
+    def node_exists(node_ids: List[str]) -> List[str]:
+        staged = [node_id for node_id in node_ids if node_id in pending_ids]
+        committed = vector_store.get_nodes([node_id for node_id in node_ids if node_id not in pending_ids])
+        return staged + [node.node_id for node in committed]
+
+    kept, hashes = collapse_near_duplicates(
+        [node.get_content() for node in nodes],
+        sim_index,
+        config.DEDUP_SIMHASH_DISTANCE,
+        node_exists=node_exists,
+    )
+    kept_nodes = [nodes[i] for i in kept]
+    if len(kept_nodes) < len(nodes):
+        logger.info("折叠近似重复分块: %d -> %d", len(nodes), len(kept_nodes))
+    sim_index.add((node.node_id, node.ref_doc_id, value) for node, value in zip(kept_nodes, hashes))
+    return kept_nodes
+
+
+def iter_batches(items: Iterable, size: int) -> Iterator[List]:
+    """把可迭代对象按 size 个一组切分，只在内存中保留当前一组"""
+    iterator = iter(items)
+    size = max(size, 1)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class DocumentWriter:
+    """
+    分批写入一个文档：每批分块转换为节点、计算嵌入后暂存到向量存储的磁盘批次（见 StagedBatch），
+    commit 时作为一个向量段提交，替换旧文档与登记文档记录在同一事务中生效
+
+    用法：nodes = writer.prepare(docs) -> 为 nodes 计算嵌入 -> writer.add(nodes)，重复多批后 writer.commit()；
+    出错时 writer.abort()。内存中只保留当前一批节点与已暂存节点的ID（用于跨批次的近似去重）。
+
+    参数:
+        replace_ref_doc_ids: 在同一事务中删除的旧文档
+        document: 在同一事务中登记的文档记录，chunk_count 在提交时按实际写入的节点数填写
+    """
+
+    def __init__(
+        self,
+        replace_ref_doc_ids: List[str] | None = None,
+        document: Dict[str, Any] | None = None,
+    ):
+        _load_or_create_index()
+        self.replace_ref_doc_ids = list(replace_ref_doc_ids or [])
+        self.document = document
+        self.batch = vector_store.begin_batch()
+        self.started = time.perf_counter()
+        self._node_ids: Set[str] = set()
+        # 每批的最后一个节点留到下一批，与下一批的第一个节点链接后再暂存
+        self._held: TextNode | None = None
+        self._prepared = False
+
+    def prepare(self, docs: List) -> List[TextNode]:
+        """将一批分块转换为待写入的节点：近似去重（可选），尚未计算嵌入"""
+        nodes = documents_to_nodes(docs)
+        if nodes and config.DEDUP_NEAR_DUPLICATES:
+            # 被替换的旧版本只需在第一批之前从SimHash索引中删除
+            replace = self.replace_ref_doc_ids if not self._prepared else []
+            nodes = _collapse_near_duplicates(nodes, replace, pending_ids=self._node_ids)
+        self._prepared = True
+        self._node_ids.update(node.node_id for node in nodes)
+        return nodes
+
+    def add(self, nodes: List[TextNode]) -> None:
+        """暂存一批已计算嵌入的节点（prepare 的返回值），并链接相邻分块"""
+        if self._held is not None:
+            nodes = [self._held] + list(nodes)
+        if not nodes:
+            return
+        _link_neighbors(nodes)
+        self._held = nodes[-1]
+        self.batch.add(nodes[:-1])
+
+    def commit(self) -> int:
+        """提交全部暂存的节点，并同步写入BM25倒排索引；返回写入的节点数量"""
+        if self._held is not None:
+            self.batch.add([self._held])
+            self._held = None
+        document = self.document
+        if document is not None:
+            document = dict(document, chunk_count=self.batch.count)
+        self.batch.commit(replace_ref_doc_ids=self.replace_ref_doc_ids, document=document)
+
+        # 倒排索引与向量存储分别提交；两者不一致时（中途崩溃）下次加载索引会重建倒排索引。
+        # 已提交的节点按批从目录库读回，第一批与删除旧文档在同一事务中写入
+        if bm25_index is not None:
+            replace = self.replace_ref_doc_ids
+            if self.batch.vids is not None:
+                for nodes in iter_batches(
+                    vector_store.iter_nodes(batch_size=config.INGEST_BATCH_CHUNKS, vids=self.batch.vids),
+                    config.INGEST_BATCH_CHUNKS,
+                ):
+                    bm25_index.add(
+                        ((node.node_id, node.ref_doc_id, node.get_content()) for node in nodes),
+                        replace_ref_doc_ids=replace,
+                    )
+                    replace = []
+            if replace:
+                bm25_index.delete_ref_docs(replace)
+        return self.batch.count
+
+    def abort(self) -> None:
+        """放弃全部暂存的节点"""
+        self._held = None
+        self.batch.abort()
+
+
+def _offset_progress(progress: Callable[..., None] | None, done: int) -> Callable[..., None] | None:
+    """把一批内的已嵌入数量换算为整个文档的已嵌入数量（加上前面批次的 done 个分块）"""
+    if progress is None:
+        return None
+    return lambda chunks_embedded: progress(chunks_embedded=done + chunks_embedded)
+
+
+def add_documents_to_index(
+    docs: Iterable,
+    replace_ref_doc_ids: List[str] | None = None,
+    document: Dict[str, Any] | None = None,
+    progress: Callable[..., None] | None = None,
+) -> int:
+    """
+    添加文档到向量索引
+    docs: Iterable[llama_index.core.schema.Document]，可以来自一个或多个PDF，可以是边提取边分块的生成器
+    replace_ref_doc_ids: 在同一事务中删除的旧文档（同名文件内容变化时替换旧节点）
+    document: 在同一事务中登记的文档记录，用于后续上传去重
+    progress: 进度回调，报告阶段（embedding / persisting）、已产生与已嵌入的分块数量
+
+    分块按 INGEST_BATCH_CHUNKS 个一批随到随嵌入并暂存到磁盘（见 DocumentWriter），
+    全部完成后作为一个向量段一次性提交，写入代价只与新增节点数相关
+
+    返回:
+        int - 实际写入的节点数量（近似去重后）
+    """
+    writer = DocumentWriter(replace_ref_doc_ids, document)
+    total = 0
+    embed_seconds = 0.0
+    try:
+        for docs_batch in iter_batches(docs, config.INGEST_BATCH_CHUNKS):
+            nodes = writer.prepare(docs_batch)
+            if progress is not None:
+                # 阶段只在第一批时切换为 embedding，之后只更新计数
+                progress(stage="embedding" if total == 0 else None, chunks_total=total + len(nodes))
+
+            started = time.perf_counter()
+            embed_nodes_sorted(nodes, progress=_offset_progress(progress, total))
+            embed_seconds += time.perf_counter() - started
+            writer.add(nodes)
+            total += len(nodes)
+
+        if progress is not None:
+            progress(stage="persisting")
+        count = writer.commit()
+    except BaseException:
+        writer.abort()
+        raise
+
+    logger.info(
+        "已插入 %d 个文档到向量索引",
+        count,
+        extra={
+            "replaced": writer.replace_ref_doc_ids,
+            "embed_time_ms": round(embed_seconds * 1000, 2),
+            "chunks_per_sec": round(count / embed_seconds, 2) if embed_seconds > 0 else None,
+        },
+    )
+    return count
+
+
+def prepare_nodes(docs: List, replace_ref_doc_ids: List[str] | None = None) -> List[TextNode]:
+    """将分块后的Document转换为待写入的节点：近似去重（可选）并链接相邻分块，尚未计算嵌入"""
+    _load_or_create_index()
+    nodes = documents_to_nodes(docs)
+    if nodes and config.DEDUP_NEAR_DUPLICATES:
+        nodes = _collapse_near_duplicates(nodes, replace_ref_doc_ids or [])
+    _link_neighbors(nodes)
+    return nodes
+
+
+def insert_nodes(
+    nodes: List[TextNode],
+    replace_ref_doc_ids: List[str] | None = None,
+    document: Dict[str, Any] | None = None,
+    progress: Callable[..., None] | None = None,
+) -> int:
+    """
+    一次性写入 prepare_nodes 返回的全部节点（基准测试等节点已在内存中的场景）：计算尚未嵌入的节点
+    （已有 node.embedding 的节点不再嵌入），作为一个向量段提交，并同步写入BM25倒排索引；参数见 add_documents_to_index
     """
-    logger.info("开始查询处理 - 查询内容: %s", query_text)
-    
     _load_or_create_index()
 
-    # 检查索引中是否有文档
-    doc_count = len(index.docstore.docs)
+    replace_ref_doc_ids = replace_ref_doc_ids or []
+    if document is not None:
+        document = dict(document, chunk_count=len(nodes))
+
+    if progress is not None:
+        progress(stage="embedding", chunks_total=len(nodes))
+    started = time.perf_counter()
+    embed_nodes_sorted(nodes, progress=progress)
+    embed_seconds = time.perf_counter() - started
+
+    if progress is not None:
+        progress(stage="persisting")
+    with vector_store.append_batch(replace_ref_doc_ids=replace_ref_doc_ids, document=document):
+        index.insert_nodes(nodes)
+    # 倒排索引与向量存储分别提交；两者不一致时（中途崩溃）下次加载索引会重建倒排索引
+    if bm25_index is not None:
+        bm25_index.add(
+            ((node.node_id, node.ref_doc_id, node.get_content()) for node in nodes),
+            replace_ref_doc_ids=replace_ref_doc_ids,
+        )
+
+    logger.info(
+        "已插入 %d 个文档到向量索引",
+        len(nodes),
+        extra={
+            "replaced": replace_ref_doc_ids,
+            "embed_time_ms": round(embed_seconds * 1000, 2),
+            "chunks_per_sec": round(len(nodes) / embed_seconds, 2) if embed_seconds > 0 else None,
+        },
+    )
+    return len(nodes)
+
+
+EMPTY_INDEX_MESSAGE = "错误：向量索引为空，请先上传PDF文档"
+NO_RESULT_MESSAGE = "抱歉，没有找到相关的文档内容。请尝试用不同的关键词提问。"
+# LLM调用失败时返回的文档摘要（fallback_summary）以此开头
+FALLBACK_SUMMARY_HEADER = "根据检索到的文档，相关内容如下："
+
+
+def index_is_empty() -> bool:
+    """向量索引中是否没有任何节点"""
+    _load_or_create_index()
+    doc_count = vector_store.count()
     logger.info("向量索引中现有文档数量: %d", doc_count)
-    
-    if doc_count == 0:
-        return "错误：向量索引为空，请先上传PDF文档"
+    return doc_count == 0
+
+
+def index_version() -> int:
+    """向量索引的数据版本号，每次写入或删除节点后递增"""
+    _load_or_create_index()
+    return vector_store.version
 
+
+def embed_query(query_text: str, timings: Dict[str, float] | None = None) -> List[float]:
+    """计算查询嵌入（CPU密集，应在线程池中调用）；timings 不为None时写入 embed_ms"""
+    started = time.perf_counter()
+    embedding = Settings.embed_model.get_query_embedding(query_text)
+    metrics.EMBED_BATCH_SECONDS.labels(kind="query").observe(time.perf_counter() - started)
+    if timings is not None:
+        timings["embed_ms"] = _elapsed_ms(started)
+    return embedding
+
+
+def get_retriever(top_k: int) -> BaseRetriever:
+    """
+    获取 similarity_top_k 为 top_k 的向量检索器（按 top_k 缓存复用）
+
+    检索器只持有索引与向量存储的引用，上传文档写入同一个向量存储，不需要重建；
+    重新加载或关闭索引时清空缓存
+    """
+    _load_or_create_index()
+    retriever = _retrievers.get(top_k)
+    if retriever is None:
+        with _engine_lock:
+            retriever = _retrievers.get(top_k)
+            if retriever is None:
+                retriever = index.as_retriever(similarity_top_k=top_k)
+                _retrievers[top_k] = retriever
+    return retriever
+
+
+def get_llm():
+    """获取LLM：首次调用时创建DeepSeek客户端；已通过 Settings.llm 设置（如基准测试的桩LLM）时直接使用"""
+    global llm_client
+
+    # Settings.llm 未设置时读取会解析为默认的OpenAI LLM，这里先检查内部字段
+    if Settings._llm is None:
+        with _llm_lock:
+            if Settings._llm is None:
+                from app.llm.DeepSeekLLM import DeepSeekLLM
+                from app.llm.resilient_client import ResilientLLMClient
+
+                client = ResilientLLMClient(
+                    api_key=DEEPSEEK_API_KEY,
+                    base_url=DEEPSEEK_API_BASE,
+                    max_connections=config.LLM_MAX_CONNECTIONS,
+                    timeout=config.LLM_TIMEOUT,
+                    connect_timeout=config.LLM_CONNECT_TIMEOUT,
+                    keepalive_expiry=config.LLM_KEEPALIVE_EXPIRY,
+                    deadline=config.LLM_DEADLINE,
+                    max_retries=config.LLM_MAX_RETRIES,
+                    retry_base_delay=config.LLM_RETRY_BASE_DELAY,
+                    retry_max_delay=config.LLM_RETRY_MAX_DELAY,
+                    circuit_failures=config.LLM_CIRCUIT_FAILURES,
+                    circuit_reset=config.LLM_CIRCUIT_RESET,
+                    hedge_after=config.LLM_HEDGE_AFTER,
+                    tokens_per_minute=config.LLM_TOKENS_PER_MINUTE,
+                )
+                llm_client = client
+                Settings.llm = DeepSeekLLM(
+                    api_key=DEEPSEEK_API_KEY,
+                    base_url=DEEPSEEK_API_BASE,
+                    model=DEEPSEEK_MODEL,
+                    client=client,
+                )
+    return Settings.llm
+
+
+async def close_llm() -> None:
+    """应用关闭时关闭LLM客户端的同步与异步连接池"""
+    global llm_client
+
+    if llm_client is not None:
+        client, llm_client = llm_client, None
+        await client.aclose()
+        client.close()
+
+
+def warmup() -> None:
+    """
+    预热：加载索引与嵌入模型（完成一次查询嵌入）、上下文计量分词器并创建LLM客户端，完成后 is_ready() 为 True
+
+    应用启动时在后台线程中调用，失败时记录 warmup_error（模型仍会在首次使用时重试加载）
+    """
+    global warmup_seconds, warmup_error
+
+    started = time.perf_counter()
     try:
-        logger.info("创建查询引擎 - top_k: %d", top_k)
-        query_engine = index.as_query_engine(
-            similarity_top_k=top_k
+        _load_or_create_index()
+        Settings.embed_model.get_query_embedding("warmup")
+        # 分词器可能需要从HuggingFace Hub下载，在预热阶段而不是首次查询时加载
+        get_token_counter(config.CONTEXT_TOKENIZER)(["warmup"])
+        get_llm()
+    except Exception as e:
+        warmup_error = str(e)
+        logger.error("模型预热失败: %s", e, exc_info=True)
+        return
+    warmup_error = None
+    warmup_seconds = time.perf_counter() - started
+    logger.info("模型预热完成", extra={"warmup_time_ms": round(warmup_seconds * 1000, 2)})
+
+
+def is_ready() -> bool:
+    """就绪：索引已加载、嵌入模型已加载、LLM已创建"""
+    embed_model = Settings._embed_model
+    embed_ready = embed_model is not None and getattr(embed_model, "loaded", True)
+    return index is not None and embed_ready and Settings._llm is not None
+
+
+def get_synthesizer(streaming: bool = False) -> BaseSynthesizer:
+    """获取响应合成器（按 QUERY_RESPONSE_MODE 与是否流式缓存复用，LLM变化时重建）"""
+    key = (config.QUERY_RESPONSE_MODE, streaming)
+    llm = get_llm()
+    cached = _synthesizers.get(key)
+    if cached is None or cached[0] is not llm:
+        with _engine_lock:
+            cached = _synthesizers.get(key)
+            if cached is None or cached[0] is not llm:
+                synthesizer = get_response_synthesizer(
+                    llm=llm,
+                    response_mode=ResponseMode(config.QUERY_RESPONSE_MODE),
+                    streaming=streaming,
+                )
+                cached = (llm, synthesizer)
+                _synthesizers[key] = cached
+    return cached[1]
+
+
+def _elapsed_ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 2)
+
+
+def retrieve_nodes(
+    query_text: str,
+    top_k: int = 5,
+    query_embedding: List[float] | None = None,
+    timings: Dict[str, float] | None = None,
+    rerank: bool | None = None,
+) -> List[NodeWithScore]:
+    """
+    检索与查询最相关的节点（查询嵌入 + 向量检索，CPU密集，应在线程池中调用）
+
+    启用混合检索时，向量检索与BM25检索各取 HYBRID_CANDIDATES 个候选，用RRF融合后取top_k；
+    启用重排序时（rerank 为None时取 RERANK_ENABLED），先取 RERANK_CANDIDATES 个候选，
+    由交叉编码器打分后保留top_k；
+    已计算过查询嵌入时（如问答缓存的语义查询）通过 query_embedding 传入，不再重复计算。
+    返回的节点已按 CONTEXT_TOKEN_BUDGET 打包（见 pack_context），可直接用于生成回答与引用。
+
+    timings 不为None时写入各阶段耗时（毫秒）：embed_ms（查询嵌入）/ search_ms（向量与BM25检索）/
+    rerank_ms（重排序）/ expand_ms（相邻分块扩展）/ pack_ms（上下文打包），以及 context_tokens
+    """
+    _load_or_create_index()
+    timings = timings if timings is not None else {}
+    rerank = config.RERANK_ENABLED if rerank is None else rerank
+    if query_embedding is None:
+        query_embedding = embed_query(query_text, timings)
+
+    started = time.perf_counter()
+    query = QueryBundle(query_str=query_text, embedding=query_embedding)
+    # 重排序时检索更宽的候选集，由交叉编码器决定最终的top_k
+    retrieve_k = max(config.RERANK_CANDIDATES, top_k) if rerank else top_k
+    bm25 = bm25_index
+    if bm25 is None:
+        nodes = get_retriever(retrieve_k).retrieve(query)
+    else:
+        candidates = max(config.HYBRID_CANDIDATES, retrieve_k)
+        dense = get_retriever(candidates).retrieve(query)
+        sparse = bm25.search(query_text, candidates)
+        nodes = reciprocal_rank_fusion(dense, sparse, retrieve_k)
+        logger.info("混合检索候选数量 - 向量: %d, BM25: %d", len(dense), len(sparse))
+    metrics.VECTOR_SEARCH_SECONDS.observe(time.perf_counter() - started)
+    timings["search_ms"] = _elapsed_ms(started)
+    logger.info("检索器找到文档数量: %d", len(nodes))
+
+    if rerank:
+        started = time.perf_counter()
+        nodes = rerank_nodes(query_text, nodes, top_k)
+        metrics.RERANK_SECONDS.observe(time.perf_counter() - started)
+        timings["rerank_ms"] = _elapsed_ms(started)
+
+    started = time.perf_counter()
+    nodes = expand_with_neighbors(nodes, config.QUERY_NEIGHBOR_WINDOW)
+    timings["expand_ms"] = _elapsed_ms(started)
+    return pack_context(query_text, nodes, timings)
+
+
+def pack_context(
+    query_text: str,
+    nodes: List[NodeWithScore],
+    timings: Dict[str, float] | None = None,
+) -> List[NodeWithScore]:
+    """
+    按token预算打包检索结果（去除近似重复、按相关度排序、在句子边界截断）
+
+    timings 不为None时写入 pack_ms 与 context_tokens（上下文token数）；
+    实际发送给LLM的提示词token数（prompt_tokens）在生成回答时统计，见 _record_prompts
+    """
+    started = time.perf_counter()
+    count_tokens = get_token_counter(config.CONTEXT_TOKENIZER)
+    packed, context_tokens = pack_nodes(
+        nodes,
+        budget_tokens=config.CONTEXT_TOKEN_BUDGET,
+        count_tokens=count_tokens,
+        dedup_distance=config.CONTEXT_DEDUP_DISTANCE,
+        min_chunk_tokens=config.CONTEXT_MIN_CHUNK_TOKENS,
+    )
+    if timings is not None:
+        timings["pack_ms"] = _elapsed_ms(started)
+        timings["context_tokens"] = context_tokens
+    logger.info("上下文打包: %d -> %d 个分块，上下文 %d tokens", len(nodes), len(packed), context_tokens)
+    return packed
+
+
+def reciprocal_rank_fusion(
+    dense: List[NodeWithScore],
+    sparse: List[tuple],
+    top_k: int,
+    k: int | None = None,
+) -> List[NodeWithScore]:
+    """
+    RRF融合：score = Σ 1 / (k + rank)，rank从1开始
+
+    参数:
+        dense: 向量检索结果（按相似度降序）
+        sparse: BM25检索结果 [(节点ID, 得分)]（按得分降序）
+        top_k: 返回的节点数量
+        k: RRF平滑常数，默认 RRF_K
+    """
+    k = k or config.RRF_K
+    scores: Dict[str, float] = {}
+    nodes: Dict[str, BaseNode] = {}
+    for rank, hit in enumerate(dense, 1):
+        scores[hit.node.node_id] = scores.get(hit.node.node_id, 0.0) + 1.0 / (k + rank)
+        nodes[hit.node.node_id] = hit.node
+    for rank, (node_id, _) in enumerate(sparse, 1):
+        scores[node_id] = scores.get(node_id, 0.0) + 1.0 / (k + rank)
+
+    ranked = sorted(scores, key=scores.get, reverse=True)[:top_k]
+    # 只出现在BM25结果中的节点从目录库读取
+    missing = [node_id for node_id in ranked if node_id not in nodes]
+    if missing:
+        nodes.update((node.node_id, node) for node in vector_store.get_nodes(missing))
+    return [NodeWithScore(node=nodes[node_id], score=scores[node_id]) for node_id in ranked if node_id in nodes]
+
+
+def _stitch(chunks: List[BaseNode]) -> str:
+    """按字符偏移拼接相邻分块，去掉分块之间的重叠部分"""
+    text = chunks[0].get_content()
+    end = chunks[0].end_char_idx
+    for chunk in chunks[1:]:
+        content = chunk.get_content()
+        if end is not None and chunk.start_char_idx is not None and chunk.start_char_idx < end:
+            content = content[end - chunk.start_char_idx:]
+        text += content
+        if chunk.end_char_idx is not None:
+            end = max(end or 0, chunk.end_char_idx)
+    return text
+
+
+def expand_with_neighbors(nodes: List[NodeWithScore], window: int) -> List[NodeWithScore]:
+    """
+    相邻上下文扩展：为每个命中的分块补充同一文档中前后 window 个分块
+
+    相邻分块按 (ref_doc_id, chunk_index) 从目录库读取，不需要重新嵌入；
+    同一文档中范围重叠或相邻的命中合并为一个节点，得分取其中的最高分。
+    没有分块序号的旧节点原样返回。
+    """
+    if window <= 0 or not nodes:
+        return nodes
+
+    # 每个文档的命中范围 [first, last] 与得分
+    ranges: Dict[str, List[List[Any]]] = {}
+    passthrough = []
+    for hit in nodes:
+        chunk_index = hit.node.metadata.get("chunk_index")
+        if chunk_index is None or hit.node.ref_doc_id is None:
+            passthrough.append(hit)
+            continue
+        ranges.setdefault(hit.node.ref_doc_id, []).append(
+            [max(chunk_index - window, 0), chunk_index + window, hit.score, hit.node]
         )
-        
-        logger.info("执行查询...")
-        response = query_engine.query(query_text)
-        
-        # 详细检查响应对象
-        logger.debug("查询响应类型: %s", type(response))
-        logger.debug("响应对象属性: %s", [attr for attr in dir(response) if not attr.startswith('_')])
-        
-        # 尝试多种方式获取响应内容
-        response_str = ""
-        
-        # 方法1: 检查response属性
-        if hasattr(response, 'response') and response.response:
-            actual_response = response.response
-            logger.info("获取到response.response内容")
+
+    expanded = list(passthrough)
+    for ref_doc_id, doc_ranges in ranges.items():
+        doc_ranges.sort(key=lambda r: r[0])
+        merged = [doc_ranges[0]]
+        for first, last, score, node in doc_ranges[1:]:
+            current = merged[-1]
+            if first <= current[1] + 1:
+                current[1] = max(current[1], last)
+                if (score or 0) > (current[2] or 0):
+                    current[2], current[3] = score, node
+            else:
+                merged.append([first, last, score, node])
+
+        for first, last, score, hit_node in merged:
+            chunks = vector_store.get_neighbors(ref_doc_id, first, last) or [hit_node]
+            metadata = dict(hit_node.metadata)
+            metadata.update(
+                page=min(c.metadata.get("page", metadata.get("page")) for c in chunks),
+                page_end=max(c.metadata.get("page_end", metadata.get("page_end")) for c in chunks),
+            )
+            node = TextNode(
+                id_=hit_node.node_id,
+                text=_stitch(chunks),
+                metadata=metadata,
+                excluded_embed_metadata_keys=list(hit_node.excluded_embed_metadata_keys),
+                excluded_llm_metadata_keys=list(hit_node.excluded_llm_metadata_keys),
+                relationships=dict(hit_node.relationships),
+                start_char_idx=chunks[0].start_char_idx,
+                end_char_idx=max((c.end_char_idx or 0) for c in chunks) or None,
+            )
+            expanded.append(NodeWithScore(node=node, score=score))
+
+    expanded.sort(key=lambda n: n.score or 0, reverse=True)
+    return expanded
+
+
+def _response_to_text(response) -> str:
+    """尝试多种方式获取响应内容"""
+    # 方法1: 检查response属性
+    if hasattr(response, 'response') and response.response:
+        actual_response = response.response
+        logger.info("获取到response.response内容")
+        # 预览只在DEBUG级别生效时生成，避免每次查询都截取响应文本
+        if logger.isEnabledFor(logging.DEBUG):
             logger.debug("response.response类型: %s", type(actual_response))
             logger.debug("response.response内容长度: %d", len(str(actual_response)))
             logger.debug("response.response内容: %s", str(actual_response)[:500] + "...")
-            response_str = str(actual_response)
-        
-        # 方法2: 检查其他可能的属性
-        elif hasattr(response, 'response_txt') and response.response_txt:
-            response_str = response.response_txt
-            logger.info("使用response_txt属性获取响应内容")
-        
-        # 方法3: 检查是否有get_response()方法
-        elif hasattr(response, 'get_response') and callable(getattr(response, 'get_response')):
-            response_str = response.get_response()
-            logger.info("使用get_response()方法获取响应内容")
-        
-        # 方法4: 直接转换为字符串
-        else:
-            response_str = str(response)
-            logger.info("直接转换response对象为字符串")
-            logger.debug("转换后的响应长度: %d", len(response_str))
-            logger.debug("转换后的响应内容: %s", response_str[:500] + "...")
-        
-        # 检查响应是否为空
-        if not response_str or response_str.strip() == "" or response_str.strip() == "Empty Response":
+        return str(actual_response)
+
+    # 方法2: 检查其他可能的属性
+    if hasattr(response, 'response_txt') and response.response_txt:
+        logger.info("使用response_txt属性获取响应内容")
+        return response.response_txt
+
+    # 方法3: 检查是否有get_response()方法
+    if hasattr(response, 'get_response') and callable(getattr(response, 'get_response')):
+        logger.info("使用get_response()方法获取响应内容")
+        return response.get_response()
+
+    # 方法4: 直接转换为字符串
+    response_str = str(response)
+    logger.info("直接转换response对象为字符串")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("转换后的响应长度: %d", len(response_str))
+        logger.debug("转换后的响应内容: %s", response_str[:500] + "...")
+    return response_str
+
+
+def _is_empty_response(response_str: str) -> bool:
+    return not response_str or response_str.strip() == "" or response_str.strip() == "Empty Response"
+
+
+def _build_fallback_prompt(query_text: str, nodes: List[NodeWithScore]) -> str:
+    """手动构建提示词：检索结果 + 问题（节点已由 pack_context 按token预算打包，不再按字符截断）"""
+    context_parts = ["根据以下文档内容回答问题："]
+    for i, node in enumerate(nodes, 1):
+        context_parts.append(f"\n--- 文档 {i} ---")
+        context_parts.append(node.node.get_content())
+
+    context_text = "\n".join(context_parts)
+    return f"{context_text}\n\n问题：{query_text}"
+
+
+def _non_empty(llm_response: str) -> str:
+    """手动LLM调用的结果，仍为空时按调用失败处理"""
+    if _is_empty_response(llm_response):
+        raise LLMError("LLM返回空响应")
+    logger.info("手动LLM调用成功")
+    return llm_response
+
+
+def fallback_summary(nodes: List[NodeWithScore]) -> str:
+    """LLM调用失败（LLMError）时返回的文档摘要：前3个检索结果的预览"""
+    summary_parts = [FALLBACK_SUMMARY_HEADER]
+    for i, node in enumerate(nodes[:3], 1):
+        preview = node.text[:300] + "..." if len(node.text) > 300 else node.text
+        summary_parts.append(f"\n{i}. {preview}")
+    return "\n".join(summary_parts)
+
+
+# 当前查询实际发送给LLM的提示词，按上下文变量隔离并发的查询（None 表示不记录）
+_sent_prompts: contextvars.ContextVar[List[str] | None] = contextvars.ContextVar("sent_prompts", default=None)
+
+
+class _PromptRecorder(BaseEventHandler):
+    """从LLM调用开始事件（llm_completion_callback 发出）中记录实际发送的提示词"""
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "PromptRecorder"
+
+    def handle(self, event: Any, **kwargs: Any) -> None:
+        prompts = _sent_prompts.get()
+        if prompts is not None and isinstance(event, LLMCompletionStartEvent):
+            prompts.append(event.prompt)
+
+
+get_dispatcher().add_event_handler(_PromptRecorder())
+
+
+@contextlib.contextmanager
+def _record_prompts(timings: Dict[str, float] | None):
+    """
+    记录期间响应合成器（含空响应时的手动回退调用）实际发送给LLM的提示词，
+    按 CONTEXT_TOKENIZER 计量后写入 timings["prompt_tokens"]（多次调用时累加）
+    """
+    prompts: List[str] = []
+    token = _sent_prompts.set(prompts)
+    try:
+        yield
+    finally:
+        # 异步生成器被其他上下文关闭时无法重置，记录列表随生成器一起丢弃
+        with contextlib.suppress(ValueError):
+            _sent_prompts.reset(token)
+        if timings is not None:
+            count_tokens = get_token_counter(config.CONTEXT_TOKENIZER)
+            timings["prompt_tokens"] = sum(count_tokens(prompts)) if prompts else 0
+
+
+def synthesize_answer(
+    query_text: str,
+    nodes: List[NodeWithScore],
+    timings: Dict[str, float] | None = None,
+) -> str:
+    """
+    基于已检索的节点生成回答（同步）
+
+    响应为空时，复用同一批节点手动构建提示词调用LLM，不再重复检索；
+    LLM调用失败时抛出 LLMError，由调用方回退到 fallback_summary；
+    timings 不为None时写入 synthesize_ms（含回退调用）与实际发送的 prompt_tokens
+    """
+    if not nodes:
+        logger.warning("检索器未找到相关文档")
+        return NO_RESULT_MESSAGE
+
+    started = time.perf_counter()
+    try:
+        with _record_prompts(timings):
+            response = get_synthesizer().synthesize(query_text, nodes)
+            response_str = _response_to_text(response)
+            if not _is_empty_response(response_str):
+                return response_str
+
+            logger.warning("响应为空，尝试手动构建查询流程")
+            return _non_empty(get_llm().complete(_build_fallback_prompt(query_text, nodes)).text)
+    finally:
+        metrics.LLM_SECONDS.labels(mode="complete").observe(time.perf_counter() - started)
+        if timings is not None:
+            timings["synthesize_ms"] = _elapsed_ms(started)
+
+
+async def asynthesize_answer(
+    query_text: str,
+    nodes: List[NodeWithScore],
+    timings: Dict[str, float] | None = None,
+) -> str:
+    """基于已检索的节点生成回答（异步，LLM调用不阻塞事件循环），见 synthesize_answer"""
+    if not nodes:
+        logger.warning("检索器未找到相关文档")
+        return NO_RESULT_MESSAGE
+
+    started = time.perf_counter()
+    try:
+        with _record_prompts(timings):
+            response = await get_synthesizer().asynthesize(query_text, nodes)
+            response_str = _response_to_text(response)
+            if not _is_empty_response(response_str):
+                return response_str
+
             logger.warning("响应为空，尝试手动构建查询流程")
-            
-            # 手动构建查询流程：检索 + 手动调用LLM
-            retriever = index.as_retriever(similarity_top_k=top_k)
-            retrieved_nodes = retriever.retrieve(query_text)
-            logger.info("检索器找到文档数量: %d", len(retrieved_nodes))
-            
-            if retrieved_nodes:
-                logger.info("检索器找到了相关文档，手动构建提示词")
-                
-                # 构建上下文
-                context_parts = ["根据以下文档内容回答问题："]
-                for i, node in enumerate(retrieved_nodes, 1):
-                    context_parts.append(f"\n--- 文档 {i} ---")
-                    context_parts.append(node.text[:1000])  # 限制每个文档长度
-                
-                context_text = "\n".join(context_parts)
-                full_prompt = f"{context_text}\n\n问题：{query_text}"
-                
-                # 直接调用LLM，但需要包装成CompletionResponse
-                from app.services.vector_service import Settings
-                from llama_index.core.llms import CompletionResponse
-                
-                raw_response = Settings.llm.complete(full_prompt)
-                
-                # 检查是否是CompletionResponse对象
-                if isinstance(raw_response, CompletionResponse):
-                    llm_response = raw_response.text
-                else:
-                    llm_response = str(raw_response)
-                
-                if llm_response and not llm_response.startswith("DeepSeek API调用失败"):
-                    logger.info("手动LLM调用成功")
-                    return llm_response
-                else:
-                    # 如果LLM调用失败，返回文档摘要
-                    logger.warning("手动LLM调用失败，返回文档摘要")
-                    summary_parts = ["根据检索到的文档，相关内容如下："]
-                    for i, node in enumerate(retrieved_nodes[:3], 1):
-                        preview = node.text[:300] + "..." if len(node.text) > 300 else node.text
-                        summary_parts.append(f"\n{i}. {preview}")
-                    return "\n".join(summary_parts)
+            return _non_empty((await get_llm().acomplete(_build_fallback_prompt(query_text, nodes))).text)
+    finally:
+        metrics.LLM_SECONDS.labels(mode="complete").observe(time.perf_counter() - started)
+        if timings is not None:
+            timings["synthesize_ms"] = _elapsed_ms(started)
+
+
+def node_citations(nodes: List[NodeWithScore]) -> List[Dict[str, Any]]:
+    """检索结果的引用信息：文件、起止页码与字符偏移"""
+    return [
+        {
+            "node_id": node.node.node_id,
+            "score": node.score,
+            "file": node.node.metadata.get("source"),
+            "page": node.node.metadata.get("page"),
+            "page_end": node.node.metadata.get("page_end"),
+            "start_char": node.node.start_char_idx,
+            "end_char": node.node.end_char_idx,
+        }
+        for node in nodes
+    ]
+
+
+def node_sources(nodes: List[NodeWithScore], preview_chars: int = 200) -> List[Dict[str, Any]]:
+    """检索结果的来源信息：引用信息加文本预览（流式接口在生成回答之前先返回）"""
+    sources = node_citations(nodes)
+    for source, node in zip(sources, nodes):
+        text = node.node.get_content()
+        source["text"] = text[:preview_chars] + "..." if len(text) > preview_chars else text
+    return sources
+
+
+async def astream_answer(
+    query_text: str,
+    nodes: List[NodeWithScore],
+    timings: Dict[str, float] | None = None,
+) -> AsyncIterator[str]:
+    """
+    基于已检索的节点流式生成回答，逐个返回文本增量
+
+    通过 streaming=True 的响应合成器调用 DeepSeekLLM.astream_complete；
+    没有任何输出时，与 asynthesize_answer 一样回退到手动构建的提示词；
+    LLM调用失败（LLMError）时在已输出的内容之后返回文档摘要；
+    timings 不为None时在生成结束后写入实际发送的 prompt_tokens
+    """
+    if not nodes:
+        logger.warning("检索器未找到相关文档")
+        yield NO_RESULT_MESSAGE
+        return
+
+    produced = False
+    try:
+        with _record_prompts(timings):
+            response = await get_synthesizer(streaming=True).asynthesize(query_text, nodes)
+            if hasattr(response, "async_response_gen"):
+                async for delta in response.async_response_gen():
+                    if delta:
+                        produced = True
+                        yield delta
             else:
-                logger.warning("检索器也未找到相关文档")
-                return "抱歉，没有找到相关的文档内容。请尝试用不同的关键词提问。"
-        
-        return response_str
+                # 非流式响应（如合成器直接返回了空响应）
+                response_str = _response_to_text(response)
+                if not _is_empty_response(response_str):
+                    produced = True
+                    yield response_str
+            if produced:
+                return
+
+            logger.warning("流式响应为空，尝试手动构建查询流程")
+            async for chunk in await get_llm().astream_complete(_build_fallback_prompt(query_text, nodes)):
+                if chunk.delta:
+                    produced = True
+                    yield chunk.delta
+            if not produced:
+                raise LLMError("LLM返回空响应")
+    except LLMError as e:
+        logger.warning("LLM调用失败，返回文档摘要: %s", e)
+        yield ("\n\n" if produced else "") + fallback_summary(nodes)
+
+
+def query_vector_store(query_text: str, top_k: int = 5) -> str:
+    """
+    向量查询接口（同步）：检索 + 生成回答
+
+    问题诊断步骤：
+    1. 检查向量索引状态
+    2. 检查DeepSeek API调用
+    3. 检查查询处理流程
+    """
+    logger.info("开始查询处理 - 查询内容: %s", query_text)
+
+    if index_is_empty():
+        return EMPTY_INDEX_MESSAGE
+
+    try:
+        logger.info("执行查询 - top_k: %d", top_k)
+        timings: Dict[str, float] = {}
+        nodes = retrieve_nodes(query_text, top_k, timings=timings)
+        try:
+            answer = synthesize_answer(query_text, nodes, timings=timings)
+        except LLMError as e:
+            logger.warning("LLM调用失败，返回文档摘要: %s", e)
+            answer = fallback_summary(nodes)
+        logger.info("查询完成", extra=timings)
+        return answer
     except Exception as e:
         logger.error("查询错误: %s", str(e), exc_info=True)
         return f"查询失败：{str(e)}"
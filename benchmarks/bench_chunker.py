@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+分块基准：SentenceSplitter 与 CJKChunker 的吞吐与分块长度分布对比
+
+- before: LlamaIndex SentenceSplitter（CHUNK_SIZE / CHUNK_OVERLAP，按tiktoken计量）
+- after:  CJKChunker（按嵌入模型分词器计量，在中文标点处切分）
+
+分块长度统一用嵌入模型的分词器计量（含特殊token），超过 CHUNK_MAX_TOKENS 的分块在嵌入时会被截断。
+文本取自内置PDF，--repeat 将全文重复若干次以测量多MB文本上的吞吐。
+
+用法:
+    python -m benchmarks.bench_chunker [--pdf path/to.pdf] [--repeat 4]
+"""
+import argparse
+
+from benchmarks.common import BUNDLED_PDF, percentile, print_table, timer
+
+from app.config import config
+from app.services.chunker import CJKChunker, create_chunker, load_tokenizer
+from app.services.pdf_service import read_pdf
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf", default=BUNDLED_PDF, help="用于测试的PDF文件")
+    parser.add_argument("--repeat", type=int, default=4, help="全文重复次数")
+    args = parser.parse_args()
+
+    text = read_pdf(args.pdf) * args.repeat
+    size_mb = len(text.encode("utf-8")) / (1024 * 1024)
+    tokenizer = load_tokenizer(config.EMBED_MODEL_NAME)
+    # 统一的长度计量：嵌入模型实际看到的token数（含特殊token）
+    meter = CJKChunker(config.CHUNK_MAX_TOKENS, 0, tokenizer=tokenizer)
+    special = tokenizer.num_special_tokens_to_add() if tokenizer is not None else 2
+
+    splitters = {
+        "before": create_chunker(
+            "sentence", config.EMBED_MODEL_NAME, config.CHUNK_MAX_TOKENS, config.CHUNK_OVERLAP_TOKENS,
+            config.CHUNK_SIZE, config.CHUNK_OVERLAP,
+        ),
+        "after": create_chunker(
+            "cjk", config.EMBED_MODEL_NAME, config.CHUNK_MAX_TOKENS, config.CHUNK_OVERLAP_TOKENS,
+            config.CHUNK_SIZE, config.CHUNK_OVERLAP,
+        ),
+    }
+
+    rows = []
+    for name, splitter in splitters.items():
+        results = {}
+        with timer(results, name):
+            chunks = splitter.split_text(text)
+        lengths = [n + special for n in meter.count_tokens(chunks)]
+        truncated = sum(1 for n in lengths if n > config.CHUNK_MAX_TOKENS)
+        rows.append([
+            name,
+            size_mb / results[name],
+            len(chunks),
+            percentile(lengths, 50),
+            percentile(lengths, 95),
+            max(lengths, default=0),
+            f"{truncated / len(chunks):.1%}" if chunks else "-",
+        ])
+
+    print(f"文本大小: {size_mb:.2f} MB, 模型最大输入: {config.CHUNK_MAX_TOKENS} tokens"
+          f"{'' if tokenizer is not None else '（分词器不可用，使用近似计量）'}")
+    print_table(["分块器", "MB/s", "分块数", "p50(tokens)", "p95(tokens)", "max(tokens)", "被截断"], rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+嵌入后端基准：torch vs ONNX Runtime（fp32 / int8）的吞吐、内存与向量兼容性
+
+每种后端在独立的子进程中加载模型并嵌入同一批分块，统计：
+- chunks/sec（预热一批之后计时）
+- 子进程峰值常驻内存（ru_maxrss，含模型加载）
+- 与 torch 后端向量的余弦相似度（最小值 / 平均值），以及是否在 embeddings.COMPAT_MIN_COSINE 记录的容差之内
+
+onnx 后端需要安装 optimum[onnxruntime]，未安装时跳过。
+
+用法:
+    python -m benchmarks.bench_embed_backends [--chunks 512] [--threads 4] [--batch-size 64]
+"""
+import argparse
+import multiprocessing
+import resource
+import time
+
+from benchmarks.common import BUNDLED_PDF, print_table
+
+VARIANTS = [
+    ("torch", "torch", False),
+    ("onnx fp32", "onnx", False),
+    ("onnx int8", "onnx", True),
+]
+
+
+def run_variant(backend: str, quantize: bool, texts, threads: int, batch_size: int):
+    """子进程：加载嵌入模型并嵌入全部文本，返回 (耗时, 峰值内存MB, 向量)"""
+    import benchmarks.common  # noqa: F401  补齐环境变量
+
+    from app.config import config
+    from app.services.embeddings import create_embed_model
+
+    if backend == "torch":
+        import torch
+
+        torch.set_num_threads(threads)
+    model = create_embed_model(
+        backend=backend,
+        model_name=config.EMBED_MODEL_NAME,
+        batch_size=batch_size,
+        quantize=quantize,
+        threads=threads,
+        max_length=config.EMBED_MAX_LENGTH,
+        cache_dir=config.ONNX_CACHE_DIR,
+    )
+    model.get_text_embedding_batch(texts[:batch_size])
+
+    started = time.perf_counter()
+    vectors = model.get_text_embedding_batch(texts)
+    seconds = time.perf_counter() - started
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return seconds, peak_mb, vectors
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf", default=BUNDLED_PDF, help="用于测试的PDF文件")
+    parser.add_argument("--chunks", type=int, default=512, help="参与嵌入的分块数量")
+    parser.add_argument("--threads", type=int, default=4, help="推理线程数（torch / onnx 相同）")
+    parser.add_argument("--batch-size", type=int, default=64, help="嵌入批大小")
+    args = parser.parse_args()
+
+    import numpy as np
+
+    from app.services.embeddings import COMPAT_MIN_COSINE
+    from app.services.pdf_service import read_pdf, split_text_to_chunks
+
+    texts = split_text_to_chunks(read_pdf(args.pdf))[: args.chunks]
+    ctx = multiprocessing.get_context("spawn")
+
+    rows = []
+    reference = None
+    for name, backend, quantize in VARIANTS:
+        with ctx.Pool(1) as pool:
+            try:
+                seconds, peak_mb, vectors = pool.apply(
+                    run_variant, (backend, quantize, texts, args.threads, args.batch_size)
+                )
+            except ImportError as e:
+                print(f"跳过 {name}: {e}")
+                continue
+
+        vectors = np.asarray(vectors, dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        if backend == "torch":
+            reference = vectors
+            min_cos = mean_cos = 1.0
+            within = "-"
+        elif reference is not None:
+            cosines = (vectors * reference).sum(axis=1)
+            min_cos, mean_cos = float(cosines.min()), float(cosines.mean())
+            within = "是" if min_cos >= COMPAT_MIN_COSINE[quantize] else "否"
+        else:
+            min_cos = mean_cos = float("nan")
+            within = "-"
+        rows.append([name, len(texts) / seconds, peak_mb, f"{min_cos:.5f}", f"{mean_cos:.5f}", within])
+
+    print(f"分块数: {len(texts)}, 线程数: {args.threads}, 批大小: {args.batch_size}")
+    print_table(["后端", "chunks/sec", "峰值内存(MB)", "最小余弦", "平均余弦", "在容差内"], rows)
+
+
+if __name__ == "__main__":
+    main()
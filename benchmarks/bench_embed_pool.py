@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+多进程嵌入工作池基准：吞吐随工作进程数的扩展性
+
+对同一批分块，依次用 1, 2, 4, ... 个工作进程嵌入（总线程数固定为 --cores，
+每个进程 cores / workers 个线程），统计：
+- chunks/sec（工作池预热、模型加载之后计时）
+- 相对单进程的加速比与并行效率（加速比 / 进程数）
+
+只测嵌入与共享内存回传，不写索引、不使用嵌入缓存。
+
+用法:
+    python -m benchmarks.bench_embed_pool [--chunks 2048] [--cores 8] [--batch-size 64]
+"""
+import argparse
+import os
+import time
+
+from benchmarks.common import BUNDLED_PDF, print_table
+
+from app.config import config
+from app.services.embed_pool import EmbeddingPool
+from app.services.pdf_service import read_pdf, split_text_to_chunks
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf", default=BUNDLED_PDF, help="用于测试的PDF文件")
+    parser.add_argument("--chunks", type=int, default=2048, help="参与嵌入的分块数量（不足时重复）")
+    parser.add_argument("--cores", type=int, default=os.cpu_count() or 1, help="总推理线程数")
+    parser.add_argument("--batch-size", type=int, default=config.REINDEX_BATCH_SIZE, help="每个进程池任务嵌入的分块数")
+    args = parser.parse_args()
+
+    chunks = split_text_to_chunks(read_pdf(args.pdf))
+    texts = (chunks * (args.chunks // len(chunks) + 1))[: args.chunks]
+    counts = [n for n in (1, 2, 4, 8, 16, 32, 64) if n <= args.cores]
+
+    rows = []
+    base = None
+    for workers in counts:
+        with EmbeddingPool(
+            workers=workers,
+            threads_per_worker=args.cores // workers,
+            dim=config.EMBED_DIM,
+            backend=config.EMBED_BACKEND,
+            model_name=config.EMBED_MODEL_NAME,
+            batch_size=args.batch_size,
+            quantize=config.EMBED_QUANTIZE,
+            max_length=config.EMBED_MAX_LENGTH,
+            cache_dir=config.ONNX_CACHE_DIR,
+        ) as pool:
+            pool.warmup()
+            started = time.perf_counter()
+            pool.embed(texts)
+            seconds = time.perf_counter() - started
+
+        rate = len(texts) / seconds
+        base = base or rate
+        rows.append([workers, args.cores // workers, rate, rate / base, rate / base / workers])
+
+    print(f"分块数: {len(texts)}, 总线程数: {args.cores}, 批大小: {args.batch_size}, 后端: {config.EMBED_BACKEND}")
+    print_table(["进程数", "每进程线程数", "chunks/sec", "加速比", "并行效率"], rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+导入耗时基准：`import app.main` 的耗时预算
+
+在干净的子进程中导入应用（--repeat 次，取中位数），并用 `python -X importtime` 统计各模块的累计导入耗时：
+- 导入耗时中位数超过 --budget-ms 时退出码为1，可在CI中作为守卫
+- 导入应用时不应加载的重型模块（torch、transformers 等，见 FORBIDDEN_MODULES）被导入时同样失败
+- 输出累计耗时最高的顶层模块，便于定位新增的导入开销
+
+用法:
+    python -m benchmarks.bench_import_time [--budget-ms 3000] [--repeat 5] [--top 15]
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+from benchmarks.common import ROOT_DIR, print_table
+
+# 应在首次使用时才导入的模块（嵌入模型、交叉编码器、ONNX后端）
+FORBIDDEN_MODULES = (
+    "torch",
+    "transformers",
+    "sentence_transformers",
+    "onnxruntime",
+    "optimum",
+    "llama_index.embeddings.huggingface",
+)
+
+# -X importtime 输出: "import time: self [us] | cumulative | imported package"
+IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$")
+
+
+def run_import(target: str, importtime: bool = False) -> subprocess.CompletedProcess:
+    code = f"import time; t = time.perf_counter(); import {target}; print(time.perf_counter() - t)"
+    args = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", code]
+    result = subprocess.run(args, cwd=ROOT_DIR, env=os.environ.copy(), capture_output=True, text=True)
+    if result.returncode != 0:
+        sys.exit(f"导入 {target} 失败:\n{result.stderr[-2000:]}")
+    return result
+
+
+def parse_importtime(stderr: str):
+    """返回 (顶层模块 [(模块, 累计微秒)], 全部已导入模块名)"""
+    top_level, modules = [], set()
+    for line in stderr.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        if match is None:
+            continue
+        _, cumulative, indent, name = match.groups()
+        modules.add(name)
+        # 顶层模块的缩进只有一个空格
+        if len(indent) == 1:
+            top_level.append((name, int(cumulative)))
+    return top_level, modules
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", default="app.main", help="导入的模块")
+    parser.add_argument("--budget-ms", type=float, default=3000, help="导入耗时预算（毫秒，中位数）")
+    parser.add_argument("--repeat", type=int, default=5, help="重复次数")
+    parser.add_argument("--top", type=int, default=15, help="输出累计耗时最高的顶层模块数")
+    args = parser.parse_args()
+
+    # 第一次导入会写入 .pyc，不计入统计
+    run_import(args.target)
+    timings = [float(run_import(args.target).stdout.strip().splitlines()[-1]) * 1000 for _ in range(args.repeat)]
+    median_ms = statistics.median(timings)
+
+    top_level, modules = parse_importtime(run_import(args.target, importtime=True).stderr)
+    top_level.sort(key=lambda item: item[1], reverse=True)
+    print_table(["模块", "累计耗时(ms)"], [[name, us / 1000] for name, us in top_level[: args.top]])
+
+    forbidden = sorted(
+        name for name in modules if any(name == m or name.startswith(m + ".") for m in FORBIDDEN_MODULES)
+    )
+    print(
+        f"导入 {args.target}: 中位数 {median_ms:.1f} ms（最小 {min(timings):.1f} ms, 最大 {max(timings):.1f} ms），"
+        f"预算 {args.budget_ms:.0f} ms"
+    )
+
+    failed = False
+    if forbidden:
+        print(f"失败: 导入应用时加载了重型模块: {', '.join(forbidden[:10])}")
+        failed = True
+    if median_ms > args.budget_ms:
+        print(f"失败: 导入耗时超出预算 {median_ms - args.budget_ms:.1f} ms")
+        failed = True
+    if failed:
+        sys.exit(1)
+    print("通过")
+
+
+if __name__ == "__main__":
+    main()
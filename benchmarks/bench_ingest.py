@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+导入吞吐基准：逐文档 index.insert 与批量嵌入导入的对比
+
+在内置的《长安的荔枝》PDF上分别测量：
+- before: 旧实现，逐个 Document 调用 index.insert（每次都重新解析节点并嵌入少量文本）
+- after:  add_documents_to_index 使用的批量路径（按长度排序、整体批量嵌入、一次性提交）
+
+用法:
+    python -m benchmarks.bench_ingest [--limit 200] [--pdf path/to.pdf]
+"""
+import argparse
+import tempfile
+
+from benchmarks.common import BUNDLED_PDF, print_table, timer
+
+from llama_index.core import StorageContext, VectorStoreIndex
+
+from app.config import config
+from app.models.document import PDFDocument
+from app.services.faiss_store import MmapFaissVectorStore
+from app.services.pdf_service import read_pdf, split_text_to_chunks
+from app.services.vector_service import documents_to_nodes, embed_nodes_sorted
+
+
+def load_docs(pdf_path: str, limit: int):
+    text = read_pdf(pdf_path)
+    chunks = split_text_to_chunks(text)
+    if limit:
+        chunks = chunks[:limit]
+    return [PDFDocument(text=chunk, metadata={"source": "bench.pdf"}).to_node() for chunk in chunks]
+
+
+def run_before(docs) -> None:
+    """旧实现：内存向量存储 + 逐文档插入"""
+    index = VectorStoreIndex([], storage_context=StorageContext.from_defaults())
+    for doc in docs:
+        index.insert(doc)
+
+
+def run_after(docs, persist_dir: str) -> None:
+    """新实现：批量嵌入 + 一次性写入一个向量段"""
+    store = MmapFaissVectorStore(persist_dir=persist_dir, dim=config.EMBED_DIM, background_compaction=False)
+    try:
+        nodes = documents_to_nodes(docs)
+        embed_nodes_sorted(nodes)
+        store.add(nodes)
+    finally:
+        store.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf", default=BUNDLED_PDF, help="用于测试的PDF文件")
+    parser.add_argument("--limit", type=int, default=0, help="只使用前N个分块（0表示全部）")
+    args = parser.parse_args()
+
+    docs = load_docs(args.pdf, args.limit)
+    print(f"分块数量: {len(docs)}, embed_batch_size: {config.EMBED_BATCH_SIZE}")
+
+    # 预热：加载模型权重，避免首次调用的开销计入任一方
+    embed_nodes_sorted(documents_to_nodes(docs[:8]))
+
+    results = {}
+    with timer(results, "before"):
+        run_before(docs)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with timer(results, "after"):
+            run_after(docs, tmp_dir)
+
+    print_table(
+        ["路径", "耗时(s)", "chunks/sec"],
+        [[name, seconds, len(docs) / seconds] for name, seconds in results.items()],
+    )
+    print(f"加速比: {results['before'] / results['after']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
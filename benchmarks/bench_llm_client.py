@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+LLM客户端容错基准：模拟上游的长尾延迟与错误，对比重试、对冲与熔断的效果
+
+启动本地模拟服务（benchmarks/mock_llm_server.py），用 ResilientLLMClient 并发发出 --requests 个非流式请求：
+- 无重试：max_retries=0，429/500直接失败
+- 重试：带抖动的指数退避重试 429/5xx
+- 重试 + 对冲：请求超过 --hedge-after 秒未返回时再发一个相同请求
+统计成功率、延迟 p50/p95/p99 与上游实际收到的请求数（重试与对冲带来的额外负载）。
+
+最后模拟上游完全不可用：熔断器打开后请求不再发出、立即失败，统计上游实际收到的请求数与熔断拒绝次数。
+
+用法:
+    python -m benchmarks.bench_llm_client [--requests 200] [--concurrency 16] [--slow-rate 0.05] [--error-rate 0.05]
+"""
+import argparse
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List
+
+from benchmarks.common import percentile, print_table
+from benchmarks.mock_llm_server import MockLLMServer
+
+from app.llm.errors import CircuitOpenError, LLMError
+from app.llm.resilient_client import ResilientLLMClient
+
+REQUEST = {"model": "mock", "messages": [{"role": "user", "content": "长安的荔枝讲了什么？"}], "temperature": 0.3}
+
+
+async def run_load(client: ResilientLLMClient, requests: int, concurrency: int) -> Dict[str, Any]:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+
+    async def one() -> None:
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await client.acomplete(REQUEST)
+                latencies.append((time.perf_counter() - started) * 1000)
+            except LLMError as e:
+                errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+
+    await asyncio.gather(*(one() for _ in range(requests)))
+    await client.aclose()
+    return {"latencies": latencies, "errors": errors}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200, help="请求数")
+    parser.add_argument("--concurrency", type=int, default=16, help="并发数")
+    parser.add_argument("--latency", type=float, default=0.05, help="模拟服务的基础延迟（秒）")
+    parser.add_argument("--slow-rate", type=float, default=0.05, help="长尾请求比例")
+    parser.add_argument("--slow-latency", type=float, default=1.0, help="长尾请求延迟（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.05, help="返回500的比例")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.05, help="返回429的比例")
+    parser.add_argument("--hedge-after", type=float, default=0.2, help="对冲请求的延迟阈值（秒）")
+    args = parser.parse_args()
+    # 失败与熔断时客户端逐条记录日志，基准测试只输出统计结果
+    logging.getLogger("app.llm").setLevel(logging.CRITICAL)
+
+    common = dict(api_key="mock", timeout=10.0, deadline=15.0, retry_base_delay=0.05, retry_max_delay=0.5)
+    scenarios = [
+        ("无重试", dict(max_retries=0)),
+        ("重试", dict(max_retries=3)),
+        (f"重试 + 对冲 {args.hedge_after:g}s", dict(max_retries=3, hedge_after=args.hedge_after)),
+    ]
+
+    rows = []
+    with MockLLMServer(
+        latency=args.latency,
+        slow_rate=args.slow_rate,
+        slow_latency=args.slow_latency,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=0.05,
+    ) as server:
+        for name, options in scenarios:
+            server.reset_stats()
+            # 熔断阈值设得足够大，只比较重试与对冲
+            client = ResilientLLMClient(base_url=server.url, circuit_failures=10 ** 6, **common, **options)
+            result = asyncio.run(run_load(client, args.requests, args.concurrency))
+            latencies = result["latencies"]
+            rows.append([
+                name,
+                f"{len(latencies) / args.requests:.1%}",
+                percentile(latencies, 50), percentile(latencies, 95), percentile(latencies, 99),
+                server.requests,
+                ", ".join(f"{k}: {v}" for k, v in sorted(result["errors"].items())) or "-",
+            ])
+
+    print(f"请求数: {args.requests}, 并发: {args.concurrency}, 长尾: {args.slow_rate:.0%} × {args.slow_latency}s, "
+          f"500: {args.error_rate:.0%}, 429: {args.rate_limit_rate:.0%}")
+    print_table(["场景", "成功率", "p50(ms)", "p95(ms)", "p99(ms)", "上游请求数", "失败"], rows)
+
+    # 上游完全不可用：连续失败5次后熔断，之后的请求不再发出
+    with MockLLMServer(latency=args.latency, error_rate=1.0) as server:
+        client = ResilientLLMClient(
+            base_url=server.url, circuit_failures=5, circuit_reset=60.0, **common, max_retries=1
+        )
+        result = asyncio.run(run_load(client, args.requests, 1))
+        print(f"\n上游不可用: 请求数 {args.requests}, 上游请求数 {server.requests}, "
+              f"熔断拒绝 {result['errors'].get(CircuitOpenError.__name__, 0)} 次")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+日志开销基准：每个请求在请求线程中花在日志上的时间
+
+模拟 --requests 个请求，每个请求带独立的请求ID，记录 --logs 条带 extra 字段的INFO日志（与请求中间件、查询各阶段的日志相当），
+输出写到 os.devnull，对比：
+- 同步：StreamHandler + JSON格式化（原日志配置，格式化与写出都在请求线程中）
+- 队列：QueueHandler + 后台线程批量格式化写出（setup_logging 使用的管道）
+- 队列 + 采样：在队列管道上按请求采样（--sample-rate）
+
+统计请求线程中每个请求的日志耗时 mean/p50/p99（微秒），以及队列管道写完全部日志的总耗时与丢弃条数。
+
+用法:
+    python -m benchmarks.bench_logging [--requests 2000] [--logs 8] [--sample-rate 0.1]
+"""
+import argparse
+import logging
+import os
+import statistics
+import time
+from typing import List
+
+from benchmarks.common import percentile, print_table
+
+from app.logger.logging_config import build_pipeline, create_formatter
+from app.logger.request_context import RequestIdFilter, new_request_id, request_id_var
+
+
+def run_requests(logger: logging.Logger, requests: int, logs: int) -> List[float]:
+    """返回每个请求在请求线程中的日志耗时（微秒）"""
+    timings = []
+    for _ in range(requests):
+        token = request_id_var.set(new_request_id())
+        started = time.perf_counter()
+        for i in range(logs):
+            logger.info(
+                "查询阶段完成",
+                extra={"stage": i, "top_k": 5, "embed_ms": 12.3, "search_ms": 4.5, "url": "/api/query/"},
+            )
+        timings.append((time.perf_counter() - started) * 1e6)
+        request_id_var.reset(token)
+    return timings
+
+
+def make_logger(name: str, handler: logging.Handler) -> logging.Logger:
+    logger = logging.getLogger(f"bench.logging.{name}")
+    logger.handlers = [handler]
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    return logger
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000, help="请求数")
+    parser.add_argument("--logs", type=int, default=8, help="每个请求的日志条数")
+    parser.add_argument("--sample-rate", type=float, default=0.1, help="采样比例")
+    parser.add_argument("--queue-size", type=int, default=100000, help="日志队列容量")
+    parser.add_argument("--batch-size", type=int, default=64, help="单次写入合并的最大日志条数")
+    args = parser.parse_args()
+
+    rows = []
+    with open(os.devnull, "w", encoding="utf-8") as devnull:
+        handler = logging.StreamHandler(devnull)
+        handler.setFormatter(create_formatter())
+        handler.addFilter(RequestIdFilter())
+        timings = run_requests(make_logger("sync", handler), args.requests, args.logs)
+        rows.append(["同步", statistics.mean(timings), percentile(timings, 50), percentile(timings, 99), "-", 0])
+
+        for name, rate in (("队列", 1.0), (f"队列 + 采样 {args.sample_rate:g}", args.sample_rate)):
+            queue_handler, listener = build_pipeline(devnull, rate, args.queue_size, args.batch_size)
+            listener.start()
+            started = time.perf_counter()
+            timings = run_requests(make_logger(f"queue{rate}", queue_handler), args.requests, args.logs)
+            listener.stop()  # 等待后台线程写完队列中的全部日志
+            drain_ms = (time.perf_counter() - started) * 1000
+            rows.append([
+                name, statistics.mean(timings), percentile(timings, 50), percentile(timings, 99),
+                drain_ms, queue_handler.dropped,
+            ])
+
+    print(f"请求数: {args.requests}, 每个请求日志条数: {args.logs}")
+    print_table(["管道", "mean(µs/请求)", "p50(µs/请求)", "p99(µs/请求)", "全部写完(ms)", "丢弃条数"], rows)
+
+
+if __name__ == "__main__":
+    main()
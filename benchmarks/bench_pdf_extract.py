@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+PDF文本提取基准：提取后端与并行度的 pages/sec 对比，以及分块阶段的峰值内存
+
+- 每个已安装的后端（pypdf2 / pypdfium2 / pdfminer）分别测量串行与进程池并行的提取速度
+- before: 旧实现，逐页 text += 拼接整本书后一次性切分
+- after:  iter_text_chunks 按页窗口增量切分
+  两者的峰值内存使用 tracemalloc 统计（只统计主进程，提取统一使用串行模式）
+
+用法:
+    python -m benchmarks.bench_pdf_extract [--pdf path/to.pdf] [--workers 4] [--repeat 1]
+"""
+import argparse
+import os
+import tracemalloc
+
+from benchmarks.common import BUNDLED_PDF, print_table, timer
+
+from app.config import config
+from app.services.pdf_extract import BACKENDS, iter_pdf_pages, open_pdf
+from app.services.pdf_service import iter_text_chunks, split_text_to_chunks
+
+
+def extract_all(pdf_path: str, backend: str, workers: int) -> int:
+    pages = 0
+    for _ in iter_pdf_pages(pdf_path, backend=backend, workers=workers, parallel_min_pages=1):
+        pages += 1
+    return pages
+
+
+def chunk_before(pdf_path: str) -> int:
+    """旧实现：拼接整本书的文本后一次性切分"""
+    text = ""
+    for _, page_text in iter_pdf_pages(pdf_path, backend="pypdf2"):
+        text += page_text
+    return len(split_text_to_chunks(text))
+
+
+def chunk_after(pdf_path: str) -> int:
+    """新实现：按页窗口增量切分"""
+    return sum(1 for _ in iter_text_chunks(iter_pdf_pages(pdf_path, backend="pypdf2")))
+
+
+def peak_memory(func, *args):
+    tracemalloc.start()
+    try:
+        result = func(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, peak / (1024 * 1024)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf", default=BUNDLED_PDF, help="用于测试的PDF文件")
+    parser.add_argument("--workers", type=int, default=config.PDF_WORKERS, help="并行提取的进程数")
+    parser.add_argument("--repeat", type=int, default=1, help="每种配置重复次数，取最快的一次")
+    args = parser.parse_args()
+
+    rows = []
+    for backend in BACKENDS:
+        try:
+            open_pdf(args.pdf, backend)
+        except ImportError as e:
+            print(f"跳过 {backend}: {e}")
+            continue
+        for workers in (1, args.workers):
+            results = {}
+            for i in range(args.repeat):
+                with timer(results, i):
+                    pages = extract_all(args.pdf, backend, workers)
+            seconds = min(results.values())
+            rows.append([backend, workers, pages, seconds, pages / seconds])
+
+    print(f"PDF: {os.path.basename(args.pdf)}")
+    print_table(["后端", "进程数", "页数", "耗时(s)", "pages/sec"], rows)
+
+    memory_rows = []
+    for name, func in [("before", chunk_before), ("after", chunk_after)]:
+        chunks, peak_mb = peak_memory(func, args.pdf)
+        memory_rows.append([name, chunks, peak_mb])
+    print()
+    print_table(["分块路径", "分块数", "峰值内存(MB)"], memory_rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+请求合并基准：热门问题的并发突发下，关闭 / 开启 QUERY_COALESCING 的LLM调用次数与延迟
+
+--requests 个请求同时到达，问题从 --distinct 个热门问题中轮流选取（带不同的空白与末尾标点，归一化后相同），
+分别测量非流式 answer_question 与流式 stream_answer（读完整个事件流）：
+- LLM调用次数（桩LLM计数，不访问DeepSeek API）
+- 请求延迟 p50/p95/p99
+
+问答缓存关闭，测量的是并发突发本身的合并效果。
+
+用法:
+    python -m benchmarks.bench_query_coalescing [--requests 64] [--distinct 4] [--llm-delay 0.5]
+"""
+import argparse
+import asyncio
+import tempfile
+import time
+from typing import List
+
+from benchmarks.common import BUNDLED_PDF, percentile, print_table
+from benchmarks.fixtures import DelayLLM, build_bench_index
+
+from llama_index.core import Settings
+
+from app.config import config
+from app.services import rag_service, vector_service
+
+QUESTIONS = ["荔枝是怎么运到长安的？", "李善德是谁？", "荔枝使的任务是什么？", "岭南到长安有多远？"]
+# 归一化后相同的写法
+VARIANTS = ["{}", " {} ", "{}?", "{}  "]
+
+
+async def burst(n_requests: int, distinct: int, stream: bool) -> List[float]:
+    async def one(i: int) -> float:
+        question = VARIANTS[i % len(VARIANTS)].format(QUESTIONS[i % distinct])
+        started = time.perf_counter()
+        if stream:
+            async for _ in rag_service.stream_answer(question):
+                pass
+        else:
+            await rag_service.answer_question(question)
+        return (time.perf_counter() - started) * 1000
+
+    return await asyncio.gather(*(one(i) for i in range(n_requests)))
+
+
+async def run(args, llm: DelayLLM) -> list:
+    rows = []
+    for stream in (False, True):
+        for coalescing in (False, True):
+            config.QUERY_COALESCING = coalescing
+            llm.calls = 0
+            latencies = await burst(args.requests, args.distinct, stream)
+            rows.append([
+                "流式" if stream else "非流式", "开启" if coalescing else "关闭", llm.calls,
+                percentile(latencies, 50), percentile(latencies, 95), percentile(latencies, 99),
+            ])
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf", default=BUNDLED_PDF, help="用于建立测试索引的PDF文件")
+    parser.add_argument("--chunks", type=int, default=200, help="写入测试索引的分块数量")
+    parser.add_argument("--requests", type=int, default=64, help="同时到达的请求数")
+    parser.add_argument("--distinct", type=int, default=4, help="不同问题的数量（不超过4）")
+    parser.add_argument("--llm-delay", type=float, default=0.5, help="桩LLM的首字延迟（秒）")
+    parser.add_argument("--token-delay", type=float, default=0.01, help="桩LLM逐字生成的间隔（秒）")
+    args = parser.parse_args()
+    args.distinct = max(1, min(args.distinct, len(QUESTIONS)))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        build_bench_index(tmp_dir, args.pdf, args.chunks)
+        llm = DelayLLM(delay=args.llm_delay, token_delay=args.token_delay)
+        Settings.llm = llm
+        rag_service.answer_cache = None
+        # 查询信号量绑定到首次使用的事件循环，全部场景在同一个事件循环中运行
+        rows = asyncio.run(run(args, llm))
+        vector_service.close_index()
+
+    print(f"请求数: {args.requests}, 不同问题: {args.distinct}, LLM首字延迟: {args.llm_delay}s, "
+          f"并发上限 MAX_CONCURRENT_QUERIES: {config.MAX_CONCURRENT_QUERIES}")
+    print_table(["模式", "请求合并", "LLM调用次数", "p50(ms)", "p95(ms)", "p99(ms)"], rows)
+
+
+if __name__ == "__main__":
+    main()
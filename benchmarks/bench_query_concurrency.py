@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+查询并发负载测试：阻塞式查询 与 异步查询路径 的延迟分布对比
+
+在进程内通过 httpx.ASGITransport 直接驱动 FastAPI 应用，并发发送 /api/query/ 请求，
+同时持续探测 /api/health，统计 p50/p95/p99：
+- before: 旧实现，在事件循环线程内同步执行检索与LLM调用
+- after:  answer_question 的异步路径（线程池检索 + AsyncOpenAI 风格的 acomplete）
+
+LLM由固定延迟的桩实现替代（不访问DeepSeek API），模拟上游响应耗时。
+
+用法:
+    python -m benchmarks.bench_query_concurrency [--requests 64] [--concurrency 16] [--llm-delay 0.5]
+"""
+import argparse
+import asyncio
+import tempfile
+import time
+from typing import List
+
+from benchmarks.common import BUNDLED_PDF, percentile, print_table
+from benchmarks.fixtures import DelayLLM, build_bench_index
+
+import httpx
+from llama_index.core import Settings
+
+from app.routes import query as query_route
+from app.services import rag_service, vector_service
+
+QUESTIONS = ["荔枝是怎么运到长安的？", "李善德是谁？", "荔枝使的任务是什么？", "岭南到长安有多远？"]
+
+
+async def blocking_answer_question(query: str) -> dict:
+    """旧实现：async 路由内直接调用同步查询"""
+    return {"answer": vector_service.query_vector_store(query), "citations": []}
+
+
+async def run_load(n_requests: int, concurrency: int) -> dict:
+    from app.main import app
+
+    query_latencies: List[float] = []
+    probe_latencies: List[float] = []
+    done = asyncio.Event()
+    limiter = asyncio.Semaphore(concurrency)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+
+        async def one_query(i: int) -> None:
+            async with limiter:
+                started = time.perf_counter()
+                resp = await client.post("/api/query/", json={"text": QUESTIONS[i % len(QUESTIONS)]})
+                resp.raise_for_status()
+                query_latencies.append(time.perf_counter() - started)
+
+        async def probe() -> None:
+            # 与查询并发的轻量请求，反映事件循环是否被阻塞
+            while not done.is_set():
+                started = time.perf_counter()
+                await client.get("/api/health")
+                probe_latencies.append(time.perf_counter() - started)
+                await asyncio.sleep(0.02)
+
+        prober = asyncio.create_task(probe())
+        started = time.perf_counter()
+        await asyncio.gather(*(one_query(i) for i in range(n_requests)))
+        wall = time.perf_counter() - started
+        done.set()
+        await prober
+
+    return {"query": query_latencies, "probe": probe_latencies, "wall": wall}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf", default=BUNDLED_PDF, help="用于建立测试索引的PDF文件")
+    parser.add_argument("--chunks", type=int, default=200, help="写入测试索引的分块数量")
+    parser.add_argument("--requests", type=int, default=64, help="每轮查询请求总数")
+    parser.add_argument("--concurrency", type=int, default=16, help="并发请求数")
+    parser.add_argument("--llm-delay", type=float, default=0.5, help="桩LLM的响应延迟（秒）")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        build_bench_index(tmp_dir, args.pdf, args.chunks)
+        Settings.llm = DelayLLM(delay=args.llm_delay)
+        # 问题集很小，关闭问答缓存，测量的是完整的检索 + LLM路径
+        rag_service.answer_cache = None
+
+        rows = []
+        original = query_route.answer_question
+        for name, handler in [("before", blocking_answer_question), ("after", original)]:
+            query_route.answer_question = handler
+            result = asyncio.run(run_load(args.requests, args.concurrency))
+            for kind in ("query", "probe"):
+                values = [v * 1000 for v in result[kind]]
+                rows.append([
+                    name, kind, len(values),
+                    percentile(values, 50), percentile(values, 95), percentile(values, 99),
+                ])
+            rows.append([name, "req/s", args.requests, args.requests / result["wall"], "", ""])
+        query_route.answer_question = original
+        vector_service.close_index()
+
+    print(f"请求数: {args.requests}, 并发: {args.concurrency}, LLM延迟: {args.llm_delay}s")
+    print_table(["路径", "指标", "样本数", "p50(ms)", "p95(ms)", "p99(ms)"], rows)
+
+
+if __name__ == "__main__":
+    main()
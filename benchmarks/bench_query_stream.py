@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+首字延迟基准：非流式 /api/query/ 与 SSE /api/query/stream 的对比
+
+用户感知的延迟是看到第一个字的时间：
+- before: /api/query/ 需要等待整个回答生成完毕，首字延迟 = 总耗时
+- after:  /api/query/stream 先返回 sources 事件，LLM产出第一个增量后立即返回 token 事件
+
+LLM由桩实现替代（不访问DeepSeek API）：--llm-delay 模拟首字延迟，--token-delay 模拟逐字生成速度。
+
+用法:
+    python -m benchmarks.bench_query_stream [--requests 20] [--llm-delay 0.5] [--token-delay 0.02]
+"""
+import argparse
+import asyncio
+import tempfile
+import time
+from typing import Dict, List
+
+from benchmarks.common import BUNDLED_PDF, percentile, print_table
+from benchmarks.fixtures import DelayLLM, build_bench_index
+
+import httpx
+from llama_index.core import Settings
+
+from app.services import vector_service
+
+QUESTION = "荔枝是怎么运到长安的？"
+
+
+async def run(n_requests: int) -> Dict[str, List[float]]:
+    from app.main import app
+
+    results: Dict[str, List[float]] = {"before_ttft": [], "after_sources": [], "after_ttft": [], "after_total": []}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for _ in range(n_requests):
+            started = time.perf_counter()
+            resp = await client.post("/api/query/", json={"text": QUESTION})
+            resp.raise_for_status()
+            results["before_ttft"].append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            first_token = None
+            async with client.stream("POST", "/api/query/stream", json={"text": QUESTION}) as resp:
+                async for line in resp.aiter_lines():
+                    if line == "event: sources":
+                        results["after_sources"].append(time.perf_counter() - started)
+                    elif line == "event: token" and first_token is None:
+                        first_token = time.perf_counter() - started
+            results["after_ttft"].append(first_token)
+            results["after_total"].append(time.perf_counter() - started)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf", default=BUNDLED_PDF, help="用于建立测试索引的PDF文件")
+    parser.add_argument("--chunks", type=int, default=200, help="写入测试索引的分块数量")
+    parser.add_argument("--requests", type=int, default=20, help="每条路径的请求次数")
+    parser.add_argument("--llm-delay", type=float, default=0.5, help="桩LLM的首字延迟（秒）")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="桩LLM的逐字间隔（秒）")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        build_bench_index(tmp_dir, args.pdf, args.chunks)
+        Settings.llm = DelayLLM(delay=args.llm_delay, token_delay=args.token_delay)
+        results = asyncio.run(run(args.requests))
+        vector_service.close_index()
+
+    rows = []
+    for name, values in results.items():
+        values = [v * 1000 for v in values if v is not None]
+        rows.append([name, len(values), percentile(values, 50), percentile(values, 95), percentile(values, 99)])
+    print(f"请求数: {args.requests}, LLM首字延迟: {args.llm_delay}s, 逐字间隔: {args.token_delay}s")
+    print_table(["指标", "样本数", "p50(ms)", "p95(ms)", "p99(ms)"], rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+重排序基准：交叉编码器带来的额外延迟 与 召回提升
+
+在固定问题集上比较：
+- baseline: 混合检索直接取 top_k
+- 各重排序配置: 先取 --candidates 个候选，交叉编码器打分后取 top_k
+  （torch fp32 / torch int8 / onnx int8，onnx 需安装 optimum[onnxruntime]，未安装时跳过）
+
+问题集默认从测试索引的分块按随机种子生成（见 fixtures.make_questions），
+也可以用 --questions 指定 JSONL 文件（每行 {"question": ..., "answer": ...}）。
+相邻分块扩展在测试中关闭，按节点ID统计 recall@k 与 MRR；额外延迟为 rerank_ms 的分位数。
+
+用法:
+    python -m benchmarks.bench_rerank [--chunks 400] [--questions 50] [--top-k 5] [--candidates 50]
+"""
+import argparse
+import tempfile
+
+from benchmarks.common import BUNDLED_PDF, percentile, print_table, recall_at_k, reciprocal_rank
+from benchmarks.fixtures import build_bench_index, load_questions, make_questions
+
+from app.config import config
+from app.services import vector_service
+
+VARIANTS = [
+    ("baseline", None, False),
+    ("torch fp32", "torch", False),
+    ("torch int8", "torch", True),
+    ("onnx int8", "onnx", True),
+]
+
+
+def evaluate(questions, top_k: int, rerank: bool):
+    recalls, ranks, latencies = [], [], []
+    for item in questions:
+        timings = {}
+        nodes = vector_service.retrieve_nodes(item["question"], top_k, timings=timings, rerank=rerank)
+        ranked = [hit.node.node_id for hit in nodes]
+        recalls.append(recall_at_k(ranked, item["relevant"], top_k))
+        ranks.append(reciprocal_rank(ranked, item["relevant"]))
+        latencies.append(timings.get("rerank_ms", 0.0))
+    n = len(questions)
+    return sum(recalls) / n, sum(ranks) / n, latencies
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf", default=BUNDLED_PDF, help="用于建立测试索引的PDF文件")
+    parser.add_argument("--chunks", type=int, default=400, help="写入测试索引的分块数量")
+    parser.add_argument("--questions", type=int, default=50, help="生成的问题数量")
+    parser.add_argument("--questions-file", default=None, help="JSONL问题集，指定后不再生成问题")
+    parser.add_argument("--seed", type=int, default=42, help="生成问题集的随机种子")
+    parser.add_argument("--top-k", type=int, default=5, help="最终保留的结果数")
+    parser.add_argument("--candidates", type=int, default=config.RERANK_CANDIDATES, help="重排序的候选数")
+    args = parser.parse_args()
+
+    config.QUERY_NEIGHBOR_WINDOW = 0
+    config.CONTEXT_TOKEN_BUDGET = 10 ** 6
+    config.CONTEXT_DEDUP_DISTANCE = -1
+    config.RERANK_CANDIDATES = args.candidates
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        build_bench_index(tmp_dir, args.pdf, args.chunks)
+        if args.questions_file:
+            questions = load_questions(args.questions_file)
+        else:
+            questions = make_questions(args.questions, seed=args.seed)
+        questions = [q for q in questions if q["relevant"]]
+
+        base_recall = None
+        for name, backend, quantize in VARIANTS:
+            if backend is not None:
+                config.RERANK_BACKEND = backend
+                config.RERANK_QUANTIZE = quantize
+                vector_service.reranker = None
+                try:
+                    vector_service.get_reranker()
+                except ImportError as e:
+                    print(f"跳过 {name}: {e}")
+                    continue
+                # 预热：首次前向包含内存分配与图优化
+                vector_service.retrieve_nodes(questions[0]["question"], args.top_k, rerank=True)
+
+            recall, mrr, latencies = evaluate(questions, args.top_k, rerank=backend is not None)
+            if base_recall is None:
+                base_recall = recall
+            rows.append([
+                name, recall, recall - base_recall, mrr,
+                percentile(latencies, 50), percentile(latencies, 95),
+            ])
+        vector_service.close_index()
+
+    print(f"问题数: {len(questions)}, top_k: {args.top_k}, 候选数: {args.candidates}, 模型: {config.RERANK_MODEL}")
+    print_table(["配置", f"recall@{args.top_k}", "召回提升", "MRR", "重排序p50(ms)", "重排序p95(ms)"], rows)
+
+
+if __name__ == "__main__":
+    main()
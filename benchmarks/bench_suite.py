@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+检索与RAG基准套件：在固定语料上测量导入、查询延迟与检索质量
+
+语料为内置PDF加上按随机种子生成的合成文本（见 fixtures.make_synthetic_corpus），
+LLM由固定延迟的桩实现替代（不访问DeepSeek API），结果可以跨提交比较：
+- 导入：PDF提取 pages/sec、分块 MB/s、嵌入 chunks/sec（不使用嵌入缓存）
+- 建索引：写入耗时、常驻内存增量（ru_maxrss）与索引目录大小
+- 查询：检索（嵌入 + 检索 + 打包）与端到端问答（含桩LLM延迟，不使用问答缓存）的 p50/p95/p99
+- 质量：PDF问题集（fixtures.make_questions）与合成事实问题集上的 recall@k 与 MRR
+
+--output 将结果与当前提交、关键配置写入JSON；--compare 与之前保存的结果逐项对比。
+
+用法:
+    python -m benchmarks.bench_suite [--synthetic-docs 4] [--questions 50] [--top-k 5] [--llm-delay 0.2]
+    python -m benchmarks.bench_suite --output base.json
+    python -m benchmarks.bench_suite --compare base.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import tempfile
+import time
+from typing import Any, Dict, List, Tuple
+
+from benchmarks.common import BUNDLED_PDF, ROOT_DIR, percentile, print_table, recall_at_k, reciprocal_rank
+from benchmarks.fixtures import DelayLLM, label_questions, make_questions, make_synthetic_corpus
+
+from llama_index.core import Settings
+
+from app.config import config
+from app.services import rag_service, vector_service
+from app.services.pdf_service import chunks_to_documents, iter_pages, iter_text_chunks
+
+# 写入结果文件的配置项：这些配置变化时结果不可直接比较
+CONFIG_KEYS = (
+    "CHUNKER", "CHUNK_MAX_TOKENS", "CHUNK_OVERLAP_TOKENS", "CHUNK_SIZE", "CHUNK_OVERLAP",
+    "EMBED_MODEL_NAME", "EMBED_BACKEND", "EMBED_QUANTIZE", "EMBED_BATCH_SIZE",
+    "HYBRID_SEARCH", "QUERY_NEIGHBOR_WINDOW", "CONTEXT_TOKEN_BUDGET", "RERANK_ENABLED",
+)
+# 数值越小越好的指标，对比时用于标注变化方向
+LOWER_IS_BETTER = ("_ms", "_s", "_mb")
+
+
+def _rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _dir_size_mb(path: str) -> float:
+    return sum(
+        os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(path) for name in files
+    ) / 1024 / 1024
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def build_corpus(args, metrics: Dict[str, float]) -> Tuple[List, List[Dict[str, str]]]:
+    """提取与分块：返回全部Document（PDF + 合成语料）与合成事实，记录提取与分块速率"""
+    started = time.perf_counter()
+    pages = list(iter_pages(args.pdf))
+    seconds = time.perf_counter() - started
+    metrics["extract_pages_per_sec"] = len(pages) / seconds
+
+    sources = [("bench.pdf", pages)]
+    synthetic = make_synthetic_corpus(n_docs=args.synthetic_docs, seed=args.seed)
+    sources += [(doc["filename"], doc["pages"]) for doc in synthetic]
+
+    docs, total_bytes = [], 0
+    started = time.perf_counter()
+    for filename, doc_pages in sources:
+        total_bytes += sum(len(text.encode("utf-8")) for _, text in doc_pages)
+        docs.extend(chunks_to_documents(iter_text_chunks(doc_pages), filename, doc_id=filename))
+    seconds = time.perf_counter() - started
+    metrics["chunk_mb_per_sec"] = total_bytes / 1024 / 1024 / seconds
+    metrics["chunks"] = len(docs)
+    return docs, [fact for doc in synthetic for fact in doc["facts"]]
+
+
+def build_index(docs: List, persist_dir: str, metrics: Dict[str, float]) -> None:
+    """嵌入并写入索引，分别记录嵌入速率与写入耗时"""
+    rss_before = _rss_mb()
+    nodes = vector_service.prepare_nodes(docs)
+
+    started = time.perf_counter()
+    vector_service.embed_nodes_sorted(nodes)
+    seconds = time.perf_counter() - started
+    metrics["embed_chunks_per_sec"] = len(nodes) / seconds
+
+    started = time.perf_counter()
+    vector_service.insert_nodes(nodes)
+    metrics["index_write_ms"] = (time.perf_counter() - started) * 1000
+    metrics["index_build_s"] = seconds + metrics["index_write_ms"] / 1000
+    metrics["index_rss_delta_mb"] = _rss_mb() - rss_before
+    metrics["index_disk_mb"] = _dir_size_mb(persist_dir)
+
+
+def evaluate(name: str, questions: List[Dict[str, Any]], top_k: int, metrics: Dict[str, float]) -> None:
+    """检索质量与检索延迟"""
+    recalls, ranks, latencies = [], [], []
+    for item in questions:
+        started = time.perf_counter()
+        nodes = vector_service.retrieve_nodes(item["question"], top_k)
+        latencies.append((time.perf_counter() - started) * 1000)
+        ranked = [hit.node.node_id for hit in nodes]
+        recalls.append(recall_at_k(ranked, item["relevant"], top_k))
+        ranks.append(reciprocal_rank(ranked, item["relevant"]))
+    metrics[f"{name}_recall@{top_k}"] = sum(recalls) / len(questions)
+    metrics[f"{name}_mrr"] = sum(ranks) / len(questions)
+    for q in (50, 95, 99):
+        metrics[f"{name}_retrieve_p{q}_ms"] = percentile(latencies, q)
+
+
+def measure_answers(questions: List[Dict[str, Any]], top_k: int, metrics: Dict[str, float]) -> None:
+    """端到端问答延迟（逐个请求，含桩LLM延迟）"""
+
+    async def run() -> List[float]:
+        latencies = []
+        for item in questions:
+            started = time.perf_counter()
+            await rag_service.answer_question(item["question"], top_k)
+            latencies.append((time.perf_counter() - started) * 1000)
+        return latencies
+
+    latencies = asyncio.run(run())
+    for q in (50, 95, 99):
+        metrics[f"answer_p{q}_ms"] = percentile(latencies, q)
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any]) -> None:
+    rows = []
+    for key, value in current["metrics"].items():
+        base = baseline["metrics"].get(key)
+        if base is None:
+            continue
+        change = (value - base) / base * 100 if base else float("nan")
+        better = (change < 0) if key.endswith(LOWER_IS_BETTER) else (change > 0)
+        rows.append([key, base, value, f"{change:+.1f}%", "" if abs(change) < 1 else ("↑" if better else "↓")])
+    print(f"对比: {baseline['commit']} -> {current['commit']}")
+    changed = [k for k in CONFIG_KEYS if baseline["config"].get(k) != current["config"].get(k)]
+    if changed:
+        print(f"注意: 配置不同: {', '.join(changed)}")
+    print_table(["指标", "基线", "当前", "变化", "优劣"], rows)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf", default=BUNDLED_PDF, help="语料中的PDF文件")
+    parser.add_argument("--synthetic-docs", type=int, default=4, help="合成文档数量（每个20页）")
+    parser.add_argument("--questions", type=int, default=50, help="PDF问题集的问题数量")
+    parser.add_argument("--seed", type=int, default=42, help="合成语料与问题集的随机种子")
+    parser.add_argument("--top-k", type=int, default=5, help="检索结果数")
+    parser.add_argument("--llm-delay", type=float, default=0.2, help="桩LLM的响应延迟（秒）")
+    parser.add_argument("--output", default=None, help="将结果写入JSON文件")
+    parser.add_argument("--compare", default=None, help="与之前保存的JSON结果对比")
+    args = parser.parse_args()
+
+    # 每次都完整嵌入与检索：不使用嵌入缓存与问答缓存
+    config.EMBED_CACHE_ENABLED = False
+    rag_service.answer_cache = None
+    Settings.llm = DelayLLM(delay=args.llm_delay)
+
+    metrics: Dict[str, float] = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        vector_service.VECTOR_STORE_PATH = tmp_dir
+        started = time.perf_counter()
+        vector_service.warmup()
+        metrics["model_load_s"] = time.perf_counter() - started
+
+        docs, facts = build_corpus(args, metrics)
+        build_index(docs, tmp_dir, metrics)
+
+        pdf_questions = make_questions(args.questions, seed=args.seed, source="bench.pdf")
+        pdf_questions = [q for q in pdf_questions if q["relevant"]]
+        fact_questions = [q for q in label_questions(facts) if q["relevant"]]
+        evaluate("pdf", pdf_questions, args.top_k, metrics)
+        evaluate("synthetic", fact_questions, args.top_k, metrics)
+        measure_answers(pdf_questions, args.top_k, metrics)
+        vector_service.close_index()
+
+    result = {
+        "commit": _git_commit(),
+        "config": {key: getattr(config, key) for key in CONFIG_KEYS},
+        "params": vars(args),
+        "metrics": metrics,
+    }
+    print(f"提交: {result['commit']}, 分块数: {metrics['chunks']}, "
+          f"问题数: PDF {len(pdf_questions)} / 合成 {len(fact_questions)}, top_k: {args.top_k}")
+    print_table(["指标", "数值"], list(metrics.items()))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(json.load(f), result)
+
+
+if __name__ == "__main__":
+    main()
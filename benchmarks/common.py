@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+基准测试公共工具
+
+- 在导入 app 之前补齐运行所需的环境变量（基准测试不访问DeepSeek API）
+- 计时、分位数统计与结果表格输出
+- 检索质量指标：recall@k、MRR
+"""
+import os
+import sys
+import time
+from contextlib import contextmanager
+from typing import Collection, Dict, Iterable, List, Sequence
+
+# 基准测试从仓库根目录或 benchmarks 目录运行都可以导入 app
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+# app.config 在导入时校验API密钥，基准测试使用占位密钥
+os.environ.setdefault("DEEPSEEK_API_KEY", "benchmark-placeholder-key")
+
+BUNDLED_PDF = os.path.join(ROOT_DIR, "data", "pdfs", "马伯庸《长安的荔枝》精校全本.pdf")
+
+
+@contextmanager
+def timer(results: Dict[str, float], name: str):
+    """记录代码块耗时（秒）到 results[name]"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        results[name] = time.perf_counter() - started
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    """线性插值分位数，q取值 0~100"""
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    pos = (len(ordered) - 1) * q / 100
+    lower = int(pos)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (pos - lower)
+
+
+def recall_at_k(ranked: Sequence[str], relevant: Collection[str], k: int) -> float:
+    """前k个结果中是否包含相关结果（命中为1.0）"""
+    return 1.0 if any(item in relevant for item in ranked[:k]) else 0.0
+
+
+def reciprocal_rank(ranked: Sequence[str], relevant: Collection[str]) -> float:
+    """第一个相关结果排名的倒数，未命中为0（对问题集取平均即MRR）"""
+    for rank, item in enumerate(ranked, 1):
+        if item in relevant:
+            return 1.0 / rank
+    return 0.0
+
+
+def print_table(headers: List[str], rows: Iterable[Sequence]) -> None:
+    """以对齐的纯文本表格输出结果"""
+    rows = [[_fmt(cell) for cell in row] for row in rows]
+    widths = [max(len(str(h)), *(len(row[i]) for row in rows)) if rows else len(str(h)) for i, h in enumerate(headers)]
+    print("  ".join(str(h).ljust(w) for h, w in zip(headers, widths)))
+    print("  ".join("-" * w for w in widths))
+    for row in rows:
+        print("  ".join(cell.ljust(w) for cell, w in zip(row, widths)))
+
+
+def _fmt(value) -> str:
+    if isinstance(value, float):
+        return f"{value:,.2f}"
+    return str(value)
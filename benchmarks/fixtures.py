@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+基准测试夹具
+
+- DelayLLM: 固定延迟的桩LLM（不访问DeepSeek API），可模拟首字延迟与逐字生成
+- build_bench_index: 在临时目录中用内置PDF建立测试索引
+- make_questions: 从索引中的分块生成固定（按随机种子）的带标注问题集
+- make_synthetic_corpus: 按随机种子生成的合成语料（按页文本）与其中事实的问题集
+"""
+import asyncio
+import json
+import random
+import time
+from typing import Any, Dict, List
+
+from benchmarks.common import BUNDLED_PDF
+
+from llama_index.core.base.llms.types import CompletionResponseAsyncGen, CompletionResponseGen
+from llama_index.core.llms import CompletionResponse, CustomLLM, LLMMetadata
+from llama_index.core.llms.callbacks import llm_completion_callback
+
+from app.models.document import PDFDocument
+from app.services import vector_service
+from app.services.chunker import split_sentences
+from app.services.pdf_service import read_pdf, split_text_to_chunks
+
+STUB_ANSWER = "根据文档内容，这是桩LLM生成的回答。" * 4
+
+
+class DelayLLM(CustomLLM):
+    """
+    桩LLM：等待 delay 秒后开始输出，之后每个字符间隔 token_delay 秒
+
+    同步方法阻塞线程，异步方法只让出事件循环，与真实客户端的行为一致；calls 记录调用次数
+    """
+
+    delay: float = 0.5
+    token_delay: float = 0.0
+    calls: int = 0
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(model_name="delay-stub")
+
+    @llm_completion_callback()
+    def complete(self, prompt: str, **kwargs: Any) -> CompletionResponse:
+        self.calls += 1
+        time.sleep(self.delay + self.token_delay * len(STUB_ANSWER))
+        return CompletionResponse(text=STUB_ANSWER)
+
+    @llm_completion_callback()
+    async def acomplete(self, prompt: str, **kwargs: Any) -> CompletionResponse:
+        self.calls += 1
+        await asyncio.sleep(self.delay + self.token_delay * len(STUB_ANSWER))
+        return CompletionResponse(text=STUB_ANSWER)
+
+    @llm_completion_callback()
+    def stream_complete(self, prompt: str, **kwargs: Any) -> CompletionResponseGen:
+        self.calls += 1
+
+        def gen() -> CompletionResponseGen:
+            time.sleep(self.delay)
+            for i, char in enumerate(STUB_ANSWER, 1):
+                time.sleep(self.token_delay)
+                yield CompletionResponse(text=STUB_ANSWER[:i], delta=char)
+
+        return gen()
+
+    @llm_completion_callback()
+    async def astream_complete(self, prompt: str, **kwargs: Any) -> CompletionResponseAsyncGen:
+        self.calls += 1
+
+        async def gen() -> CompletionResponseAsyncGen:
+            await asyncio.sleep(self.delay)
+            for i, char in enumerate(STUB_ANSWER, 1):
+                await asyncio.sleep(self.token_delay)
+                yield CompletionResponse(text=STUB_ANSWER[:i], delta=char)
+
+        return gen()
+
+
+def build_bench_index(persist_dir: str, pdf_path: str = BUNDLED_PDF, n_chunks: int = 200) -> int:
+    """在 persist_dir 中建立测试索引，返回写入的分块数量"""
+    vector_service.VECTOR_STORE_PATH = persist_dir
+    vector_service.load_index()
+    chunks = split_text_to_chunks(read_pdf(pdf_path))[:n_chunks]
+    return vector_service.add_documents_to_index(
+        [PDFDocument(text=chunk, metadata={"source": "bench.pdf"}).to_node() for chunk in chunks]
+    )
+
+
+# 合成语料的词表：填充句与事实句，事实句以唯一的驿站编号作为标注锚点
+_PLACES = ["岭南", "韶州", "洪州", "襄州", "商州", "蓝田", "江陵", "梧州", "桂州", "潭州", "虔州", "鄂州"]
+_SURNAMES = ["李", "王", "张", "杜", "韩", "郑", "赵", "林", "苏", "何", "阿", "冯"]
+_GIVEN = ["善德", "仲元", "十三", "小娘", "德全", "文昌", "明允", "子安", "景行", "怀远", "思齐", "元亨"]
+_GOODS = ["荔枝", "冰块", "竹筒", "盐", "蜡封", "驿马", "漆盒", "新茶"]
+_FILLER = [
+    "驿路沿着山谷蜿蜒向北，雨季时道路泥泞难行。",
+    "转运的文书需要层层用印，每一道关卡都要核对。",
+    "果子离枝之后，一日色变，二日香变，三日味变。",
+    "沿途的驿卒轮班值守，换马不换人，昼夜兼程。",
+    "账簿上记录着每一笔开支，从草料到灯油都不能遗漏。",
+    "商队在渡口等待官船，河面上的雾气久久不散。",
+    "差事的期限写在敕牒上，逾期者按律论处。",
+    "夜里的驿站灯火通明，传递的消息一站接着一站。",
+]
+
+
+def make_synthetic_corpus(
+    n_docs: int = 4, pages_per_doc: int = 20, facts_per_page: int = 2, seed: int = 42
+) -> List[Dict[str, Any]]:
+    """
+    生成可复现的合成语料：每页由填充句与事实句组成，每条事实有唯一的驿站编号
+
+    返回:
+        [{"filename": str, "pages": [(页码, 文本)], "facts": [{"question", "answer"}]}]，
+        answer 为事实句中唯一的锚点文本，包含它的分块即为相关分块（见 load_questions）
+    """
+    rng = random.Random(seed)
+    corpus = []
+    station = 0
+    for doc_index in range(n_docs):
+        pages, facts = [], []
+        for page_no in range(1, pages_per_doc + 1):
+            sentences = [rng.choice(_FILLER) for _ in range(rng.randint(12, 20))]
+            for _ in range(facts_per_page):
+                station += 1
+                place, name = rng.choice(_PLACES), rng.choice(_SURNAMES) + rng.choice(_GIVEN)
+                goods, amount = rng.choice(_GOODS), rng.randint(2, 99)
+                anchor = f"第{station}号驿站"
+                fact = f"{anchor}位于{place}境内，驿丞{name}每月向长安递送{amount}筐{goods}。"
+                sentences.insert(rng.randrange(len(sentences) + 1), fact)
+                facts.append({"question": f"{anchor}的驿丞是谁，每月递送什么？", "answer": anchor})
+            pages.append((page_no, "".join(sentences)))
+        corpus.append({"filename": f"synthetic-{doc_index:02d}.pdf", "pages": pages, "facts": facts})
+    return corpus
+
+
+def make_questions(n: int, seed: int = 42, min_chars: int = 16, source: str = None) -> List[Dict[str, Any]]:
+    """
+    从当前索引的分块生成带标注的问题集
+
+    每个问题取某个分块中的一句话的中间部分（去掉首尾各约1/5，避免与原句完全一致），
+    相关分块为包含该句完整原文的所有分块（分块之间有重叠时可能不止一个）。
+    source 不为None时只从该来源文件的分块中出题。
+
+    返回:
+        [{"question": str, "relevant": [节点ID, ...]}]
+    """
+    nodes = list(vector_service.vector_store.iter_nodes())
+    rng = random.Random(seed)
+    rng.shuffle(nodes)
+
+    questions = []
+    for node in nodes:
+        if source is not None and node.metadata.get("source") != source:
+            continue
+        sentences = [s.strip() for s in split_sentences(node.get_content()) if len(s.strip()) >= min_chars]
+        if not sentences:
+            continue
+        sentence = rng.choice(sentences)
+        cut = len(sentence) // 5
+        relevant = [other.node_id for other in nodes if sentence in other.get_content()]
+        questions.append({"question": sentence[cut:len(sentence) - cut], "relevant": relevant})
+        if len(questions) >= n:
+            break
+    return questions
+
+
+def load_questions(path: str) -> List[Dict[str, Any]]:
+    """
+    读取问题集（JSONL，每行 {"question": ..., "answer": ...}）
+
+    相关分块为文本中包含 answer 的所有分块
+    """
+    with open(path, encoding="utf-8") as f:
+        return label_questions([json.loads(line) for line in f if line.strip()])
+
+
+def label_questions(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """为 {"question", "answer"} 标注相关分块：当前索引中文本包含 answer 的所有分块"""
+    nodes = list(vector_service.vector_store.iter_nodes())
+    questions = []
+    for item in items:
+        relevant = [node.node_id for node in nodes if item["answer"] in node.get_content()]
+        questions.append({"question": item["question"], "relevant": relevant})
+    return questions
@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""
+本地 OpenAI 兼容的模拟LLM服务（POST /chat/completions 与 /v1/chat/completions）
+
+用于在不访问DeepSeek API的情况下测试 app/llm/resilient_client.py 与整个问答流程：
+- 延迟：每个请求基础延迟 --latency 秒，按 --slow-rate 的概率变为 --slow-latency 秒（长尾）
+- 错误：按 --error-rate 的概率返回500，按 --rate-limit-rate 的概率返回429（带 Retry-After）
+- 支持 stream=True（SSE，按 --token-interval 逐块返回）与 stream_options.include_usage
+- 响应内容固定，usage 按提示词长度估算；统计收到的请求数与各状态码次数
+
+独立运行后把 DEEPSEEK_API_BASE 指向它，即可离线启动应用：
+    python -m benchmarks.mock_llm_server --port 8900 --latency 0.2 --error-rate 0.05
+    DEEPSEEK_API_BASE=http://127.0.0.1:8900 python -m app.main
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional
+
+ANSWER = "根据文档内容，李善德奉命在五月之前把新鲜荔枝从岭南运到长安。"
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address) -> None:
+        # 客户端取消请求（如对冲请求中较慢的一个）时连接被关闭，不输出异常
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+
+class MockLLMServer:
+    """在后台线程中运行的模拟服务，可作为上下文管理器使用"""
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.05,
+        slow_rate: float = 0.0,
+        slow_latency: float = 2.0,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        retry_after: float = 0.1,
+        token_interval: float = 0.01,
+        seed: int = 42,
+    ):
+        self.latency = latency
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.token_interval = token_interval
+        self.requests = 0
+        self.statuses: Counter = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._httpd = _Server((host, port), self._handler_class())
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.requests = 0
+            self.statuses.clear()
+
+    def _draw(self):
+        """为一个请求抽取 (状态码, 延迟秒数)"""
+        with self._lock:
+            self.requests += 1
+            roll = self._random.random()
+            slow = self._random.random() < self.slow_rate
+        if roll < self.error_rate:
+            status = 500
+        elif roll < self.error_rate + self.rate_limit_rate:
+            status = 429
+        else:
+            status = 200
+        with self._lock:
+            self.statuses[status] += 1
+        return status, self.slow_latency if slow else self.latency
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # 支持长连接
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+            def _send_json(self, status: int, body: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> None:
+                data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self) -> None:
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self._send_json(404, {"error": {"message": "not found"}})
+                    return
+
+                status, delay = server._draw()
+                time.sleep(delay)
+                if status == 429:
+                    self._send_json(
+                        429, {"error": {"message": "rate limited", "type": "rate_limit"}},
+                        {"Retry-After": str(server.retry_after)},
+                    )
+                    return
+                if status == 500:
+                    self._send_json(500, {"error": {"message": "internal error", "type": "server_error"}})
+                    return
+
+                prompt_tokens = sum(len(m.get("content") or "") for m in payload.get("messages", [])) // 2 + 1
+                usage = {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": len(ANSWER),
+                    "total_tokens": prompt_tokens + len(ANSWER),
+                }
+                completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+                model = payload.get("model", "mock")
+                if payload.get("stream"):
+                    include_usage = (payload.get("stream_options") or {}).get("include_usage", False)
+                    self._stream(completion_id, model, usage if include_usage else None)
+                    return
+                self._send_json(200, {
+                    "id": completion_id,
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": ANSWER},
+                        "finish_reason": "stop",
+                    }],
+                    "usage": usage,
+                })
+
+            def _stream(self, completion_id: str, model: str, usage: Optional[Dict[str, int]]) -> None:
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+
+                def event(choices, usage_field=None) -> None:
+                    chunk = {
+                        "id": completion_id,
+                        "object": "chat.completion.chunk",
+                        "created": int(time.time()),
+                        "model": model,
+                        "choices": choices,
+                        "usage": usage_field,
+                    }
+                    self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+
+                event([{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}])
+                for i in range(0, len(ANSWER), 4):
+                    time.sleep(server.token_interval)
+                    event([{"index": 0, "delta": {"content": ANSWER[i:i + 4]}, "finish_reason": None}])
+                event([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+                if usage is not None:
+                    event([], usage)
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+                self.close_connection = True
+
+        return Handler
+
+    def start(self) -> "MockLLMServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="mock-llm", daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self) -> None:
+        """在当前线程中运行（独立运行时使用）"""
+        try:
+            self._httpd.serve_forever()
+        finally:
+            self._httpd.server_close()
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> "MockLLMServer":
+        return self.start()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=0.2, help="基础延迟（秒）")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="长尾请求的比例")
+    parser.add_argument("--slow-latency", type=float, default=2.0, help="长尾请求的延迟（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回500的比例")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="返回429的比例")
+    parser.add_argument("--token-interval", type=float, default=0.02, help="流式响应块之间的间隔（秒）")
+    args = parser.parse_args()
+
+    server = MockLLMServer(
+        host=args.host,
+        port=args.port,
+        latency=args.latency,
+        slow_rate=args.slow_rate,
+        slow_latency=args.slow_latency,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        token_interval=args.token_interval,
+    )
+    print(f"模拟LLM服务: {server.url}（Ctrl+C 退出）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""问答缓存：精确/语义命中、索引版本失效、TTL与LRU淘汰"""
+from app.services.answer_cache import AnswerCache, normalize_query
+
+SCOPE = (3, False)
+
+
+def _cache(**kwargs):
+    kwargs.setdefault("max_entries", 10)
+    kwargs.setdefault("ttl_seconds", 60)
+    kwargs.setdefault("similarity_threshold", 0.95)
+    return AnswerCache(**kwargs)
+
+
+def test_normalize_query():
+    assert normalize_query("  What is RAG？ ") == normalize_query("what is   rag")
+
+
+def test_exact_and_semantic_hits():
+    cache = _cache()
+    cache.put("荔枝是谁送的？", SCOPE, 1, {"answer": "a"}, embedding=[1.0, 0.0])
+    assert cache.get_exact("荔枝是谁送的", SCOPE, 1) == {"answer": "a"}
+    # 查询参数不同的条目不命中
+    assert cache.get_exact("荔枝是谁送的", (5, False), 1) is None
+    assert cache.get_semantic([0.99, 0.05], SCOPE, 1) == {"answer": "a"}
+    assert cache.get_semantic([0.0, 1.0], SCOPE, 1) is None
+    stats = cache.stats()
+    assert (stats["exact_hits"], stats["semantic_hits"], stats["misses"]) == (1, 1, 1)
+
+
+def test_index_version_change_invalidates():
+    cache = _cache()
+    cache.put("q1", SCOPE, 1, {"answer": "a"}, embedding=[1.0, 0.0])
+    cache.put("q2", SCOPE, 1, {"answer": "b"})
+    assert cache.get_exact("q1", SCOPE, 1) is not None
+
+    assert cache.get_exact("q1", SCOPE, 2) is None
+    assert cache.get_semantic([1.0, 0.0], SCOPE, 2) is None
+    stats = cache.stats()
+    assert stats["invalidations"] == 2
+    assert stats["size"] == 0
+    assert stats["index_version"] == 2
+
+
+def test_put_with_stale_version_is_dropped():
+    cache = _cache()
+    cache.get_exact("q", SCOPE, 2)
+    # 检索开始时读取的是旧版本，期间索引已更新
+    cache.put("q", SCOPE, 1, {"answer": "stale"})
+    assert cache.get_exact("q", SCOPE, 2) is None
+    assert cache.stats()["size"] == 0
+
+
+def test_ttl_and_lru_eviction(monkeypatch):
+    cache = _cache(max_entries=2, ttl_seconds=10, semantic=False)
+    now = [1000.0]
+    monkeypatch.setattr("app.services.answer_cache.time.time", lambda: now[0])
+    cache.put("a", SCOPE, 1, {"answer": "a"})
+    cache.put("b", SCOPE, 1, {"answer": "b"})
+    cache.get_exact("a", SCOPE, 1)
+    cache.put("c", SCOPE, 1, {"answer": "c"})
+    assert cache.get_exact("b", SCOPE, 1) is None
+    assert cache.stats()["evictions"] == 1
+
+    now[0] += 11
+    assert cache.get_exact("a", SCOPE, 1) is None
+    assert cache.stats()["expirations"] == 1
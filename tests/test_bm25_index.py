@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""BM25倒排索引：varint编码、写入/删除与倒排段合并"""
+import numpy as np
+
+from app.services.bm25_index import (
+    BM25Index,
+    decode_postings,
+    encode_postings,
+    varint_decode,
+    varint_encode,
+)
+
+
+def test_varint_round_trip():
+    values = [0, 1, 127, 128, 255, 300, 16383, 16384, 2**32 - 1, 2**32, 2**63 - 1]
+    data = varint_encode(values)
+    assert varint_decode(data).tolist() == values
+    # 小于128的值占一个字节
+    assert len(varint_encode([0, 5, 127])) == 3
+    assert varint_encode([]) == b""
+    assert varint_decode(b"").size == 0
+
+
+def test_postings_round_trip():
+    dids = [3, 4, 10, 1000, 70000]
+    tfs = [1, 2, 1, 5, 300]
+    got_dids, got_tfs = decode_postings(len(dids), encode_postings(dids, tfs))
+    assert got_dids.tolist() == dids
+    assert got_tfs.tolist() == tfs
+
+
+def _open(path, **kwargs):
+    # 同步合并，测试中合并结束后即可断言
+    kwargs.setdefault("background_compaction", False)
+    kwargs.setdefault("compact_segments", 1000)
+    kwargs.setdefault("compact_deleted_ratio", 1.0)
+    return BM25Index(path, **kwargs)
+
+
+def _ids(index, query):
+    return {node_id for node_id, _ in index.search(query, 1000)}
+
+
+def test_search_before_and_after_compact(tmp_path):
+    path = str(tmp_path / "bm25.sqlite3")
+    index = _open(path)
+    for i in range(20):
+        index.add([(f"n{i}", f"r{i}", f"荔枝 长安 文档{i}")])
+    index.add([("lychee", "r-en", "The Lychee Road to Chang'an")])
+    assert _ids(index, "荔枝") == {f"n{i}" for i in range(20)}
+    assert index.search("lychee", 1)[0][0] == "lychee"
+
+    index.delete_ref_docs([f"r{i}" for i in range(0, 20, 3)])
+    expected = {f"n{i}" for i in range(20) if i % 3}
+    before = index.search("长安 文档5", 5)
+    assert _ids(index, "荔枝") == expected
+
+    index.compact()
+    assert _ids(index, "荔枝") == expected
+    after = index.search("长安 文档5", 5)
+    assert [node_id for node_id, _ in after] == [node_id for node_id, _ in before]
+    np.testing.assert_allclose([s for _, s in after], [s for _, s in before], rtol=1e-5)
+    assert index.stats()["deleted"] == 0
+
+    # 合并后继续写入、替换与删除
+    index.add([("n1", "r1b", "荔枝 替换")], replace_ref_doc_ids=["r1"])
+    assert index.search("替换", 1)[0][0] == "n1"
+    assert index.count() == len(expected) + 1
+    index.close()
+
+    reopened = _open(path)
+    assert _ids(reopened, "荔枝") == expected
+    assert reopened.search("替换", 1)[0][0] == "n1"
+    reopened.close()
+
+
+def test_background_compaction(tmp_path):
+    index = BM25Index(str(tmp_path / "bm25.sqlite3"), compact_segments=3)
+    for i in range(10):
+        index.add([(f"n{i}", f"r{i}", f"荔枝 {i}")])
+    index.close()
+
+    reopened = _open(str(tmp_path / "bm25.sqlite3"))
+    assert _ids(reopened, "荔枝") == {f"n{i}" for i in range(10)}
+    reopened.close()
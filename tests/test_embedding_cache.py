@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""嵌入缓存：LRU淘汰与槽位复用"""
+import numpy as np
+
+from app.services.embedding_cache import EmbeddingCache
+
+DIM = 4
+
+
+def _vector(i):
+    return [float(i), 1.0, 0.0, -1.0]
+
+
+def _open(path, max_entries=3):
+    return EmbeddingCache(str(path), "test-model", DIM, max_entries, variant="onnx")
+
+
+def test_hit_miss_and_normalization(tmp_path):
+    cache = _open(tmp_path)
+    cache.put_many(["长安的荔枝"], [_vector(1)])
+    # NFKC 与空白归一化后命中
+    hit, miss = cache.get_many(["  长安的荔枝 ", "other"])
+    assert hit == _vector(1)
+    assert miss is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+    cache.close()
+
+
+def test_lru_eviction_reuses_slots(tmp_path):
+    cache = _open(tmp_path)
+    cache.put_many(["a", "b", "c"], [_vector(1), _vector(2), _vector(3)])
+    # 访问 a 之后 b 成为最久未使用的条目
+    cache.get_many(["a"])
+    cache.put_many(["d"], [_vector(4)])
+
+    a, b, c, d = cache.get_many(["a", "b", "c", "d"])
+    assert b is None
+    assert (a, c, d) == (_vector(1), _vector(3), _vector(4))
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["size"] == 3
+
+    # 被淘汰条目的槽位被复用，没有键指向同一个槽位
+    slots = [slot for (slot,) in cache._db.execute("SELECT slot FROM entries")]
+    assert sorted(slots) == [0, 1, 2]
+    cache.close()
+
+
+def test_reopen_keeps_entries_and_free_slots(tmp_path):
+    cache = _open(tmp_path)
+    cache.put_many(["a", "b"], [_vector(1), _vector(2)])
+    cache.close()
+
+    cache = _open(tmp_path)
+    assert cache.get_many(["a", "b"]) == [_vector(1), _vector(2)]
+    assert len(cache._free_slots) == 1
+    cache.put_many(["c", "d"], [_vector(3), _vector(4)])
+    assert cache.stats()["evictions"] == 1
+    vectors = cache.get_many(["c", "d"])
+    np.testing.assert_array_equal(vectors, [_vector(3), _vector(4)])
+    cache.close()
+
+
+def test_shrinking_capacity_drops_out_of_range_slots(tmp_path):
+    cache = _open(tmp_path, max_entries=3)
+    cache.put_many(["a", "b", "c"], [_vector(1), _vector(2), _vector(3)])
+    cache.close()
+
+    cache = _open(tmp_path, max_entries=2)
+    # 槽位按 0, 1, 2 分配，c 所在的槽位超出新容量
+    assert cache.get_many(["a", "b", "c"]) == [_vector(1), _vector(2), None]
+    assert cache.stats()["size"] == 2
+    cache.close()
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""FAISS向量存储：墓碑删除、段压缩与重新打开"""
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip("faiss")
+pytest.importorskip("llama_index.core")
+
+from llama_index.core.schema import NodeRelationship, RelatedNodeInfo, TextNode  # noqa: E402
+from llama_index.core.vector_stores.types import VectorStoreQuery  # noqa: E402
+
+from app.services.faiss_store import MmapFaissVectorStore  # noqa: E402
+
+DIM = 8
+
+
+def _node(i, ref_doc_id):
+    vector = np.zeros(DIM, dtype="float32")
+    vector[i % DIM] = 1.0
+    vector[(i + 1) % DIM] = 0.1 * (i // DIM + 1)
+    vector /= np.linalg.norm(vector)
+    return TextNode(
+        id_=f"n{i}",
+        text=f"chunk {i}",
+        embedding=vector.tolist(),
+        metadata={"chunk_index": i},
+        relationships={NodeRelationship.SOURCE: RelatedNodeInfo(node_id=ref_doc_id)},
+    )
+
+
+def _open(path):
+    return MmapFaissVectorStore(str(path), DIM, compact_segments=1000, background_compaction=False)
+
+
+def _query(store, i, top_k=3):
+    result = store.query(VectorStoreQuery(query_embedding=_node(i, "q").embedding, similarity_top_k=top_k))
+    return result.ids
+
+
+def test_tombstone_compact_and_reopen(tmp_path):
+    store = _open(tmp_path)
+    for doc in range(4):
+        store.add([_node(doc * 4 + j, f"doc{doc}") for j in range(4)])
+    assert store.segment_count == 4
+    assert store.count() == 16
+    assert _query(store, 5)[0] == "n5"
+
+    # 删除只留下墓碑，检索结果中不再出现
+    version = store.version
+    store.delete("doc1")
+    assert store.version == version + 1
+    assert store.count() == 12
+    assert store.ntotal == 16
+    assert not {"n4", "n5", "n6", "n7"} & set(_query(store, 5, top_k=10))
+
+    assert store.compact(major=True)
+    assert store.segment_count == 0
+    assert store.ntotal == 12
+    assert store.version == version + 1
+    assert _query(store, 9)[0] == "n9"
+    assert not {"n4", "n5", "n6", "n7"} & set(_query(store, 5, top_k=12))
+
+    # 压缩后的追加写入
+    store.add([_node(16, "doc4")])
+    store.close()
+
+    reopened = _open(tmp_path)
+    assert reopened.count() == 13
+    assert reopened.ntotal == 13
+    assert _query(reopened, 16)[0] == "n16"
+    assert [node.node_id for node in reopened.iter_nodes()] == [f"n{i}" for i in range(17) if not 4 <= i < 8]
+    reopened.close()
+
+
+def test_staged_batch_commit_and_abort(tmp_path):
+    store = _open(tmp_path)
+    batch = store.begin_batch()
+    batch.add([_node(0, "doc0"), _node(1, "doc0")])
+    batch.add([_node(2, "doc0")])
+    # 提交前对检索不可见
+    assert store.count() == 0
+    batch.commit(document={"filename": "a.pdf", "sha256": "s0", "ref_doc_id": "doc0", "chunk_count": 3})
+    assert store.count() == 3
+    assert [node.node_id for node in store.iter_nodes(vids=batch.vids)] == ["n0", "n1", "n2"]
+    assert store.get_document("a.pdf")["chunk_count"] == 3
+
+    aborted = store.begin_batch()
+    aborted.add([_node(3, "doc1")])
+    aborted.abort()
+    assert store.count() == 3
+    assert not os.path.exists(aborted.vectors_path)
+
+    # 替换：旧文档的节点与新节点在同一次提交中切换
+    replacement = store.begin_batch()
+    replacement.add([_node(4, "doc0b")])
+    replacement.commit(replace_ref_doc_ids=["doc0"])
+    assert [node.node_id for node in store.iter_nodes()] == ["n4"]
+    store.close()
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""请求合并：共享执行与取消语义"""
+import asyncio
+
+import pytest
+
+from app.services.single_flight import SingleFlight, StreamFlight
+
+
+def test_single_flight_shares_one_call():
+    async def main():
+        flight = SingleFlight()
+        calls = []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "answer"
+
+        results = await asyncio.gather(*(flight.do("q", work) for _ in range(5)))
+        assert [value for value, _ in results] == ["answer"] * 5
+        assert [shared for _, shared in results].count(False) == 1
+        assert len(calls) == 1
+        assert len(flight) == 0
+
+        # 执行完成后键被释放，后续调用重新执行
+        await flight.do("q", work)
+        assert len(calls) == 2
+
+    asyncio.run(main())
+
+
+def test_single_flight_caller_cancel_does_not_cancel_others():
+    async def main():
+        flight = SingleFlight()
+        started = asyncio.Event()
+
+        async def work():
+            started.set()
+            await asyncio.sleep(0.05)
+            return "answer"
+
+        first = asyncio.ensure_future(flight.do("q", work))
+        await started.wait()
+        second = asyncio.ensure_future(flight.do("q", work))
+        await asyncio.sleep(0)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        assert await second == ("answer", True)
+
+    asyncio.run(main())
+
+
+def test_single_flight_propagates_errors_and_forgets_key():
+    async def main():
+        flight = SingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0)
+            raise ValueError("boom")
+
+        results = await asyncio.gather(flight.do("q", fail), flight.do("q", fail), return_exceptions=True)
+        assert all(isinstance(r, ValueError) for r in results)
+        assert len(flight) == 0
+
+    asyncio.run(main())
+
+
+def _producer(events, produced, cancelled, delay=0.01):
+    async def stream():
+        try:
+            for event in events:
+                await asyncio.sleep(delay)
+                produced.append(event)
+                yield event
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    return stream
+
+
+def test_stream_flight_late_subscriber_replays_events():
+    async def main():
+        flight = StreamFlight()
+        produced, cancelled = [], []
+        make = _producer(["a", "b", "c"], produced, cancelled)
+
+        first, shared = flight.join("q", make)
+        assert not shared
+        it = first.__aiter__()
+        assert await it.__anext__() == "a"
+
+        second, shared = flight.join("q", make)
+        assert shared
+        assert [event async for event in second] == ["a", "b", "c"]
+        assert [event async for event in it] == ["b", "c"]
+        assert produced == ["a", "b", "c"]
+        assert len(flight) == 0
+
+    asyncio.run(main())
+
+
+def test_stream_flight_cancels_when_all_subscribers_leave():
+    async def main():
+        flight = StreamFlight()
+        produced, cancelled = [], []
+        make = _producer(["a", "b", "c", "d"], produced, cancelled, delay=0.02)
+
+        first, _ = flight.join("q", make)
+        second, _ = flight.join("q", make)
+        it1, it2 = first.__aiter__(), second.__aiter__()
+        assert await it1.__anext__() == "a"
+        assert await it2.__anext__() == "a"
+
+        # 一个订阅者断开，执行继续
+        await it1.aclose()
+        assert not cancelled
+        assert await it2.__anext__() == "b"
+
+        # 最后一个订阅者断开，执行被取消，键被释放
+        await it2.aclose()
+        await asyncio.sleep(0.05)
+        assert cancelled
+        assert len(produced) < 4
+        assert len(flight) == 0
+
+    asyncio.run(main())
+
+
+def test_stream_flight_never_iterated_does_not_start():
+    async def main():
+        flight = StreamFlight()
+        produced, cancelled = [], []
+        stream, _ = flight.join("q", _producer(["a"], produced, cancelled))
+        await asyncio.sleep(0.03)
+        assert produced == []
+        assert len(flight) == 0
+        await stream.aclose()
+
+    asyncio.run(main())